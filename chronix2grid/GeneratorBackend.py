@@ -7,15 +7,17 @@
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
 import os
+import time
 import warnings
 
 import pandas as pd
 
 from chronix2grid import constants
+from chronix2grid import tracing
 from chronix2grid import utils
 from chronix2grid.generation import generation_utils
 
-from chronix2grid.generation.dispatch import EconomicDispatch
+from chronix2grid.stage_scheduler import StageScheduler
 
 
 # MSG_PYPSA_DEPENDENCY = "Please install PypsaDispatchBackend dependency to launch chronix2grid with T mode. Chronix2grid stopped before dispatch computation. You should launch xithout letter T in mode"
@@ -54,6 +56,27 @@ class GeneratorBackend:
         A class that embeds a power loss generation backend such as :class:`chronix2grid.generation.loss.LossBackend`
     dispatch_backend_class
         A class that embeds a dispatch backend such as :class:`chronix2grid.generation.dispatch.DispatchBackend`
+    stage_workers: ``int``
+        Number of generation steps of a scenario that can run concurrently (L and R are independent).
+        Set it to 1 to run the steps one after the other
+    time_window: ``str`` or ``None``
+        If "week" or "month", load and renewable chronics of each scenario are generated by time windows,
+        thanks to the method ``run_by_windows`` of their backends
+    window_pool: :class:`multiprocessing.Pool` or ``None``
+        pool of processes in which time windows are generated and the windows of the dispatch are solved (if the
+        dispatch backend accepts a pool argument). If None, they are generated one after the other
+    stream: ``bool``
+        if True (with a time_window), load and renewable chronics are written window after window and not kept in
+        memory, so that memory does not depend on the length of the horizon. D and T, that need the chronics, cannot
+        be run
+    dtype: ``str``
+        floating point type of the generated chronics, "float64" (default) or "float32". It is given to the
+        generation steps as params["dtype"]
+    completed_stages: ``set``
+        stages already completed by a previous run (see :class:`chronix2grid.manifest.ScenarioManifest`).
+        Their chronics are not written again, L and R are only computed again if D or T have to be run
+    on_stage_completed: ``callable`` or ``None``
+        called with the name of each stage once it is completed
     """
     def __init__(self):
         from chronix2grid import default_backend  # lazy import to avoid circular references
@@ -63,7 +86,8 @@ class GeneratorBackend:
         self.loss_config_manager = default_backend.LOSS_GENERATION_CONFIG
         self.dispatch_config_manager = default_backend.DISPATCH_GENERATION_CONFIG
 
-        self.dispatcher_class = default_backend.DISPATCHER
+        # Resolved on first use, the default dispatcher imports pypsa (see property dispatcher_class)
+        self._dispatcher_class = None
 
         self.consumption_backend_class = default_backend.LOAD_GENERATION_BACKEND
         self.dispatch_backend_class = default_backend.DISPATCH_GENERATION_BACKEND
@@ -71,6 +95,27 @@ class GeneratorBackend:
         self.renewable_backend_class = default_backend.RENEWABLE_GENERATION_BACKEND
         self.loss_backend_class = default_backend.LOSS_GENERATION_BACKEND
 
+        self.stage_workers = constants.DEFAULT_STAGE_WORKERS
+        self.stage_durations = {}
+        self.stage_peak_memory = {}
+        self.time_window = None
+        self.window_pool = None
+        self.stream = False
+        self.dtype = constants.DEFAULT_DTYPE
+        self.completed_stages = set()
+        self.on_stage_completed = None
+
+    @property
+    def dispatcher_class(self):
+        if self._dispatcher_class is None:
+            from chronix2grid import default_backend
+            self._dispatcher_class = default_backend.DISPATCHER
+        return self._dispatcher_class
+
+    @dispatcher_class.setter
+    def dispatcher_class(self, dispatcher_class):
+        self._dispatcher_class = dispatcher_class
+
     # Call generation scripts n_scenario times with dedicated random seeds
     def run(self, case, n_scenarios, input_folder, output_folder, scen_names,
             time_params, mode='LRTK', scenario_id=None,
@@ -111,6 +156,9 @@ class GeneratorBackend:
         """
 
         utils.check_scenario(n_scenarios, scenario_id)
+        if self.stream and ('D' in mode or 'T' in mode):
+            raise ValueError('Loads and renewables generated in stream are not kept in memory, '
+                             'they cannot be used by the loss (D) and dispatch (T) generation')
 
         print('=====================================================================================================================================')
         print('============================================== CHRONICS GENERATION ==================================================================')
@@ -127,42 +175,9 @@ class GeneratorBackend:
             seeds_for_disp = [seed_for_disp]
 
         # dispatch_input_folder, dispatch_input_folder_case, dispatch_output_folder = gu.make_generation_input_output_directories(input_folder, case, year, output_folder)
-        general_config_manager = self.general_config_manager(
-            name="Global Generation",
-            root_directory=input_folder,
-            input_directories=dict(case=case),
-            required_input_files=dict(case=['params.json']),
-            output_directory=output_folder
-        )
-        general_config_manager.validate_configuration()
-        params = general_config_manager.read_configuration()
-
-        params.update(time_params)
-        params = generation_utils.updated_time_parameters_with_timestep(params, params['dt'])
-
-        load_config_manager = self.load_config_manager(
-            name="Loads Generation",
-            root_directory=input_folder,
-            input_directories=dict(case=case, patterns='patterns'),
-            required_input_files=dict(case=['loads_charac.csv', 'params_load.json'],
-                                      patterns=['load_weekly_pattern.csv']),
-            output_directory=output_folder
-        )
-        load_config_manager.validate_configuration()
-        params_load, loads_charac = load_config_manager.read_configuration()
-        params_load.update(params)
-
-        res_config_manager = self.res_config_manager(
-            name="Renewables Generation",
-            root_directory=input_folder,
-            input_directories=dict(case=case, patterns='patterns'),
-            required_input_files=dict(case=['prods_charac.csv', 'params_res.json'],
-                                      patterns=['solar_pattern.npy']),
-            output_directory=output_folder
-        )
-        params_res, prods_charac = res_config_manager.read_configuration()
-        params_res.update(params)
-
+        (params, params_load, loads_charac, load_config_manager,
+         params_res, prods_charac, res_config_manager) = self._read_configuration(case, input_folder, output_folder,
+                                                                                  time_params)
 
         grid_folder = os.path.join(input_folder, case)
 
@@ -181,47 +196,206 @@ class GeneratorBackend:
             scenario_folder_path = os.path.join(output_folder, scenario_name)
 
             print("================ Generating " + scenario_name + " ================")
+            self._run_stages(case, mode, input_folder, output_folder, grid_folder, scenario_name, scenario_folder_path,
+                             seed_load, seed_res, seed_disp, params, params_load, loads_charac, load_config_manager,
+                             params_res, prods_charac, res_config_manager, loss)
+            print('\n')
+        return params, loads_charac, prods_charac
+
+    def _read_configuration(self, case, input_folder, output_folder, time_params):
+        """
+        Reads the general, load and renewable parameters of the case
+
+        Returns
+        -------
+        params: ``dict``
+        params_load: ``dict``
+        loads_charac: :class:`pandas.DataFrame`
+        load_config_manager: :class:`chronix2grid.config.ConfigManager`
+        params_res: ``dict``
+        prods_charac: :class:`pandas.DataFrame`
+        res_config_manager: :class:`chronix2grid.config.ConfigManager`
+        """
+        with tracing.span('config read'):
+            general_config_manager = self.general_config_manager(
+                name="Global Generation",
+                root_directory=input_folder,
+                input_directories=dict(case=case),
+                required_input_files=dict(case=['params.json']),
+                output_directory=output_folder
+            )
+            general_config_manager.validate_configuration()
+            params = general_config_manager.read_configuration()
+
+            params.update(time_params)
+            params = generation_utils.updated_time_parameters_with_timestep(params, params['dt'])
+            params['dtype'] = self.dtype
+
+            load_config_manager = self.load_config_manager(
+                name="Loads Generation",
+                root_directory=input_folder,
+                input_directories=dict(case=case, patterns='patterns'),
+                required_input_files=dict(case=['loads_charac.csv', 'params_load.json'],
+                                          patterns=['load_weekly_pattern.csv']),
+                output_directory=output_folder
+            )
+            load_config_manager.validate_configuration()
+            params_load, loads_charac = load_config_manager.read_configuration()
+            params_load.update(params)
+
+            res_config_manager = self.res_config_manager(
+                name="Renewables Generation",
+                root_directory=input_folder,
+                input_directories=dict(case=case, patterns='patterns'),
+                required_input_files=dict(case=['prods_charac.csv', 'params_res.json'],
+                                          patterns=['solar_pattern.npy']),
+                output_directory=output_folder
+            )
+            params_res, prods_charac = res_config_manager.read_configuration()
+            params_res.update(params)
+        return params, params_load, loads_charac, load_config_manager, params_res, prods_charac, res_config_manager
+
+    def run_ensemble(self, case, input_folder, output_folder, scen_names, time_params, mode, scenario_ids,
+                     seeds_for_loads, seeds_for_res, max_batch_bytes=constants.ENSEMBLE_MAX_BATCH_BYTES):
+        """
+        Generates the loads (L) and renewables (R) of several scenarios together, with the ``run_ensemble`` method
+        of their backends: the configuration is read once, and the scenario-independent parts of the models are
+        computed once for all of them. Each scenario is the same as with :meth:`run` and its seeds.
+
+        Parameters
+        ----------
+        scenario_ids: ``list``
+            ids of the scenarios, given to scen_names
+        seeds_for_loads: ``list``
+            seed of the loads of each scenario
+        seeds_for_res: ``list``
+            seed of the renewables of each scenario
+        max_batch_bytes: ``int``
+            memory allowed to the chronics of the scenarios computed together
+
+        Returns
+        -------
+        params: ``dict``
+        loads_charac: :class:`pandas.DataFrame`
+        prods_charac: :class:`pandas.DataFrame`
+        """
+        if 'D' in mode or 'T' in mode:
+            raise ValueError('The loss (D) and dispatch (T) generation need the loads and renewables of one scenario, '
+                             'they cannot follow an ensemble generation')
+        if self.time_window is not None:
+            raise ValueError('An ensemble is generated on the whole period, not by time windows')
+        (params, params_load, loads_charac, load_config_manager,
+         params_res, prods_charac, res_config_manager) = self._read_configuration(case, input_folder, output_folder,
+                                                                                  time_params)
+        out_paths = [os.path.join(output_folder, scen_names(scenario_id)) for scenario_id in scenario_ids]
+        self.stage_durations = {}
+        if 'L' in mode:
+            start = time.perf_counter()
+            with tracing.span('stage', stage='L', n_scenarios=len(scenario_ids)):
+                generator_loads = self.consumption_backend_class(None, None, params_load, loads_charac,
+                                                                 load_config_manager, write_results=True)
+                generator_loads.run_ensemble(seeds_for_loads, out_paths, max_batch_bytes=max_batch_bytes)
+            self.stage_durations['L'] = time.perf_counter() - start
+            params.update(params_load)
+        if 'R' in mode:
+            start = time.perf_counter()
+            with tracing.span('stage', stage='R', n_scenarios=len(scenario_ids)):
+                generator_enr = self.renewable_backend_class(None, None, params_res, prods_charac,
+                                                             res_config_manager, write_results=True)
+                generator_enr.run_ensemble(seeds_for_res, out_paths, max_batch_bytes=max_batch_bytes)
+            self.stage_durations['R'] = time.perf_counter() - start
+            params.update(params_res)
+        return params, loads_charac, prods_charac
+
+    def _run_stages(self, case, mode, input_folder, output_folder, grid_folder, scenario_name, scenario_folder_path,
+                    seed_load, seed_res, seed_disp, params, params_load, loads_charac, load_config_manager,
+                    params_res, prods_charac, res_config_manager, loss):
+        """
+        Runs the generation stages of one scenario thanks to a :class:`chronix2grid.stage_scheduler.StageScheduler`.
+        L and R do not share any data and have their own seeds, so they can run concurrently.
+        D and T start once L and R are done.
+
+        Returns
+        -------
+        results: ``dict``
+            results of each stage that has been run, by stage name
+        """
+        def update_params():
+            # Same update order as a sequential run, whatever the order in which L and R have finished
             if 'L' in mode:
-                load, load_forecasted = self.do_l(scenario_folder_path, seed_load, params_load, loads_charac, load_config_manager)
                 params.update(params_load)
             if 'R' in mode:
-                prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted = self.do_r(scenario_folder_path, seed_res, params_res,
-                                                                                               prods_charac,
-                                                                                               res_config_manager)
                 params.update(params_res)
-            if 'D' in mode:
-                loss_config_manager = self.loss_config_manager(
-                    name="Loss",
-                    root_directory=input_folder,
-                    output_directory=output_folder,
-                    input_directories=dict(params=case),
-                    required_input_files=dict(params=['params_loss.json'])
-                )
-
-                self.do_d(input_folder, scenario_folder_path,
-                                     load, prod_solar, prod_wind,
-                                     params, loss_config_manager)
-            if 'T' in mode:
-                if self.dispatch_backend_class is None:
-                    warnings.warn(MSG_NO_DISPATCH_BACKEND, UserWarning)
-                else:
-                    dispath_config_manager = self.dispatch_config_manager(
-                        name="Dispatch",
-                        root_directory=input_folder,
-                        output_directory=output_folder,
-                        input_directories=dict(params=case),
-                        required_input_files=dict(params=['params_opf.json'])
-                    )
-                    dispath_config_manager.validate_configuration()
-                    params_opf = dispath_config_manager.read_configuration()
-
-                    dispatch_results = self.do_t(input_folder, scenario_name, load, prod_solar, prod_wind,
-                                                 grid_folder, scenario_folder_path, seed_disp, params, params_opf, loss)
 
-            print('\n')
-        return params, loads_charac, prods_charac
-
-    def do_l(self, scenario_folder_path, seed_load, params, loads_charac, load_config_manager):
+        # Stages of a previous run are skipped, except L and R when their results are needed by D or T
+        stages_to_run = [name for name in 'LRDT' if name in mode and name not in self.completed_stages]
+        inputs_needed = 'D' in stages_to_run or 'T' in stages_to_run
+        write_results = dict(L='L' in stages_to_run, R='R' in stages_to_run)
+
+        def stage_l(results):
+            return self.do_l(scenario_folder_path, seed_load, params_load, loads_charac, load_config_manager,
+                             write_results=write_results['L'])
+
+        def stage_r(results):
+            return self.do_r(scenario_folder_path, seed_res, params_res, prods_charac, res_config_manager,
+                             write_results=write_results['R'])
+
+        def stage_d(results):
+            update_params()
+            load, _ = results['L']
+            prod_solar, _, prod_wind, _ = results['R']
+            loss_config_manager = self.loss_config_manager(
+                name="Loss",
+                root_directory=input_folder,
+                output_directory=output_folder,
+                input_directories=dict(params=case),
+                required_input_files=dict(params=['params_loss.json'])
+            )
+            return self.do_d(input_folder, scenario_folder_path,
+                             load, prod_solar, prod_wind,
+                             params, loss_config_manager)
+
+        def stage_t(results):
+            update_params()
+            if self.dispatch_backend_class is None:
+                warnings.warn(MSG_NO_DISPATCH_BACKEND, UserWarning)
+                return None
+            load, _ = results['L']
+            prod_solar, _, prod_wind, _ = results['R']
+            dispath_config_manager = self.dispatch_config_manager(
+                name="Dispatch",
+                root_directory=input_folder,
+                output_directory=output_folder,
+                input_directories=dict(params=case),
+                required_input_files=dict(params=['params_opf.json'])
+            )
+            dispath_config_manager.validate_configuration()
+            params_opf = dispath_config_manager.read_configuration()
+
+            return self.do_t(input_folder, scenario_name, load, prod_solar, prod_wind,
+                             grid_folder, scenario_folder_path, seed_disp, params, params_opf, loss)
+
+        def notify_completion(name, stage):
+            def run_stage(results):
+                result = stage(results)
+                if self.on_stage_completed is not None:
+                    self.on_stage_completed(name)
+                return result
+            return run_stage
+
+        scheduler = StageScheduler(max_workers=self.stage_workers)
+        for name, stage in dict(L=stage_l, R=stage_r, D=stage_d, T=stage_t).items():
+            if name in stages_to_run:
+                scheduler.add_stage(name, notify_completion(name, stage))
+            elif name in mode and name in 'LR' and inputs_needed:
+                scheduler.add_stage(name, stage)
+        results = scheduler.run()
+        update_params()
+        self.stage_durations = dict(scheduler.durations)
+        self.stage_peak_memory = dict(scheduler.peak_memory)
+        return results
+
+    def do_l(self, scenario_folder_path, seed_load, params, loads_charac, load_config_manager, write_results=True):
         """
         Generates load chronics thanks to the backend in ``self.consumption_backend_class``
 
@@ -232,6 +406,7 @@ class GeneratorBackend:
         params: ``dict``
         loads_charac: :class:`pandas.DataFrame`
         load_config_manager: :class:`chronix2grid.config.ConfigManager`
+        write_results: ``bool``
 
         Returns
         -------
@@ -241,11 +416,15 @@ class GeneratorBackend:
             generated forecasted loads chronics (currently loads chronics with gaussian noise)
         """
         generator_loads = self.consumption_backend_class(scenario_folder_path, seed_load, params, loads_charac, load_config_manager,
-                                                         write_results=True)
-        load, load_forecasted = generator_loads.run()
+                                                         write_results=write_results)
+        if self.time_window is not None:
+            load, load_forecasted = generator_loads.run_by_windows(self.time_window, self.window_pool,
+                                                                   stream=self.stream)
+        else:
+            load, load_forecasted = generator_loads.run()
         return load, load_forecasted
 
-    def do_r(self, scenario_folder_path, seed_res, params, prods_charac, res_config_manager):
+    def do_r(self, scenario_folder_path, seed_res, params, prods_charac, res_config_manager, write_results=True):
         """
         Generates load chronics thanks to the backend in ``self.renewable_backend_class``
 
@@ -256,6 +435,7 @@ class GeneratorBackend:
         params: ``dict``
         prods_charac: :class:`pandas.DataFrame`
         res_config_manager: :class:`chronix2grid.config.ConfigManager`
+        write_results: ``bool``
 
         Returns
         -------
@@ -270,9 +450,13 @@ class GeneratorBackend:
         """
         generator_enr = self.renewable_backend_class(scenario_folder_path, seed_res, params,
                                                      prods_charac,
-                                                     res_config_manager, write_results=True)
+                                                     res_config_manager, write_results=write_results)
 
-        prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted = generator_enr.run()
+        if self.time_window is not None:
+            prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted = generator_enr.run_by_windows(
+                self.time_window, self.window_pool, stream=self.stream)
+        else:
+            prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted = generator_enr.run()
         return prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted
 
     def do_d(self, input_folder, scenario_folder_path,
@@ -333,11 +517,18 @@ class GeneratorBackend:
         res_names = dict(wind=prod_wind.columns, solar=prod_solar.columns)
         grid_path = os.path.join(grid_folder, constants.GRID_FILENAME)
         # grid_path = grid_folder
+        # lazy import: the dispatch modules are only needed for T
+        from chronix2grid.generation.dispatch import EconomicDispatch
         dispatcher = EconomicDispatch.init_dispatcher_from_config_dataframe(grid_path, input_folder,self.dispatcher_class, params_opf)
         dispatcher.chronix_scenario = EconomicDispatch.ChroniXScenario(load, prods, res_names,
-                                                                       scenario_name, loss)
+                                                                       scenario_name, loss,
+                                                                       dtype=generation_utils.generation_dtype(params))
 
+        # The windows of the dispatch share the pool of the time windows of L and R, if the backend accepts it
+        pool_kwargs = {}
+        if self.window_pool is not None and utils.accepts_keyword(self.dispatch_backend_class, 'pool'):
+            pool_kwargs['pool'] = self.window_pool
         generator_dispatch = self.dispatch_backend_class(dispatcher, scenario_folder_path,
-                                                 grid_folder, seed_disp, params, params_opf)
+                                                 grid_folder, seed_disp, params, params_opf, **pool_kwargs)
         dispatch_results = generator_dispatch.run()
         return dispatch_results
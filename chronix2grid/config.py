@@ -13,6 +13,9 @@ import os
 import numpy as np
 import pandas as pd
 
+from chronix2grid import tracing
+from chronix2grid.generation import pattern_cache
+
 
 class ConfigManager(ABC):
     """
@@ -178,6 +181,7 @@ class LoadsConfigManager(ConfigManager):
         * *dy_corr* - y granularity of coarse grid for spatially correlated noise
         * *temperature_corr* - noise level for spatially correlated noise
         * *std_temperature_noise* - noise level for temporally autocorrelated noise
+        * *sparse_noise* - optional, if 1 the noise is only drawn on the cells of the coarse grid used by the loads
 
     Returns
     -------
@@ -217,6 +221,7 @@ class LoadsConfigManager(ConfigManager):
 
         return params, loads_charac
 
+    @tracing.traced('pattern read')
     def read_specific(self):
         """
         Reads data frame with loads characteristics
@@ -225,7 +230,7 @@ class LoadsConfigManager(ConfigManager):
         -------
         loads_charac: :class:`pandas.DataFrame`
         """
-        load_weekly_pattern = pd.read_csv(
+        load_weekly_pattern = pattern_cache.read_load_weekly_pattern(
             os.path.join(self.root_directory, self.input_directories['patterns'],
                          'load_weekly_pattern.csv'))
         return load_weekly_pattern
@@ -248,6 +253,7 @@ class ResConfigManager(ConfigManager):
             * *std_solar_noise*, *std_short_wind_noise*, *std_medium_wind_noise*, *std_long_wind_noise* - noise levels for temporally autocorrelated noises
             * *smoothdist* - independent noise level
             * *year_solar_pattern* - year of provided solar pattern
+            * *sparse_noise* - optional, if 1 the noises are only drawn on the cells of the coarse grid used by the generators
 
         Returns
         -------
@@ -281,6 +287,7 @@ class ResConfigManager(ConfigManager):
 
         return params, prods_charac
 
+    @tracing.traced('pattern read')
     def read_specific(self):
         """
         Reads data frame with generator characteristics
@@ -289,7 +296,7 @@ class ResConfigManager(ConfigManager):
         -------
         prods_charac: :class:`pandas.DataFrame`
         """
-        solar_pattern = np.load(
+        solar_pattern = pattern_cache.read_solar_pattern(
             os.path.join(self.root_directory, self.input_directories['patterns'],
                          'solar_pattern.npy'))
         return solar_pattern
@@ -318,6 +325,8 @@ class DispatchConfigManager(ConfigManager):
             * *solver_name* - name of solver, that you should have installed in your environment and added in your environment variables.
             * *hydro_ramp_reduction_factor* - optional factor which will divide max ramp up and down to all hydro generators
             * *losses_pct**- if D mode is deactivate, losses are estimated as a percentage of load.
+            * *overlap_opf_min* - optional duration in minutes (0 by default) by which each window of the OPF is extended at its start, on the end of the previous window. The overlap is solved but not kept, so that the window starts from realistic setpoints
+            * *ramp_coupling_opf* - optional, False by default. If True, the windows of the OPF that break a ramp at their start, from the last setpoints of the previous window, are solved again with their first snapshot within the ramps, and when feasible their last snapshot within the ramps of the next window
 
         Optional parameters can be set for grid2op simulation of loss as a final step.
         The production is updated on a slack generator and warnings or errors are returned if this update violates generator constraints
@@ -376,6 +385,10 @@ class DispatchConfigManager(ConfigManager):
         else:
             params_opf["hydro_ramp_reduction_factor"] = float(params_opf["hydro_ramp_reduction_factor"])
 
+        # Rolling horizon
+        params_opf["overlap_opf_min"] = int(params_opf.get("overlap_opf_min", 0))
+        params_opf.setdefault("ramp_coupling_opf", False)
+
         # Slack temporary correction
         for key in ["slack_p_max_reduction", "slack_ramp_max_reduction"]:
             if key not in list(params_opf.keys()):
@@ -430,3 +443,26 @@ class LossConfigManager(ConfigManager):
         except KeyError:
             raise KeyError('The loss_pattern field of params_loss.json is missing.')
         return params_loss
+
+
+class SurrogateLossConfigManager(LossConfigManager):
+    """
+            Checks parameters for :class:`chronix2grid.generation.loss.SurrogateLossBackend.SurrogateLossBackend`
+                * *loss_model* - path of the json file of the loss model, relative to the case folder
+
+            Returns
+            -------
+            params_loss: ``dict``
+                dictionary of parameters
+            """
+    def read_configuration(self):
+        self.validate_configuration()
+        params_filepath = os.path.join(
+            self.root_directory,
+            self.input_directories['params'],
+            'params_loss.json')
+        with open(params_filepath, 'r') as loss_param_json:
+            params_loss = json.load(loss_param_json)
+        if not params_loss.get('loss_model'):
+            raise KeyError('The loss_model field of params_loss.json is missing.')
+        return params_loss
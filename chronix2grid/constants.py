@@ -33,6 +33,21 @@ SCENARIO_FOLDER_BASE_NAME = 'Scenario'
 
 SEEDS_FILE_NAME = 'seeds_info.json'
 
+MANIFEST_FILE_NAME = 'manifest.json'
+
+DISPATCH_FAILED_FILE_NAME = 'DISPATCH_FAILED'
+
+# Folders written in the input folders during a run, not part of the configuration hashed for --resume
+CONFIG_HASH_IGNORED_FOLDERS = ['chronics', '__pycache__']
+
+ERRORS_FILE_NAME = 'errors.json'
+
+METRICS_FILE_NAME = 'run_metrics.json'
+
+PROMETHEUS_METRICS_FILE_NAME = 'run_metrics.prom'
+TRACE_FILE_NAME = 'trace.json'
+PROFILE_FILE_EXTENSION = '.pstats'
+
 FLOATING_POINT_PRECISION_FORMAT = '%.1f'
 
 TIME_STEP_FILE_NAME = 'time_interval.info'
@@ -40,3 +55,38 @@ TIME_STEP_FILE_NAME = 'time_interval.info'
 REFERENCE_ZONE = 'France'
 
 GRID_FILENAME = 'grid.json'
+
+DEFAULT_STAGE_WORKERS = 2
+
+DEFAULT_MAX_TASKS_PER_CHILD = 10
+
+# Seconds given to a scenario after its timeout to stop by itself, before its process is terminated (at most the
+# timeout itself)
+SCENARIO_TIMEOUT_GRACE = 30
+
+# Seconds between two checks of the processes of a scenario pool, to find the scenarios of the processes that have died
+# and the scenarios past their deadline
+SCENARIO_WATCH_INTERVAL = 1
+
+PATTERN_CACHE_MAX_ENTRIES = 16
+
+# Interpolated weeks of load pattern kept by process, about 1 MB each for a year at 5 minutes
+LOAD_PATTERN_CACHE_MAX_ENTRIES = 64
+
+# Interpolated solar patterns kept by process, one by period or time window
+SOLAR_PATTERN_CACHE_MAX_ENTRIES = 64
+
+# Share of the AC simulations held out to compute the validation error of a surrogate loss model
+LOSS_MODEL_VALIDATION_SHARE = 0.2
+
+# Memory allowed to the chronics of the scenarios of an ensemble computed together
+ENSEMBLE_MAX_BATCH_BYTES = 2 ** 30
+
+TIME_WINDOWS = ['week', 'month']
+
+# Windows written one after the other by --stream, if --time-window is not given
+DEFAULT_STREAM_TIME_WINDOW = 'month'
+
+# Floating point types of the generated chronics. Chronics are written with FLOATING_POINT_PRECISION_FORMAT anyway
+DTYPES = ['float64', 'float32']
+DEFAULT_DTYPE = 'float64'
@@ -29,17 +29,31 @@ RENEWABLE_GENERATION_CONFIG = ResConfigManager #ResConfigManagerGan #ResConfigMa
 RENEWABLE_GENERATION_BACKEND = RenewableBackend #RenewableBackendGAN # RenewableBackend
 
 #### LOSS (D) ####
-LOSS_GENERATION_CONFIG = LossConfigManager
-LOSS_GENERATION_BACKEND = LossBackend
+# from chronix2grid.config import SurrogateLossConfigManager
+LOSS_GENERATION_CONFIG = LossConfigManager #SurrogateLossConfigManager
+# from chronix2grid.generation.loss.SurrogateLossBackend import SurrogateLossBackend
+LOSS_GENERATION_BACKEND = LossBackend #SurrogateLossBackend
 
 #### DISPATCH - HYDRO, THERMAL, NUCLEAR (T) ####
 DISPATCH_GENERATION_CONFIG = DispatchConfigManager
 HYDRO_GENERATION_BACKEND = None
 
-from chronix2grid.generation.dispatch.PypsaDispatchBackend import PypsaDispatcher
-DISPATCHER = PypsaDispatcher
+# The dispatcher relies on pypsa: it is only imported when it is used, see __getattr__ below.
+# It can still be replaced here by any class, e.g. DISPATCHER = MyDispatcher
+# from chronix2grid.generation.dispatch.HighsDispatchBackend import HighsDispatcher
+# DISPATCHER = HighsDispatcher # single bus LP solved in memory by HiGHS, needs neither pypsa nor an LP solver
 DISPATCH_GENERATION_BACKEND = DispatchBackend
 
 #### KPI (K) ####
 RENEWABLE_NINJA_REFERENCE_FOLDER = 'renewable_ninja'
 GAN_TRAINING_SET_REFERENCE_FOLDER = 'GAN_training_data'
+
+
+def __getattr__(name):
+    # Backends with heavy dependencies, imported on first access (PEP 562) so that
+    # generating loads or renewables only does not import pypsa
+    if name == 'DISPATCHER':
+        from chronix2grid.generation.dispatch.PypsaDispatchBackend import PypsaDispatcher
+        globals()['DISPATCHER'] = PypsaDispatcher
+        return PypsaDispatcher
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,449 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""Economic dispatch on a single bus written directly as a sparse linear program and solved in memory by HiGHS
+(scipy.optimize.linprog), without pypsa nor LP files. The problem is the one of
+:class:`chronix2grid.generation.dispatch.PypsaDispatchBackend.PypsaDispatcher`: generators with pmin/pmax (hydro guide
+curves, curtailable aggregated solar and wind) and ramp limits, balancing the load at each snapshot at minimal cost"""
+
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import linprog
+
+from chronix2grid.generation._dispatch._PypsaDispatchBackend._EDispatch_L2RPN2020.utils import (
+    adjust_generators, get_window_positions, get_windows, interpolate_dispatch, preprocess_input_data,
+    reconcile_window_boundaries, update_gen_constrains, update_params)
+from chronix2grid.generation.dispatch.EconomicDispatch import Dispatcher, DispatchResults
+from chronix2grid.generation.dispatch.utils import RampMode
+from chronix2grid.generation.generation_utils import map_windows
+from chronix2grid.run_metrics import record_duration
+from chronix2grid import tracing
+
+GENERATOR_COLUMNS = ['p_nom', 'carrier', 'marginal_cost', 'ramp_limit_up', 'ramp_limit_down']
+
+# Status of scipy.optimize.linprog, named as the termination conditions of pypsa
+TERMINATION_CONDITIONS = {0: 'optimal', 1: 'maxIterations', 2: 'infeasible', 3: 'unbounded', 4: 'other'}
+
+
+class HighsDispatcher(Dispatcher):
+    """
+    Implements the abstract methods of *Dispatcher* with a linear program solved by HiGHS
+
+    Attributes
+    ----------
+    generators: :class:`pandas.DataFrame`
+        dispatchable generators, plus agg_solar and agg_wind, with the columns of pypsa generators used by the dispatch:
+        p_nom, carrier, marginal_cost, ramp_limit_up and ramp_limit_down (in per unit of p_nom by 5 minutes, NaN if
+        there is no ramp limit)
+    loads: :class:`pandas.DataFrame`
+        the single aggregated load of the bus
+    """
+
+    # Same corrections as PypsaDispatcher, so that both dispatchers solve the same problem
+    PmaxCorrectingFactor = 1
+    RampCorrectingFactor = 0.1
+
+    def __init__(self):
+        super().__init__()
+        self.generators = pd.DataFrame(columns=GENERATOR_COLUMNS)
+        self.loads = pd.DataFrame(index=['agg_load'])
+        self._env = None  # The grid2op environment when instanciated with from_gri2dop_env
+        self._df = None
+        self._chronix_scenario = None
+        self._simplified_chronix_scenario = None
+        self._has_results = False
+        self._has_simplified_results = False
+        self._hydro_file_path = None
+
+        self._pmax_solar = None
+        self._pmax_wind = None
+        # Constraint matrices and costs by window length, reused as long as the generators do not change (see
+        # DispatchModel)
+        self._models = {}
+        self._models_generators = None
+
+    def add_generator(self, name, p_nom, carrier, marginal_cost, ramp_limit_up=np.nan, ramp_limit_down=np.nan):
+        self.generators.loc[name] = [p_nom, carrier, marginal_cost, ramp_limit_up, ramp_limit_down]
+
+    def _add_generators(self, names, types, pmaxs, ramps_up, ramps_down, costs):
+        carrier_types_to_exclude = ['wind', 'solar']
+        for generator, gen_type, p_max, ramp_up, ramp_down, cost in zip(names, types, pmaxs, ramps_up,
+                                                                         ramps_down, costs):
+            if gen_type not in carrier_types_to_exclude:
+                self.add_generator(generator, p_max - self.PmaxCorrectingFactor, gen_type, cost,
+                                   ramp_limit_up=(ramp_up - self.RampCorrectingFactor) / p_max,
+                                   ramp_limit_down=(ramp_down - self.RampCorrectingFactor) / p_max)
+
+        # add total wind and solar (for curtailment)
+        types = np.asarray(types)
+        pmaxs = np.asarray(pmaxs, dtype=float)
+        self._pmax_solar = pmaxs[types == 'solar'].sum()
+        self.add_generator('agg_solar', self._pmax_solar, 'solar', 0.)
+        self._pmax_wind = pmaxs[types == 'wind'].sum()
+        # we prefer to curtail the wind if we have the choice, because solar should be distributed on the grid
+        self.add_generator('agg_wind', self._pmax_wind, 'wind', 0.1)
+        self.generators = self.generators.astype(dict(p_nom=float, marginal_cost=float, ramp_limit_up=float,
+                                                      ramp_limit_down=float))
+
+    @classmethod
+    def from_gri2op_env(cls, grid2op_env):
+        """
+        Implements the abstract method of *Dispatcher*
+
+        Parameters
+        ----------
+        grid2op_env
+
+        Returns
+        -------
+        dispatcher: :class:`HighsDispatcher`
+        """
+        dispatcher = cls()
+        dispatcher._env = grid2op_env
+        dispatcher._add_generators(grid2op_env.name_gen, grid2op_env.gen_type, grid2op_env.gen_pmax,
+                                   grid2op_env.gen_max_ramp_up, grid2op_env.gen_max_ramp_down,
+                                   grid2op_env.gen_cost_per_MW)
+        return dispatcher
+
+    @classmethod
+    def from_dataframe(cls, env_df):
+        """
+        Implements the abstract method of *Dispatcher*
+
+        Parameters
+        ----------
+        env_df: :class:`pandas.DataFrame`
+            generators with columns name, type, pmax, max_ramp_up, max_ramp_down and cost_per_mw
+
+        Returns
+        -------
+        dispatcher: :class:`HighsDispatcher`
+        """
+        dispatcher = cls()
+        dispatcher._df = env_df
+        dispatcher._add_generators(env_df['name'], env_df['type'], env_df['pmax'], env_df['max_ramp_up'],
+                                   env_df['max_ramp_down'], env_df['cost_per_mw'])
+        return dispatcher
+
+    def run(self,
+            load,
+            total_solar,
+            total_wind,
+            params,
+            gen_constraints=None,
+            ramp_mode=RampMode.hard,
+            by_carrier=False,
+            gen_min_pu_t=None,
+            gen_max_pu_t=None,
+            pool=None,
+            **kwargs):
+        """
+        Implements the abstract method of *Dispatcher*. The options of pypsa (such as pyomo or solver_name) are ignored.
+        The windows of the dispatch are solved in pool (:class:`multiprocessing.Pool`) if one is given
+
+        Returns
+        -------
+        results: :class:`chronix2grid.generation.dispatch.EconomicDispatch.DispatchResults`
+        """
+        if total_solar is not None:
+            total_solar = total_solar / self._pmax_solar
+        if total_wind is not None:
+            total_wind = total_wind / self._pmax_wind
+        dispatcher = self if not by_carrier else self.simplify_net()
+        prods_dispatch, terminal_conditions, marginal_prices = dispatcher.run_dispatch(
+            load, total_solar, total_wind, params, gen_constraints, ramp_mode,
+            gen_min_pu_t=gen_min_pu_t, gen_max_pu_t=gen_max_pu_t, pool=pool)
+        if prods_dispatch is None or marginal_prices is None:
+            return None
+
+        if by_carrier:
+            self._simplified_chronix_scenario = self._chronix_scenario.simplify_chronix()
+            self._simplified_chronix_scenario.prods_dispatch = prods_dispatch
+            self._simplified_chronix_scenario.marginal_prices = marginal_prices
+            results = self._simplified_chronix_scenario
+            self._has_simplified_results = True
+            self._has_results = False
+        else:
+            self._chronix_scenario.prods_dispatch = prods_dispatch
+            self._chronix_scenario.marginal_prices = marginal_prices
+            results = self._chronix_scenario
+            self._has_results = True
+            self._has_simplified_results = False
+        return DispatchResults(chronix=results, terminal_conditions=terminal_conditions)
+
+    def run_dispatch(self, load, total_solar, total_wind, params, gen_constraints=None, ramp_mode=RampMode.hard,
+                     gen_min_pu_t=None, gen_max_pu_t=None, pool=None):
+        """
+        Dispatch by time window (see "mode_opf" in params), as the main_run_disptach function of pypsa dispatch. The
+        windows are solved in pool if one is given
+
+        Returns
+        -------
+        prod_p: :class:`pandas.DataFrame` or ``None``
+            production of each generator at each time step, None if the dispatch of a window failed
+        termination_conditions: ``list``
+            termination condition of each window
+        marginal_prices: :class:`pandas.Series` or ``None``
+            marginal cost of the most expensive producing generator at each time step
+        """
+        gen_constraints = update_gen_constrains({} if gen_constraints is None else gen_constraints)
+        params = update_params(load.shape[0], load.index[0], params)
+        load_, gen_constraints_ = preprocess_input_data(load, gen_constraints, params)
+        gen_max_pu, gen_min_pu = gen_constraints_['p_max_pu'], gen_constraints_['p_min_pu']
+
+        # Generators of the linear program: ramps filtered by ramp_mode and adapted to step_opf_min
+        generators = self.generators.copy()
+        removed_ramps = dict(medium=['thermal'], easy=['hydro', 'thermal'], none=['nuclear', 'hydro', 'thermal'])
+        generators.loc[generators.carrier.isin(removed_ramps.get(ramp_mode.name, [])),
+                       ['ramp_limit_up', 'ramp_limit_down']] = np.nan
+        generators[['ramp_limit_up', 'ramp_limit_down']] *= params['step_opf_min'] / 5
+
+        slack_name = str(params['slack_name']) if 'slack_name' in params else None
+        slack_pmin = slack_pmax = None
+        if slack_name is not None and 'slack_pmin' in params:
+            slack_pmin = float(params['slack_pmin']) / float(generators.loc[slack_name, 'p_nom'])
+        if slack_name is not None and 'slack_pmax' in params:
+            slack_pmax = float(params['slack_pmax']) / float(generators.loc[slack_name, 'p_nom'])
+        generators = adjust_generators(generators, params, slack_name)
+        self.use_generators(generators)
+
+        # Per unit bounds of each generator at each time step
+        snapshots = load_.index
+        p_max_pu = pd.DataFrame(1., index=snapshots, columns=generators.index)
+        p_min_pu = pd.DataFrame(0., index=snapshots, columns=generators.index)
+        known = [name for name in gen_max_pu if name in p_max_pu]
+        p_max_pu[known] = gen_max_pu[known]
+        known = [name for name in gen_min_pu if name in p_min_pu]
+        p_min_pu[known] = gen_min_pu[known]
+        # solar and wind at the snapshots kept by step_opf_min (agg_solar and agg_wind, or solar and wind by carrier)
+        resampled = params['snapshots'].get_indexer(snapshots)
+        for carrier, total in [('solar', total_solar), ('wind', total_wind)]:
+            for name in generators.index[generators.carrier == carrier]:
+                p_max_pu[name] = 0. if total is None else np.asarray(total)[resampled]
+        if slack_pmin is not None:
+            p_min_pu[slack_name] = slack_pmin
+        if slack_pmax is not None:
+            p_max_pu[slack_name] = slack_pmax
+        # additional constraints, used for example when splitting the loss
+        for name, max_val in (gen_max_pu_t or {}).items():
+            p_max_pu[name] = np.minimum(p_max_pu[name].values, max_val)
+        for name, min_val in (gen_min_pu_t or {}).items():
+            p_min_pu[name] = np.maximum(p_min_pu[name].values, min_val)
+
+        windows = [snaps for _, _, snaps in get_windows(snapshots, params['mode_opf'])]
+        demand = load_['agg_load'].values
+
+        def window_problem(window_id, overlap=0):
+            positions = get_window_positions(snapshots, windows[window_id], overlap)
+            return (window_id, self.get_model(positions.stop - positions.start),
+                    p_min_pu.values[positions], p_max_pu.values[positions], demand[positions], params['mode_opf'])
+
+        # Windows are independent: they are solved in the pool if there is one, each one possibly
+        # extended at its start by the end of the previous window
+        overlap = int(params.get('overlap_opf_min', 0)) // int(params['step_opf_min'])
+        solved = map_windows(_solve_window, [window_problem(window_id, overlap) for window_id in range(len(windows))],
+                             pool)
+        results, termination_conditions = [], []
+        for window_id, (snaps, (dispatch, termination_condition, duration)) in enumerate(zip(windows, solved)):
+            record_duration('opf', duration)
+            termination_conditions.append(termination_condition)
+            if dispatch is None:
+                print(f'ERROR: dispatch failed for window {window_id} ({termination_condition})')
+                return None, termination_condition, None
+            # Overlap with the previous window removed
+            results.append(pd.DataFrame(dispatch[len(dispatch) - len(snaps):], index=snaps, columns=generators.index))
+
+        if params.get('ramp_coupling_opf', False) and len(windows) > 1:
+            def solve_window(window_id, first_bounds, last_bounds):
+                window_id, model, window_min_pu, window_max_pu, window_demand, mode = window_problem(window_id)
+                window_min_pu, window_max_pu = window_min_pu.copy(), window_max_pu.copy()
+                for row, bounds in [(0, first_bounds), (-1, last_bounds)]:
+                    if bounds is not None:
+                        window_min_pu[row] = np.fmax(window_min_pu[row], bounds[0].values / model.p_nom)
+                        window_max_pu[row] = np.fmin(window_max_pu[row], bounds[1].values / model.p_nom)
+                dispatch, termination_condition, duration = _solve_window(
+                    (window_id, model, window_min_pu, window_max_pu, window_demand, mode))
+                record_duration('opf', duration)
+                if dispatch is None:
+                    return None, termination_condition
+                return pd.DataFrame(dispatch, index=windows[window_id], columns=generators.index), termination_condition
+
+            ramps = generators[['ramp_limit_up', 'ramp_limit_down']].multiply(generators['p_nom'], axis=0)
+            with tracing.span('opf window boundaries', n_windows=len(windows)):
+                results, reconciled = reconcile_window_boundaries(results, ramps['ramp_limit_up'],
+                                                                  ramps['ramp_limit_down'], solve_window)
+            if results is None:
+                return None, list(reconciled.values())[-1], None
+            for window_id, termination_condition in reconciled.items():
+                termination_conditions[window_id] = termination_condition
+
+        prod_p = pd.concat(results, axis=0).sort_index()
+        # Apply interpolation in case of step_opf_min greater than 5 min
+        if params['step_opf_min'] > 5:
+            prod_p = interpolate_dispatch(prod_p)
+
+        # Get the prices of the marginal generator at each timestep
+        costs = np.where(prod_p.values > 0, self.generators['marginal_cost'].reindex(prod_p.columns).values, -np.inf)
+        marginal_prices = pd.Series(costs.max(axis=1), index=prod_p.index).replace(-np.inf, np.nan)
+        return prod_p, termination_conditions, marginal_prices
+
+    def use_generators(self, generators):
+        """
+        Sets the generators of the models given by *get_model*. Their models are kept as long as the generators do not
+        change, for instance during the iterations on the losses. Called once by *run_dispatch*, whatever its number of
+        windows
+
+        Parameters
+        ----------
+        generators: :class:`pandas.DataFrame`
+            generators of the linear program, with the columns of *generators*
+        """
+        if self._models_generators is None or not self._models_generators.equals(generators):
+            self._models = {}
+            self._models_generators = generators.copy()
+
+    def get_model(self, n_snapshots):
+        """
+        Constraint matrices and costs of windows of n_snapshots for the generators of *use_generators*, built on
+        first use and then kept. HiGHS itself builds its model again at each solve: only the assembly of the matrices
+        is saved
+
+        Parameters
+        ----------
+        n_snapshots: ``int``
+
+        Returns
+        -------
+        model: :class:`DispatchModel`
+        """
+        if n_snapshots not in self._models:
+            generators = self._models_generators
+            self._models[n_snapshots] = DispatchModel(
+                generators['p_nom'].values, generators['marginal_cost'].values, generators['ramp_limit_up'].values,
+                generators['ramp_limit_down'].values, n_snapshots)
+        return self._models[n_snapshots]
+
+    def simplify_net(self):
+        """
+        Implements the abstract method of *Dispatcher*
+        """
+        simplified = HighsDispatcher()
+        gens = self.generators.copy()
+        gens['ramp_up_mw'] = gens['p_nom'] * gens['ramp_limit_up']
+        gens['ramp_down_mw'] = gens['p_nom'] * gens['ramp_limit_down']
+        for carrier, carrier_gens in gens.groupby('carrier', sort=False):
+            p_nom = carrier_gens['p_nom'].sum()
+            simplified.add_generator(carrier, p_nom, carrier, carrier_gens['marginal_cost'].mean(),
+                                     ramp_limit_up=carrier_gens['ramp_up_mw'].sum() / p_nom,
+                                     ramp_limit_down=carrier_gens['ramp_down_mw'].sum() / p_nom)
+        simplified._pmax_solar = self._pmax_solar
+        simplified._pmax_wind = self._pmax_wind
+        simplified._hydro_file_path = self._hydro_file_path
+        simplified._min_hydro_pu = self._min_hydro_pu.iloc[:, 0]
+        simplified._max_hydro_pu = self._max_hydro_pu.iloc[:, 0]
+        return simplified
+
+
+def _solve_window(window):
+    # One window of HighsDispatcher.run_dispatch, possibly in a process of a pool
+    window_id, model, p_min_pu, p_max_pu, demand, mode = window
+    start_opf = time.perf_counter()
+    with tracing.span('opf window', window=window_id, mode=mode):
+        dispatch, termination_condition = model.solve(p_min_pu, p_max_pu, demand)
+    return dispatch, termination_condition, time.perf_counter() - start_opf
+
+
+def solve_dispatch(p_nom, marginal_cost, ramp_limit_up, ramp_limit_down, p_min_pu, p_max_pu, demand):
+    """
+    Minimal cost production of G generators on T snapshots (see :class:`DispatchModel`)
+
+    Returns
+    -------
+    dispatch: :class:`numpy.ndarray` or ``None``
+        array of shape (T, G), None if no solution has been found
+    termination_condition: ``str``
+    """
+    model = DispatchModel(p_nom, marginal_cost, ramp_limit_up, ramp_limit_down, len(demand))
+    return model.solve(p_min_pu, p_max_pu, demand)
+
+
+class DispatchModel:
+    """
+    Linear program of the dispatch of G generators on windows of T snapshots, with the variables p[g, t] at position
+    g * T + t:
+
+    * p_nom[g] * p_min_pu[t, g] <= p[g, t] <= p_nom[g] * p_max_pu[t, g]
+    * sum over g of p[g, t] = demand[t]
+    * -ramp_limit_down[g] * p_nom[g] <= p[g, t] - p[g, t - 1] <= ramp_limit_up[g] * p_nom[g], if the ramp limits are
+      not NaN (no ramp constraint on the first snapshot of the window)
+
+    The constraint matrices and the costs are built once: each window of T snapshots only brings its bounds and demand.
+    They are given again to *scipy.optimize.linprog* at each solve, where HiGHS builds its own model.
+
+    Attributes
+    ----------
+    p_nom: :class:`numpy.ndarray`
+    n_snapshots: ``int``
+    cost: :class:`numpy.ndarray`
+        cost of each variable
+    a_eq: :class:`scipy.sparse.csr_matrix`
+        load balance rows
+    a_ub: :class:`scipy.sparse.csr_matrix` or ``None``
+        ramp rows, None if no generator has ramp limits
+    b_ub: :class:`numpy.ndarray` or ``None``
+    """
+    def __init__(self, p_nom, marginal_cost, ramp_limit_up, ramp_limit_down, n_snapshots):
+        n_gens = len(p_nom)
+        self.p_nom = np.asarray(p_nom, dtype=float)
+        self.n_snapshots = n_snapshots
+        self.cost = np.repeat(marginal_cost, n_snapshots)
+        self.a_eq = sparse.kron(np.ones((1, n_gens)), sparse.identity(n_snapshots), format='csr')
+        # difference between consecutive snapshots of each generator
+        difference = sparse.diags([-np.ones(n_snapshots - 1), np.ones(n_snapshots - 1)], [0, 1],
+                                  shape=(n_snapshots - 1, n_snapshots))
+        ramp_rows, ramp_bounds = [], []
+        for sign, ramp_limit in [(1, np.asarray(ramp_limit_up)), (-1, np.asarray(ramp_limit_down))]:
+            limited = np.flatnonzero(np.isfinite(ramp_limit))
+            if len(limited) and n_snapshots > 1:
+                selection = sparse.csr_matrix((np.ones(len(limited)), (np.arange(len(limited)), limited)),
+                                              shape=(len(limited), n_gens))
+                ramp_rows.append(sign * sparse.kron(selection, difference, format='csr'))
+                ramp_bounds.append(np.repeat(ramp_limit[limited] * self.p_nom[limited], n_snapshots - 1))
+        self.a_ub = sparse.vstack(ramp_rows, format='csr') if ramp_rows else None
+        self.b_ub = np.concatenate(ramp_bounds) if ramp_bounds else None
+
+    def solve(self, p_min_pu, p_max_pu, demand):
+        """
+        Parameters
+        ----------
+        p_min_pu: :class:`numpy.ndarray`
+            array of shape (T, G)
+        p_max_pu: :class:`numpy.ndarray`
+            array of shape (T, G)
+        demand: :class:`numpy.ndarray`
+            array of shape (T,)
+
+        Returns
+        -------
+        dispatch: :class:`numpy.ndarray` or ``None``
+            array of shape (T, G), None if no solution has been found
+        termination_condition: ``str``
+        """
+        lower = (p_min_pu * self.p_nom).T.ravel()
+        upper = (p_max_pu * self.p_nom).T.ravel()
+        if np.any(lower > upper):
+            return None, 'infeasible'
+        result = linprog(self.cost, A_ub=self.a_ub, b_ub=self.b_ub, A_eq=self.a_eq, b_eq=demand,
+                         bounds=np.column_stack([lower, upper]), method='highs')
+        termination_condition = TERMINATION_CONDITIONS.get(result.status, 'other')
+        if result.status != 0:
+            return None, termination_condition
+        return result.x.reshape(len(self.p_nom), self.n_snapshots).T, termination_condition
@@ -7,13 +7,14 @@
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
 import argparse
+from functools import partial
 import os
 import time
 
+import numpy as np
 import pandas as pd
-import pypsa
 
-from .utils import get_grouped_snapshots
+from .utils import adjust_generators, get_window_positions, get_windows, reconcile_window_boundaries
 from .utils import interpolate_dispatch
 from .utils import preprocess_input_data
 from .utils import preprocess_net, filter_ramps
@@ -22,7 +23,10 @@ from .utils import update_gen_constrains, update_params
 
 ## Dépendances Chronix2Grid !!
 from chronix2grid.generation.dispatch.utils import RampMode
+from chronix2grid.generation.generation_utils import map_windows
 import chronix2grid.constants as cst
+from chronix2grid.run_metrics import record_duration
+from chronix2grid import tracing
 
 
 def main_run_disptach(pypsa_net, 
@@ -32,6 +36,7 @@ def main_run_disptach(pypsa_net,
                       params={},
                       gen_constraints=None,
                       ramp_mode=RampMode.hard,
+                      pool=None,
                       **kwargs):
     # Update gen constrains dict with 
     # values passed by the users and params
@@ -69,7 +74,6 @@ def main_run_disptach(pypsa_net,
     #     (commitable as False helps to create a LP problem for PyPSA)
     pypsa_net = preprocess_net(pypsa_net, params['step_opf_min'])
 
-    months = tot_snap.month.unique()
     slack_name = None
     slack_pmin = None
     slack_pmax = None
@@ -84,83 +88,64 @@ def main_run_disptach(pypsa_net,
             slack_name = str(params["slack_name"])
             slack_pmax = float(params["slack_pmax"]) / float(pypsa_net.generators.loc[slack_name].p_nom)
         
-    error_ = False
     start = time.time()
-    results, termination_conditions = [], []
-    if (params['mode_opf'] is not None):
+    if params['mode_opf'] is not None:
         print(f'mode_opf is not None: {params["mode_opf"]}')
-        for month in months:
-            # Get snapshots per month
-            snap_per_month = tot_snap[tot_snap.month == month]
-            # Filter input data per month
-            load_per_month = load_.loc[snap_per_month]
-            if solar_ is not None:
-                total_solar_per_month = solar_.loc[snap_per_month]
-            else:
-                total_solar_per_month = None
-            if wind_ is not None:
-                total_wind_per_month = wind_.loc[snap_per_month]
-            else:
-                total_wind_per_month = None
-            # Get gen constraints separated and filter by month
-            g_max_pu, g_min_pu = gen_constraints_['p_max_pu'], gen_constraints_['p_min_pu']
-            g_max_pu_per_month = g_max_pu.loc[snap_per_month]
-            g_min_pu_per_month = g_min_pu.loc[snap_per_month]
-            # Get grouped snapsshots given monthly snapshots
-            if (params['mode_opf'] is not None):
-                snap_per_mode = get_grouped_snapshots(snap_per_month, params['mode_opf'])
-                for snap_id, snaps in enumerate(snap_per_mode):
-                    # Truncate input data per mode (day, week, month)
-                    load_per_mode = load_per_month.loc[snaps]
-                    if total_solar_per_month is not None:
-                        total_solar_per_mode = total_solar_per_month.loc[snaps]
-                    else:
-                        total_solar_per_mode = None
-                    if total_wind_per_month is not None:
-                        total_wind_per_mode = total_wind_per_month.loc[snaps]
-                    else:
-                        total_wind_per_mode = None
-                    gen_max_pu_per_mode = g_max_pu_per_month.loc[snaps]
-                    gen_min_pu_per_mode = g_min_pu_per_month.loc[snaps]
-                    # Run opf given in specified mode
-                    dispatch, termination_condition = run_opf(
-                        pypsa_net,
-                        load_per_mode,
-                        gen_max_pu_per_mode,
-                        gen_min_pu_per_mode, params, 
-                        total_solar=total_solar_per_mode,
-                        total_wind=total_wind_per_mode,
-                        slack_name=slack_name,
-                        slack_pmin=slack_pmin,
-                        slack_pmax=slack_pmax,
-                        **kwargs)
-                    if dispatch is None:
-                        print(f"ERROR: dispatch failed for 'month' {month} (snap {snap_id})")
-                        error_ = True
-                        break
-                    results.append(dispatch)
-                    termination_conditions.append(termination_condition)
-    else:
-        g_max_pu, g_min_pu = gen_constraints_['p_max_pu'], gen_constraints_['p_min_pu']
-        dispatch, termination_condition = run_opf(
-               pypsa_net, load_, g_max_pu,
-               g_min_pu, params,
-               total_solar=solar_,
-               total_wind=wind_,
-               slack_name=slack_name,
-               slack_pmin=slack_pmin,
-               slack_pmax=slack_pmax,
-               **kwargs)
+    windows = get_windows(tot_snap, params['mode_opf'])
+    g_max_pu, g_min_pu = gen_constraints_['p_max_pu'], gen_constraints_['p_min_pu']
+
+    def window_inputs(snaps, overlap=0):
+        positions = get_window_positions(tot_snap, snaps, overlap)
+        return (load_.iloc[positions], g_max_pu.iloc[positions], g_min_pu.iloc[positions],
+                None if solar_ is None else solar_.iloc[positions],
+                None if wind_ is None else wind_.iloc[positions])
+
+    # Windows are independent: they are dispatched in the pool if there is one, each one
+    # possibly extended at its start by the end of the previous window
+    overlap = int(params.get('overlap_opf_min', 0)) // int(params['step_opf_min'])
+    opf_kwargs = dict(slack_name=slack_name, slack_pmin=slack_pmin, slack_pmax=slack_pmax, **kwargs)
+    solved = map_windows(
+        partial(_run_opf_window, pypsa_net, params, opf_kwargs),
+        [(window_id, _window_tags(month, snap_id, params), *window_inputs(snaps, overlap))
+         for window_id, (month, snap_id, snaps) in enumerate(windows)],
+        pool)
 
+    results, termination_conditions = [], []
+    for (month, snap_id, snaps), (dispatch, termination_condition, duration) in zip(windows, solved):
+        record_duration('opf', duration)
         if dispatch is None:
-            error_ = True
-            print(f"ERROR: dispatch failed.")
-        results.append(dispatch)
+            if month is None:
+                print(f"ERROR: dispatch failed.")
+            else:
+                print(f"ERROR: dispatch failed for 'month' {month} (snap {snap_id})")
+            return None, termination_condition, None
+        # Overlap with the previous window removed
+        results.append(dispatch.loc[snaps[0]:])
         termination_conditions.append(termination_condition)
 
-    if error_:
-        return None, termination_condition, None
-    
+    if params.get('ramp_coupling_opf', False) and len(windows) > 1:
+        generators = adjust_generators(pypsa_net.generators, params, slack_name)
+
+        def solve_window(window_id, first_bounds, last_bounds):
+            month, snap_id, snaps = windows[window_id]
+            demand, gen_max, gen_min, total_solar, total_wind = window_inputs(snaps)
+            window_kwargs = dict(opf_kwargs)
+            window_kwargs.update(_boundary_pu_t(generators, len(snaps), first_bounds, last_bounds,
+                                                kwargs.get('gen_min_pu_t'), kwargs.get('gen_max_pu_t')))
+            dispatch, termination_condition, duration = _run_opf_window(
+                pypsa_net, params, window_kwargs,
+                (window_id, _window_tags(month, snap_id, params), demand, gen_max, gen_min, total_solar, total_wind))
+            record_duration('opf', duration)
+            return dispatch, termination_condition
+
+        ramps = generators[['ramp_limit_up', 'ramp_limit_down']].multiply(generators['p_nom'], axis=0)
+        with tracing.span('opf window boundaries', n_windows=len(windows)):
+            results, reconciled = reconcile_window_boundaries(results, ramps['ramp_limit_up'],
+                                                              ramps['ramp_limit_down'], solve_window)
+        if results is None:
+            return None, list(reconciled.values())[-1], None
+        print(f'{len(reconciled)} window(s) dispatched again to respect the ramps at their start')
+
     # Unpack individual dispatchs and prices
     opf_prod = pd.DataFrame()
     for df in results:
@@ -191,6 +176,59 @@ def main_run_disptach(pypsa_net,
     # at this stage prod_p contains the renewable agg_solar and agg_wind
     return prod_p, termination_conditions, marginal_prices
 
+
+def _window_tags(month, snap_id, params):
+    if month is None:
+        return dict(window=0)
+    return dict(month=int(month), window=snap_id, mode=params['mode_opf'])
+
+
+def _run_opf_window(pypsa_net, params, opf_kwargs, window):
+    # One window of main_run_disptach, possibly in a process of a pool
+    window_id, tags, demand, gen_max, gen_min, total_solar, total_wind = window
+    start_opf = time.perf_counter()
+    with tracing.span('opf window', **tags):
+        dispatch, termination_condition = run_opf(pypsa_net, demand, gen_max, gen_min, params,
+                                                  total_solar=total_solar, total_wind=total_wind, **opf_kwargs)
+    return dispatch, termination_condition, time.perf_counter() - start_opf
+
+
+def _boundary_pu_t(generators, n_snapshots, first_bounds, last_bounds, gen_min_pu_t=None, gen_max_pu_t=None):
+    """
+    gen_min_pu_t and gen_max_pu_t arguments of run_opf that bound the production of the first
+    and last snapshots of a window, in addition to the given ones
+
+    Parameters
+    ----------
+    generators : DataFrame
+        Generators of the window, with their p_nom
+    n_snapshots : int
+        Number of snapshots of the window
+    first_bounds, last_bounds : tuple or None
+        (lower, upper) Series of the production in MW by generator, NaN if not bounded
+
+    Returns
+    -------
+    dict
+        gen_min_pu_t and gen_max_pu_t, arrays of n_snapshots by generator
+    """
+    bounded = {}
+    for key, side, default, combine, given in [('gen_min_pu_t', 0, 0., np.fmax, gen_min_pu_t),
+                                               ('gen_max_pu_t', 1, 1., np.fmin, gen_max_pu_t)]:
+        pu_t = dict(given or {})
+        for name in generators.index:
+            pu = np.full(n_snapshots, np.nan)
+            for row, bounds in [(0, first_bounds), (-1, last_bounds)]:
+                if bounds is not None:
+                    pu[row] = bounds[side].get(name, np.nan) / generators.loc[name, 'p_nom']
+            if np.isnan(pu).all():
+                continue
+            pu = np.where(np.isnan(pu), default, pu)
+            pu_t[name] = combine(pu_t[name], pu) if name in pu_t else pu
+        bounded[key] = pu_t
+    return bounded
+
+
 # In case to launch by the terminal
 # ++  ++  ++  ++  ++  ++  ++  ++  +
 # Vars to set up...
@@ -228,6 +266,7 @@ if __name__ == "__main__":
 
     # **  **  **  **  ** 
     # Load the PyPSA grid
+    import pypsa
     net = pypsa.Network(import_name=args.grid_path)
 
     # Load consumption data without index
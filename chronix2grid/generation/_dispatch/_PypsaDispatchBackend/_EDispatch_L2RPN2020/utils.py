@@ -9,7 +9,6 @@
 import numpy as np
 import pandas as pd
 import copy 
-import pypsa
 
 from chronix2grid.generation.dispatch.utils import RampMode
 
@@ -445,4 +444,137 @@ def interpolate_dispatch(dispatch, method='quadratic'):
     # Force to put zero for very samell values
     criteria_small_value = 1e-4
     interpolated_df[interpolated_df < criteria_small_value] = 0
-    return interpolated_df.round(2)
\ No newline at end of file
+    return interpolated_df.round(2)
+
+
+def get_windows(snapshots, mode):
+    """ Get the windows solved one by one by the OPF: the snapshots
+    of each month grouped per opf mode, in chronological order
+
+    Parameters
+    ----------
+    snapshots : DatetimeIndex
+    mode : str or None
+        [day, week, month], None for a single window
+
+    Returns
+    -------
+    list
+        (month, id of the window in the month, snapshots) of each
+        window, month is None if mode is None
+    """
+    if mode is None:
+        return [(None, 0, snapshots)]
+    windows = []
+    for month in snapshots.month.unique():
+        snap_per_month = snapshots[snapshots.month == month]
+        for snap_id, snaps in enumerate(get_grouped_snapshots(snap_per_month, mode)):
+            windows.append((month, snap_id, snaps))
+    # Weeks of a month are not in chronological order around new year
+    return sorted(windows, key=lambda window: window[2][0])
+
+def get_window_positions(snapshots, window_snapshots, overlap=0):
+    """ Positions of a window in all the snapshots, extended at
+    its start by the last snapshots of the previous window
+
+    Parameters
+    ----------
+    snapshots : DatetimeIndex
+    window_snapshots : DatetimeIndex
+        Consecutive snapshots of the window
+    overlap : int
+        Number of snapshots added before the window
+
+    Returns
+    -------
+    slice
+    """
+    start = max(snapshots.get_loc(window_snapshots[0]) - overlap, 0)
+    return slice(start, snapshots.get_loc(window_snapshots[-1]) + 1)
+
+def adjust_generators(generators, params, slack_name=None):
+    """ Corrections of pmax and ramps given in params
+    ("PmaxErrorCorrRatio", "RampErrorCorrRatio" and
+    "slack_ramp_limit_ratio") as applied by run_opf.
+    Aggregated solar and wind are not corrected
+
+    Parameters
+    ----------
+    generators : dataframe
+        Generators with columns p_nom, ramp_limit_up and
+        ramp_limit_down
+    params : dict
+        OPF parameters
+    slack_name : str
+
+    Returns
+    -------
+    dataframe
+        Corrected copy of generators
+    """
+    generators = copy.deepcopy(generators)
+    renewables = generators.index.isin(['agg_solar', 'agg_wind'])
+    if 'PmaxErrorCorrRatio' in params:
+        generators.loc[~renewables, 'p_nom'] *= float(params['PmaxErrorCorrRatio'])
+    if 'RampErrorCorrRatio' in params:
+        generators.loc[~renewables, ['ramp_limit_up', 'ramp_limit_down']] *= float(params['RampErrorCorrRatio'])
+    if slack_name is not None and 'slack_ramp_limit_ratio' in params:
+        generators.loc[slack_name, ['ramp_limit_up', 'ramp_limit_down']] *= float(params['slack_ramp_limit_ratio'])
+    return generators
+
+def reconcile_window_boundaries(results, ramp_up, ramp_down, solve_window, tolerance=1e-6):
+    """ Windows are dispatched independently: nothing constrains the
+    ramp between the last snapshot of a window and the first snapshot
+    of the next one. Windows are checked in chronological order and a
+    window that cannot be reached from the previous one is dispatched
+    again, with its first snapshot within the ramps of the last
+    setpoints of the previous window and, if it is feasible, its last
+    snapshot within the ramps of the first setpoints of the next
+    window (otherwise the next window is checked in turn).
+
+    Parameters
+    ----------
+    results : list
+        Dispatch (dataframe, generators in columns) of each window,
+        in chronological order
+    ramp_up : Series
+        Max ramp up of each generator in MW by snapshot, NaN if none
+    ramp_down : Series
+        Max ramp down of each generator in MW by snapshot, NaN if none
+    solve_window : callable
+        solve_window(window_id, first_bounds, last_bounds) dispatches
+        the window again with the production of its first (and last)
+        snapshot between the bounds, a tuple (lower, upper) of Series
+        in MW, NaN if not bounded, or None. It returns the dispatch
+        (None if it failed) and the termination condition
+    tolerance : float
+        Ramp violation accepted, in MW
+
+    Returns
+    -------
+    list or None
+        Dispatch of each window, None if a window failed
+    dict
+        Termination condition of each window dispatched again
+    """
+    results = list(results)
+    termination_conditions = {}
+    for window_id in range(1, len(results)):
+        previous = results[window_id - 1].iloc[-1]
+        step = results[window_id].iloc[0] - previous
+        up, down = ramp_up.reindex(step.index), ramp_down.reindex(step.index)
+        if not ((step > up + tolerance) | (-step > down + tolerance)).any():
+            continue
+        first_bounds = (previous - down, previous + up)
+        dispatch = None
+        if window_id + 1 < len(results):
+            following = results[window_id + 1].iloc[0]
+            dispatch, termination_condition = solve_window(window_id, first_bounds, (following - up, following + down))
+        if dispatch is None:
+            dispatch, termination_condition = solve_window(window_id, first_bounds, None)
+        termination_conditions[window_id] = termination_condition
+        if dispatch is None:
+            print(f'ERROR: window {window_id} cannot be reached from the previous window ({termination_condition})')
+            return None, termination_conditions
+        results[window_id] = dispatch
+    return results, termination_conditions
@@ -6,7 +6,8 @@
 # SPDX-License-Identifier: MPL-2.0
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
-from .generate_load import main
+import chronix2grid.constants as cst
+from .generate_load import main, main_by_windows, main_ensemble
 
 
 class ConsumptionGeneratorBackend:
@@ -44,3 +45,49 @@ class ConsumptionGeneratorBackend:
         if load_weekly_pattern is None:
             load_weekly_pattern = self.load_config_manager.read_specific()
         return main(self.out_path, self.seed, self.params, self.loads_charac, load_weekly_pattern, self.write_results)
+
+    def run_by_windows(self, time_window, pool=None, load_weekly_pattern=None, stream=False):
+        """
+        Runs the generation model in ``chronix2grid.generation.consumption.generate_load`` by time windows
+        (see :func:`chronix2grid.generation.consumption.generate_load.main_by_windows`) and writes chronics
+
+        Parameters
+        ----------
+        time_window: ``str``
+            "week" or "month"
+        pool: :class:`multiprocessing.Pool` or ``None``
+            pool of processes in which the windows are generated
+        stream: ``bool``
+            if True, windows are written as soon as they are generated and chronics are not returned, so that memory
+            does not depend on the length of the horizon
+        """
+        if load_weekly_pattern is None:
+            load_weekly_pattern = self.load_config_manager.read_specific()
+        return main_by_windows(self.out_path, self.seed, self.params, self.loads_charac, load_weekly_pattern,
+                               time_window, pool, self.write_results, stream=stream)
+
+    def run_ensemble(self, seeds, out_paths, load_weekly_pattern=None, max_batch_bytes=cst.ENSEMBLE_MAX_BATCH_BYTES):
+        """
+        Generates several scenarios on the same period, one by seed, in vectorized batches
+        (see :func:`chronix2grid.generation.consumption.generate_load.main_ensemble`) and writes chronics.
+        Each scenario is the same as the one of :meth:`run` with its seed: the seed and out_path of the backend are not
+        used
+
+        Parameters
+        ----------
+        seeds: ``list``
+            seed of each scenario
+        out_paths: ``list``
+            output folder of each scenario
+        max_batch_bytes: ``int``
+            memory allowed to the chronics of the scenarios computed together
+
+        Returns
+        -------
+        results: ``list``
+            what :meth:`run` returns, for each scenario
+        """
+        if load_weekly_pattern is None:
+            load_weekly_pattern = self.load_config_manager.read_specific()
+        return main_ensemble(out_paths, seeds, self.params, self.loads_charac, load_weekly_pattern, self.write_results,
+                             max_batch_bytes=max_batch_bytes)
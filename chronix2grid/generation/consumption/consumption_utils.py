@@ -6,6 +6,7 @@
 # SPDX-License-Identifier: MPL-2.0
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
+import hashlib
 import os
 import calendar
 from datetime import datetime
@@ -15,32 +16,82 @@ from scipy.interpolate import interp1d
 
 from .. import generation_utils as utils
 import chronix2grid.constants as cst
+from chronix2grid import tracing
+from chronix2grid.generation.pattern_cache import BoundedCache
+
+_load_pattern_cache = BoundedCache(cst.LOAD_PATTERN_CACHE_MAX_ENTRIES)
+
+def compute_loads(loads_charac, temperature_noise, params, load_weekly_pattern, start_day, add_dim, time_slice=None):
+    """
+    Computes the active power of the loads, see :func:`compute_residential_loads`
+
+    Output:
+        (dict of np.array) one time series per load name
+    """
+    names, residential_loads = compute_residential_loads(loads_charac, temperature_noise, params,
+                                                         load_weekly_pattern, start_day, add_dim,
+                                                         time_slice=time_slice)
+    return {name: residential_loads[:, i] for i, name in enumerate(names)}
+
+def compute_residential_loads(loads_charac, temperature_noise, params, load_weekly_pattern, start_day, add_dim,
+                              time_slice=None):
+    """
+    Computes the active power of all the residential loads at once, with the same results as one call of
+    :func:`compute_residential` by load: the temperature noise is interpolated at all the load locations in one
+    batch, the seasonal pattern is computed once, and the weekly pattern is interpolated once for each distinct
+    week of the pattern file.
+
+    Input:
+        loads_charac: (pandas.DataFrame) name, type, x, y and Pmax of the loads
+        load_weekly_pattern: (pandas.DataFrame) normalized in place, as with compute_residential
+        time_slice: (slice) If given, only these time steps are computed
+
+    Loads are computed in the dtype given by params (see :func:`chronix2grid.generation.generation_utils.generation_dtype`)
+
+    Output:
+        (list) names of the loads
+        (np.array) loads of shape (number of time steps, number of loads). With one temperature noise by scenario
+            stacked along a leading dimension (see :func:`chronix2grid.generation.generation_utils.stack_noises`),
+            the loads of each scenario along the same leading dimension
+    """
+    if (loads_charac['type'] == 'industrial').any():
+        raise NotImplementedError("Impossible to generate industrial loads for now.")
+    # Loads of another type are not generated
+    residential = np.flatnonzero((loads_charac['type'] == 'residential').values)
+    names = list(loads_charac['name'].values[residential])
 
-def compute_loads(loads_charac, temperature_noise, params, load_weekly_pattern, start_day, add_dim):
-    # Compute active part of loads
     weekly_pattern = load_weekly_pattern['test'].values
-    
     start_day_of_week = start_day.weekday()
     first_dow_chronics = datetime.strptime(load_weekly_pattern["datetime"].iloc[1], "%Y-%m-%d %H:%M:%S").weekday()
     # + (calendar.isleap(start_day.year) if start_day.month >= 3 else 0)
     day_lag = (first_dow_chronics - start_day_of_week) % 7
     day_lag = 6  # this is only TRUE if you simulate 2050 !!!
-    
-    loads_series = {}
-    for i, name in enumerate(loads_charac['name']):
-        mask = (loads_charac['name'] == name)
-        if loads_charac[mask]['type'].values == 'residential':
-            locations = [loads_charac[mask]['x'].values[0], loads_charac[mask]['y'].values[0]]
-            Pmax = loads_charac[mask]['Pmax'].values[0]
-            loads_series[name] = compute_residential(locations, Pmax, temperature_noise, params, weekly_pattern, index=i, day_lag=day_lag, add_dim=add_dim)
+    dtype = utils.generation_dtype(params)
 
-        if loads_charac[mask]['type'].values == 'industrial':
-            raise NotImplementedError("Impossible to generate industrial loads for now.")
-            Pmax = loads_charac[mask]['Pmax'].values[0]
-            loads_series[name] = compute_industrial(Pmax, params)
-    return loads_series
+    temperature_signal = utils.interpolate_noise_batch(
+        temperature_noise,
+        params,
+        (loads_charac['x'].values[residential], loads_charac['y'].values[residential]),
+        time_scale=params['temperature_corr'],
+        add_dim=add_dim,
+        time_slice=time_slice).astype(dtype).swapaxes(-1, -2)
+    seasonal_pattern = compute_seasonal_pattern(params, time_slice=time_slice).astype(dtype, copy=False)
+
+    # Weeks of the pattern are normalized in place load after load, as in compute_load_pattern. Each distinct week
+    # is interpolated once (see interpolate_load_pattern)
+    weekly_patterns = np.empty(temperature_signal.shape[-2:], dtype=dtype)
+    for column, index in enumerate(residential):
+        week = normalize_week_pattern(weekly_pattern, index, day_lag)
+        weekly_patterns[:, column] = interpolate_load_pattern(params, week, time_slice=time_slice)
 
-def compute_residential(locations, Pmax, temperature_noise, params, weekly_pattern, index, day_lag=None, add_dim=0):
+    Pmax = loads_charac['Pmax'].values[residential].astype(dtype)
+    std_temperature_noise = params['std_temperature_noise']
+    residential_loads = Pmax * weekly_patterns * (std_temperature_noise * temperature_signal
+                                                  + seasonal_pattern[:, np.newaxis])
+    return names, residential_loads
+
+def compute_residential(locations, Pmax, temperature_noise, params, weekly_pattern, index, day_lag=None, add_dim=0,
+                        time_slice=None):
 
 
     # Compute refined signals
@@ -49,15 +100,31 @@ def compute_residential(locations, Pmax, temperature_noise, params, weekly_patte
         params,
         locations,
         time_scale=params['temperature_corr'],
-        add_dim=add_dim)
+        add_dim=add_dim,
+        time_slice=time_slice)
     temperature_signal = temperature_signal.astype(float)
     
     # Compute seasonal pattern
+    seasonal_pattern = compute_seasonal_pattern(params, time_slice=time_slice)
+
+    # Get weekly pattern
+    weekly_pattern = compute_load_pattern(params, weekly_pattern, index, day_lag, time_slice=time_slice)
+    std_temperature_noise = params['std_temperature_noise']
+    residential_series = Pmax * weekly_pattern * (std_temperature_noise * temperature_signal + seasonal_pattern)
+
+    return residential_series
+
+def compute_seasonal_pattern(params, time_slice=None):
+    """
+    Yearly cosine common to all the residential loads, with a minimum mid-February
+    """
     Nt_inter = int(params['T'] // params['dt'] + 1)
-    
+
     # t = np.linspace(0, params['T'], Nt_inter, endpoint=True)
     t = np.linspace(0., (params['end_date'] - params["start_date"]).total_seconds(), Nt_inter, endpoint=True, dtype=float)
-    
+    if time_slice is not None:
+        t = t[time_slice]
+
     start_year = pd.to_datetime(str(params['start_date'].year) + '/01/01', format='%Y-%m-%d')
     start_min = float(pd.Timedelta(params['start_date'] - start_year).total_seconds())
     nb_sec_per_day =  24. * 60. * 60.
@@ -65,15 +132,9 @@ def compute_residential(locations, Pmax, temperature_noise, params, weekly_patte
     year_pattern = 2. * np.pi / nb_sec_per_year
     seasonal_pattern = 1.5 / 7. * np.cos(year_pattern * (t + start_min - 45 * nb_sec_per_day))  # min of the load is 15 of February so 45 days after beginning of year
     seasonal_pattern += 5.5 / 7.
+    return seasonal_pattern
 
-    # Get weekly pattern
-    weekly_pattern = compute_load_pattern(params, weekly_pattern, index, day_lag)
-    std_temperature_noise = params['std_temperature_noise']
-    residential_series = Pmax * weekly_pattern * (std_temperature_noise * temperature_signal + seasonal_pattern)
-
-    return residential_series
-
-def compute_load_pattern(params, weekly_pattern, index, day_lag):
+def compute_load_pattern(params, weekly_pattern, index, day_lag, time_slice=None):
     """
     Loads a typical hourly pattern, and interpolates it to generate
     a smooth solar generation pattern between 0 and 1
@@ -82,12 +143,22 @@ def compute_load_pattern(params, weekly_pattern, index, day_lag):
         computation_params: (dict) Defines the mesh dimensions and
             precision. Also define the correlation scales
             interpolation_params: (dict) params of the interpolation
+        time_slice: (slice) If given, only these time steps are computed
 
     Output:
         (np.array) A smooth solar pattern
     """
     # solar_pattern resolution : 1H, 8761
+    weekly_pattern = normalize_week_pattern(weekly_pattern, index, day_lag)
+    return interpolate_load_pattern(params, weekly_pattern, time_slice=time_slice).copy()
+
+def normalize_week_pattern(weekly_pattern, index, day_lag):
+    """
+    Selects the week of the pattern used by the load of the given index and normalizes it in place
 
+    Output:
+        (np.array) a view on the week in weekly_pattern
+    """
     if day_lag is None:
         nb_step_lag_for_starting_day = 0
     else:
@@ -98,15 +169,32 @@ def compute_load_pattern(params, weekly_pattern, index, day_lag):
     index %= int((weekly_pattern.shape[0] - nb_step_lag_for_starting_day) / index_weekly_perweek - 1)
     weekly_pattern = weekly_pattern[(nb_step_lag_for_starting_day + index * index_weekly_perweek):(nb_step_lag_for_starting_day + (index + 1) * index_weekly_perweek)]
     weekly_pattern /= np.mean(weekly_pattern)
+    return weekly_pattern
+
+def interpolate_load_pattern(params, weekly_pattern, time_slice=None):
+    """
+    Repeats a normalized week of pattern over the years of the scenario and interpolates it at the time steps of the
+    scenario.
+
+    Results are kept in a bounded cache of the process, shared by the loads and the scenarios that use the same week
+    of pattern on the same period. Cached arrays are read-only.
+    """
+    if time_slice is not None:
+        time_slice = (time_slice.start, time_slice.stop, time_slice.step)
+    # The week is identified by its content: it is normalized in place, possibly several times
+    key = (hashlib.blake2b(weekly_pattern.tobytes(), digest_size=16).digest(), params['start_date'],
+           params['end_date'], params['dt'], params['T'], time_slice)
+    return _load_pattern_cache.get_or_compute(
+        key, lambda: _interpolate_load_pattern(params, weekly_pattern, time_slice))
+
 
+def _interpolate_load_pattern(params, weekly_pattern, time_slice):
     start_year = pd.to_datetime(str(params['start_date'].year) + '/01/01', format='%Y-%m-%d')
     T_bis = int(pd.Timedelta(params['end_date'] - start_year).total_seconds() // (60))
 
     Nt_inter_hr = int(T_bis // 5 + 1)
     N_repet = int((Nt_inter_hr - 1) // len(weekly_pattern) + 1)
-    stacked_weekly_pattern = weekly_pattern
-    for i in range(N_repet - 1):
-        stacked_weekly_pattern = np.append(stacked_weekly_pattern, weekly_pattern)
+    stacked_weekly_pattern = np.tile(weekly_pattern, N_repet)
 
     # The time is in minutes
     t_pattern = np.linspace(0, 60 * 7 * 24 * N_repet, 12 * 7 * 24 * N_repet, endpoint=False)
@@ -117,14 +205,45 @@ def compute_load_pattern(params, weekly_pattern, index, day_lag):
     start_min = int(pd.Timedelta(params['start_date'] - start_year).total_seconds() // 60)
     end_min = int(pd.Timedelta(params['end_date'] - start_year).total_seconds() // 60)
     t_inter = np.linspace(start_min, end_min, Nt_inter, endpoint=True)
+    if time_slice is not None:
+        t_inter = t_inter[slice(*time_slice)]
     output = f2(t_inter)
     output = output * (output > 0)
+    output.setflags(write=False)
 
     return output
 
 
+def assemble_loads(prng, names, loads, datetime_index, noise, dtype=float):
+    """
+    Builds load_p, load_q and their forecasts from the loads of all the nodes in a single pass, with the same results
+    as create_csv: columns are ordered once, forecasts are the loads of the next time step, and the lognormal noise is
+    applied in place to the realized chronics
+
+    Input:
+        loads: (np.array) of shape (number of time steps, number of loads), see compute_residential_loads
+        datetime_index: (pandas.DatetimeIndex) time steps of loads
+        noise: (float) standard deviation of the lognormal noise of the realized chronics
+
+    Output:
+        (dict of pandas.DataFrame) load_p, load_p_forecasted, load_q and load_q_forecasted
+    """
+    columns, index, load_p, load_p_forecasted = utils.assemble_chronics(names, loads, datetime_index)
+    load_q = 0.7 * load_p
+    load_p *= prng.lognormal(mean=0.0, sigma=noise, size=load_p.shape).astype(dtype, copy=False)
+    load_q *= prng.lognormal(mean=0.0, sigma=noise, size=load_q.shape).astype(dtype, copy=False)
+    chronics = dict(load_p=load_p, load_p_forecasted=load_p_forecasted,
+                    load_q=load_q, load_q_forecasted=0.7 * load_p_forecasted)
+    return {name: pd.DataFrame(values, index=index, columns=columns) for name, values in chronics.items()}
+
+
 def create_csv(prng, dict_, path, forecasted=False, reordering=True, noise=None,
-               shift=False, write_results=True, index=False):
+               shift=False, write_results=True, index=False, dtype=float):
+    """
+    Builds the load_p (or load_p_forecasted) and load_q chronics from the series of the loads and writes them
+
+    dtype is the one of the series: the gaussian noise, drawn in float64, is cast to it
+    """
     df = pd.DataFrame.from_dict(dict_)
     df.set_index('datetime', inplace=True)
     df = df.sort_index(ascending=True)
@@ -141,17 +260,19 @@ def create_csv(prng, dict_, path, forecasted=False, reordering=True, noise=None,
 
     df_reactive_power = 0.7 * df
     if noise is not None:
-        df *= prng.lognormal(mean=0.0,sigma=noise, size=df.shape)
-        df_reactive_power *= prng.lognormal(mean=0.0, sigma=noise, size=df.shape)
+        df *= prng.lognormal(mean=0.0,sigma=noise, size=df.shape).astype(dtype, copy=False)
+        df_reactive_power *= prng.lognormal(mean=0.0, sigma=noise, size=df.shape).astype(dtype, copy=False)
 
     if write_results:
         file_extension = '_forecasted' if forecasted else ''
-        df.to_csv(
-            os.path.join(path, f'load_p{file_extension}.csv.bz2'),
-            index=index, sep=';', float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
-        df_reactive_power.to_csv(
-            os.path.join(path, f'load_q{file_extension}.csv.bz2'),
-            index=False, sep=';', float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
+        with tracing.span('csv writing', file=f'load_p{file_extension}'):
+            df.to_csv(
+                os.path.join(path, f'load_p{file_extension}.csv.bz2'),
+                index=index, sep=';', float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
+        with tracing.span('csv writing', file=f'load_q{file_extension}'):
+            df_reactive_power.to_csv(
+                os.path.join(path, f'load_q{file_extension}.csv.bz2'),
+                index=False, sep=';', float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
 
     return df
 
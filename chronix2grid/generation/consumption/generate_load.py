@@ -8,6 +8,7 @@
 
 import os
 import json
+from functools import partial
 from numpy.random import default_rng
 
 # Other Python libraries
@@ -17,6 +18,35 @@ import numpy as np
 # Libraries developed for this module
 from . import consumption_utils as conso
 from .. import generation_utils as utils
+import chronix2grid.constants as cst
+from chronix2grid import tracing
+
+
+def compute_temperature_noise(prng, params, loads_charac):
+    """
+    Generates the coarse spatio-temporal noise shared by all the loads of the grid
+
+    Returns
+    -------
+    temperature_noise: ``np.array`` or :class:`chronix2grid.generation.generation_utils.SparseNoise`
+        3D autocorrelated noise, only on the cells used by the loads if params["sparse_noise"] is set
+    add_dim: ``int``
+        number of extra cells added to each dimension of the coarse mesh so that it contains all the load nodes
+    """
+    add_dim = 0
+    dx_corr = int(params['dx_corr'])
+    dy_corr = int(params['dy_corr'])
+    for x,y  in zip(loads_charac["x"], loads_charac["y"]):
+        x_plus = int(x // dx_corr + 1)
+        y_plus = int(y // dy_corr + 1)
+        add_dim = max(y_plus, add_dim)
+        add_dim = max(x_plus, add_dim)
+    if params.get('sparse_noise'):
+        temperature_noise = utils.generate_sparse_coarse_noise(
+            utils.draw_noise_seed(prng), params, 'temperature', (loads_charac['x'].values, loads_charac['y'].values))
+    else:
+        temperature_noise = utils.generate_coarse_noise(prng, params, 'temperature', add_dim=add_dim)
+    return temperature_noise, add_dim
 
 
 def main(scenario_destination_path, seed, params, loads_charac, load_weekly_pattern, write_results = True):
@@ -48,45 +78,196 @@ def main(scenario_destination_path, seed, params, loads_charac, load_weekly_patt
         freq=str(params['dt']) + 'min')
 
 
-    add_dim = 0
-    dx_corr = int(params['dx_corr'])
-    dy_corr = int(params['dy_corr'])
-    for x,y  in zip(loads_charac["x"], loads_charac["y"]):
-        x_plus = int(x // dx_corr + 1)
-        y_plus = int(y // dy_corr + 1)
-        add_dim = max(y_plus, add_dim)
-        add_dim = max(x_plus, add_dim)
-    
     # Generate GLOBAL temperature noise
     print('Computing global auto-correlated spatio-temporal noise for thermosensible demand...') ## temperature is simply to reflect the fact that loads is correlated spatially, and so is the real "temperature". It is not the real temperature.
-    temperature_noise = utils.generate_coarse_noise(prng, params, 'temperature', add_dim=add_dim)
+    temperature_noise, add_dim = compute_temperature_noise(prng, params, loads_charac)
 
     print('Computing loads ...')
     start_day = datetime_index[0]
-    loads_series = conso.compute_loads(loads_charac,
-                                       temperature_noise,
-                                       params,
-                                       load_weekly_pattern,
-                                       start_day=start_day,
-                                       add_dim=add_dim)
-    loads_series['datetime'] = datetime_index
+    names, loads = conso.compute_residential_loads(loads_charac,
+                                                   temperature_noise,
+                                                   params,
+                                                   load_weekly_pattern,
+                                                   start_day=start_day,
+                                                   add_dim=add_dim)
+    return write_loads(prng, names, loads, datetime_index, scenario_destination_path, params, write_results)
+
+
+def write_loads(prng, names, loads, datetime_index, scenario_destination_path, params, write_results=True):
+    """
+    Adds the gaussian noise of the scenario to the loads and writes them with their forecasts
+    (see :func:`chronix2grid.generation.consumption.consumption_utils.assemble_loads`)
+
+    Parameters
+    ----------
+    names (list): names of the loads
+    loads (np.array): loads of shape (number of time steps, number of loads)
 
+    Returns
+    -------
+    pandas.DataFrame: loads chronics generated at every node with additional gaussian noise
+    pandas.DataFrame: loads chronics forecasted for the scenario without additional gaussian noise
+    """
     # Save files
     if scenario_destination_path is not None:
         print('Saving files in zipped csv in "{}"'.format(scenario_destination_path))
         if not os.path.exists(scenario_destination_path):
             os.makedirs(scenario_destination_path)
-            
-    load_p_forecasted = conso.create_csv(prng, loads_series, scenario_destination_path,
-                                        forecasted=True, reordering=True,
-                                        shift=True, write_results=write_results, index=False)
-    load_p = conso.create_csv(
-        prng,
-        loads_series, scenario_destination_path,
-        reordering=True,
-        noise=params['planned_std'],
-        write_results=write_results,
-        index=False
-    )
-    
+
+    chronics = conso.assemble_loads(prng, names, loads, datetime_index, params['planned_std'],
+                                    dtype=utils.generation_dtype(params))
+    if write_results:
+        utils.write_chronics(chronics, scenario_destination_path)
+    return chronics['load_p'], chronics['load_p_forecasted']
+
+
+def main_ensemble(scenario_destination_paths, seeds, params, loads_charac, load_weekly_pattern, write_results=True,
+                  max_batch_bytes=cst.ENSEMBLE_MAX_BATCH_BYTES):
+    """
+    Same as :func:`main` for several scenarios of the same period, computed together by batches: the coarse noises
+    of a batch are stacked along a leading dimension (scenarios x time steps x loads) and interpolated in one pass,
+    and the weekly and seasonal patterns are computed once.
+
+    Each scenario gives the same chronics as :func:`main` with its own seed.
+
+    Parameters
+    ----------
+    scenario_destination_paths (list): where the results of each scenario are written
+    seeds (list): random seed of each scenario
+    max_batch_bytes (int): memory allowed to the loads of the scenarios computed together
+
+    Returns
+    -------
+    list: load_p and load_p_forecasted of each scenario, as returned by :func:`main`
+    """
+    datetime_index = pd.date_range(
+        start=params['start_date'],
+        end=params['end_date'],
+        freq=str(params['dt']) + 'min')
+    batch_size = utils.ensemble_batch_size(len(datetime_index), len(loads_charac), max_batch_bytes,
+                                           dtype=utils.generation_dtype(params))
+    print('Computing loads of ' + str(len(seeds)) + ' scenarios by batches of ' + str(batch_size) + '...')
+
+    results = []
+    for batch_start in range(0, len(seeds), batch_size):
+        prngs = [default_rng(seed) for seed in seeds[batch_start:batch_start + batch_size]]
+        noises = [compute_temperature_noise(prng, params, loads_charac) for prng in prngs]
+        add_dim = noises[0][1]
+        # The weekly pattern is normalized in place: the batch starts from the pattern as it was read, as main does
+        names, loads = conso.compute_residential_loads(loads_charac,
+                                                       utils.stack_noises([noise for noise, _ in noises]),
+                                                       params,
+                                                       load_weekly_pattern.copy(),
+                                                       start_day=datetime_index[0],
+                                                       add_dim=add_dim)
+        for i, prng in enumerate(prngs):
+            results.append(write_loads(prng, names, loads[i], datetime_index,
+                                       scenario_destination_paths[batch_start + i], params, write_results))
+    return results
+
+
+def main_by_windows(scenario_destination_path, seed, params, loads_charac, load_weekly_pattern, time_window,
+                    pool=None, write_results=True, stream=False):
+    """
+    Same as :func:`main`, but the horizon of the scenario is split into time windows (weeks or months) that are
+    generated independently, possibly in a pool of processes.
+
+    The coarse temperature noise is generated once for the whole horizon with the seed of the scenario, so that the
+    chronics are continuous between two windows. The gaussian noise of each window comes from its own random
+    generator (see :func:`chronix2grid.generation.generation_utils.window_prng`): results only depend on the seed and
+    on the windows, not on the number of processes.
+
+    Parameters
+    ----------
+    time_window (str): "week" or "month"
+    pool (multiprocessing.Pool): pool in which windows are generated. If None, they are generated one after the other
+    stream (bool): if True, each window is written as soon as it is generated and then released, so that memory
+        does not depend on the length of the horizon. Chronics are not returned
+
+    Returns
+    -------
+    pandas.DataFrame: loads chronics generated at every node with additional gaussian noise (None if stream)
+    pandas.DataFrame: loads chronics forecasted for the scenario without additional gaussian noise (None if stream)
+    """
+    windows = utils.split_time_windows(params, time_window)
+    print('Computing loads by ' + str(time_window) + ' (' + str(len(windows)) + ' windows)...')
+    # Drawn once for the whole horizon, and shared by the windows
+    coarse_noise = compute_temperature_noise(default_rng(seed), params, loads_charac)
+    generate_window = partial(main_window, seed, params, loads_charac, load_weekly_pattern, len(windows), coarse_noise)
+    if stream:
+        stream_windows(scenario_destination_path, generate_window, windows, pool, write_results)
+        return None, None
+    results = utils.map_windows(generate_window, windows, pool)
+
+    load_p, load_p_forecasted, load_q, load_q_forecasted = [pd.concat(dfs) for dfs in zip(*results)]
+
+    if scenario_destination_path is not None:
+        print('Saving files in zipped csv in "{}"'.format(scenario_destination_path))
+        if not os.path.exists(scenario_destination_path):
+            os.makedirs(scenario_destination_path)
+    if write_results:
+        for df, file_name in [(load_p_forecasted, 'load_p_forecasted'), (load_q_forecasted, 'load_q_forecasted'),
+                              (load_p, 'load_p'), (load_q, 'load_q')]:
+            with tracing.span('csv writing', file=file_name):
+                df.to_csv(
+                    os.path.join(scenario_destination_path, f'{file_name}.csv.bz2'),
+                    index=False, sep=';', float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
+
     return load_p, load_p_forecasted
+
+
+def stream_windows(scenario_destination_path, generate_window, windows, pool=None, write_results=True):
+    """
+    Generates the loads window after window with generate_window (see :func:`main_window`) and appends them to the
+    files of the scenario, the same as the ones written by :func:`main_by_windows`
+    """
+    if scenario_destination_path is not None and write_results:
+        print('Saving files in zipped csv in "{}"'.format(scenario_destination_path))
+        if not os.path.exists(scenario_destination_path):
+            os.makedirs(scenario_destination_path)
+    folder = scenario_destination_path if write_results else None
+    with utils.StreamWriter(folder, ['load_p_forecasted', 'load_q_forecasted', 'load_p', 'load_q']) as writer:
+        for load_p, load_p_forecasted, load_q, load_q_forecasted in utils.iter_windows(generate_window, windows, pool):
+            writer.write(dict(load_p_forecasted=load_p_forecasted, load_q_forecasted=load_q_forecasted,
+                              load_p=load_p, load_q=load_q))
+
+
+def main_window(seed, params, loads_charac, load_weekly_pattern, n_windows, coarse_noise, window):
+    """
+    Generates the loads of one time window, as returned by :func:`chronix2grid.generation.generation_utils.split_time_windows`
+
+    coarse_noise is the temperature noise of the whole horizon and its additional dimension, as returned by
+    :func:`compute_temperature_noise` with the seed of the scenario
+
+    Returns
+    -------
+    tuple of pandas.DataFrame: load_p, load_p_forecasted, load_q, load_q_forecasted on the window
+    """
+    window_id, start, stop = window
+    datetime_index = pd.date_range(
+        start=params['start_date'],
+        end=params['end_date'],
+        freq=str(params['dt']) + 'min')
+
+    # Same global noise as in function main, whatever the window
+    temperature_noise, add_dim = coarse_noise
+    prng = utils.window_prng(seed, window_id)
+
+    # One more time step than the window, for the forecast of its last time step
+    time_slice = slice(start, stop + 1)
+    # compute_loads normalizes the weekly pattern in place: each window starts from the pattern as it was read
+    loads_series = conso.compute_loads(loads_charac,
+                                       temperature_noise,
+                                       params,
+                                       load_weekly_pattern.copy(),
+                                       start_day=datetime_index[0],
+                                       add_dim=add_dim,
+                                       time_slice=time_slice)
+    load_p, load_p_forecasted = utils.window_dataframes(loads_series, datetime_index[time_slice],
+                                                        last_window=(window_id == n_windows - 1))
+    load_q_forecasted = 0.7 * load_p_forecasted
+    load_q = 0.7 * load_p
+    dtype = utils.generation_dtype(params)
+    load_p = load_p * prng.lognormal(mean=0.0, sigma=params['planned_std'], size=load_p.shape).astype(dtype, copy=False)
+    load_q = load_q * prng.lognormal(mean=0.0, sigma=params['planned_std'], size=load_q.shape).astype(dtype, copy=False)
+    return load_p, load_p_forecasted, load_q, load_q_forecasted
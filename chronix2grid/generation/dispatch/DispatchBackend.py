@@ -6,8 +6,6 @@
 # SPDX-License-Identifier: MPL-2.0
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
-from .generate_dispatch import main
-
 
 class DispatchBackend: # TODO - PypsaDispatchBackend - devra créer un PypsaDispatcher et l'utiliser. OU ALORS dans les constantes de Chronix2grid choisir la classe de Dispatcher
     """
@@ -29,6 +27,8 @@ class DispatchBackend: # TODO - PypsaDispatchBackend - devra créer un PypsaDisp
         dictionnary with the model parameters. It needs to contain keys **"dt", "planned_std"**
     params_opf: ``dict``
         dictionnary with specific parameters concerning the dispatch optimization (Optimal Power Flow computation)
+    pool: :class:`multiprocessing.Pool` or ``None``
+        pool in which the windows of the dispatch are solved. If None, they are solved one after the other
     """
     def __init__(self,
                  dispatcher,
@@ -36,8 +36,10 @@ class DispatchBackend: # TODO - PypsaDispatchBackend - devra créer un PypsaDisp
                  grid_folder,
                  seed_disp,
                  params,
-                 params_opf):
+                 params_opf,
+                 pool=None):
         self.dispatcher = dispatcher
+        self.pool = pool
         self.params = params
         self.params_opf = params_opf
         self.seed_disp = seed_disp
@@ -57,5 +59,7 @@ class DispatchBackend: # TODO - PypsaDispatchBackend - devra créer un PypsaDisp
             "rampdown_margin","agent_type"**
 
         """
+        # lazy import: pypsa and grid2op are only imported when a dispatch is actually computed
+        from .generate_dispatch import main
         return main(self.dispatcher, self.scenario_folder_path, self.scenario_folder_path,
-                    self.grid_folder, self.seed_disp, self.params, self.params_opf)
+                    self.grid_folder, self.seed_disp, self.params, self.params_opf, pool=self.pool)
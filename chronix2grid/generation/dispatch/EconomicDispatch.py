@@ -18,17 +18,18 @@ from collections import namedtuple
 import pathlib
 from numpy.random import default_rng
 
-import grid2op
-from grid2op.Chronics import ChangeNothing
 import pandas as pd
-import plotly.express as px
 
 from chronix2grid.generation.dispatch.utils import RampMode, add_noise_gen, modify_hydro_ramps, modify_slack_characs
 import chronix2grid.constants as cst
+from chronix2grid.generation import pattern_cache
 
 DispatchResults = namedtuple('DispatchResults', ['chronix', 'terminal_conditions'])
 
 def init_dispatcher_from_config(env_path, input_folder, dispatcher_class, params_opf):
+    # lazy import: grid2op is long to import and only needed here
+    import grid2op
+    from grid2op.Chronics import ChangeNothing
     # Read grid and gens characs
     env118_withoutchron = grid2op.make(env_path,
                                        test=True,
@@ -193,10 +194,7 @@ class Dispatcher(ABC):
         hydro_file_path: ``str``
 
         """
-        dateparse = lambda x: dt.datetime.strptime(x, '%Y-%m-%d %H:%M')
-        hydro_pattern = pd.read_csv(hydro_file_path, usecols=[0, 2, 3],
-                                    parse_dates=[0], date_parser=dateparse)
-        hydro_pattern.set_index(hydro_pattern.columns[0], inplace=True)
+        hydro_pattern = pattern_cache.read_hydro_guide_curves(hydro_file_path)
         hydro_names = self.generators[self.generators.carrier == 'hydro'].index
 
         for extremum in ['min', 'max']:
@@ -250,6 +248,7 @@ class Dispatcher(ABC):
                 raise
 
     def plot_ramps(self):
+        import plotly.express as px  # lazy import: only needed for this plot
         caract_gen = self.generators[['p_nom', 'carrier', 'ramp_limit_up']].reset_index()
         caract_gen = caract_gen.rename(columns={'index': 'name'})
 
@@ -281,7 +280,7 @@ class Dispatcher(ABC):
             print('Saving results for the grids with aggregated generators by carriers...')
             res_load_scenario = self._simplified_chronix_scenario
 
-        path_metadata_failed = os.path.join(output_folder, "DISPATCH_FAILED")
+        path_metadata_failed = os.path.join(output_folder, cst.DISPATCH_FAILED_FILE_NAME)
         if res_load_scenario is None:
             # the backend failed to find a solution
             print('ERROR: the backend failed to find a consistent state. Nothing is saved.')
@@ -379,7 +378,13 @@ class Dispatcher(ABC):
         )
 
 class ChroniXScenario:
-    def __init__(self, loads, prods, res_names, scenario_name, loss=None):
+    def __init__(self, loads, prods, res_names, scenario_name, loss=None, dtype=None):
+        # dtype: floating point type the chronics are cast to, if given (see --dtype)
+        if dtype is not None:
+            loads = loads.astype(dtype, copy=False)
+            prods = prods.astype(dtype, copy=False)
+            if loss is not None:
+                loss = loss.astype(dtype, copy=False)
         self.loads = loads
         self.wind_p = prods[res_names['wind']]
         self.solar_p = prods[res_names['solar']]
@@ -391,9 +396,9 @@ class ChroniXScenario:
 
     @classmethod
     def from_disk(cls, load_path_file, prod_path_file, res_names, scenario_name,
-                  start_date, end_date, dt, loss_path_file=None):
-        loads = pd.read_csv(load_path_file, sep=';')
-        prods = pd.read_csv(prod_path_file, sep=';')
+                  start_date, end_date, dt, loss_path_file=None, dtype=None):
+        loads = pd.read_csv(load_path_file, sep=';', dtype=dtype)
+        prods = pd.read_csv(prod_path_file, sep=';', dtype=dtype)
         if loss_path_file is not None:
             loss = pd.read_csv(loss_path_file, sep=';')
         else:
@@ -404,7 +409,7 @@ class ChroniXScenario:
             freq=str(dt) + 'min')
         loads.index = datetime_index[:len(loads)]
         prods.index = datetime_index[:len(prods)]
-        return cls(loads, prods, res_names, scenario_name, loss)
+        return cls(loads, prods, res_names, scenario_name, loss, dtype=dtype)
 
     def net_load(self, losses_pct, name):
         if self.loss is None:
@@ -20,6 +20,7 @@ from grid2op.Runner import Runner
 from grid2op.Chronics import GridStateFromFile
 
 import chronix2grid.constants as cst
+from chronix2grid import tracing
 
 def move_env_temporarily(scenario_output_folder, grid_path):
 
@@ -72,6 +73,7 @@ def search_chronic_num_from_name(scenario_name, env):
             found_id = id
     return found_id
 
+@tracing.traced('loss simulation')
 def run_grid2op_simulation_donothing(grid_path, agent_result_path,  nb_core = 1,write_results=False,agent_results_path=None):
     """
 
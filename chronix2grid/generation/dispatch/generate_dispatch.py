@@ -13,8 +13,10 @@ import shutil
 import os
 import pathlib
 
+from chronix2grid.utils import accepts_keyword
 
-def main(dispatcher, input_folder, output_folder, grid_folder, seed, params, params_opf):
+
+def main(dispatcher, input_folder, output_folder, grid_folder, seed, params, params_opf, pool=None):
     """
 
     Parameters
@@ -31,6 +33,9 @@ def main(dispatcher, input_folder, output_folder, grid_folder, seed, params, par
         Random seed for parallel execution
     params_opf : dict
         Options for the OPF
+    pool : multiprocessing.Pool
+        Pool in which the windows of the OPF are solved, if the run method of the dispatcher accepts a pool argument.
+        If None, they are solved one after the other
 
     Returns
     -------
@@ -51,7 +56,8 @@ def main(dispatcher, input_folder, output_folder, grid_folder, seed, params, par
         ramp_mode=parse_ramp_mode(params_opf['ramp_mode']),
         by_carrier=params_opf['dispatch_by_carrier'],
         pyomo=params_opf['pyomo'],
-        solver_name=params_opf['solver_name']
+        solver_name=params_opf['solver_name'],
+        **({} if pool is None or not accepts_keyword(dispatcher.run, 'pool') else dict(pool=pool))
     )
     dispatcher.save_results(params, output_folder)
 
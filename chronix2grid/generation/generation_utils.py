@@ -6,10 +6,12 @@
 # SPDX-License-Identifier: MPL-2.0
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
+import bz2
 import datetime as dt
 from functools import partial
 import os
 import re
+import zlib
 
 import numpy as np
 import pandas as pd
@@ -17,6 +19,8 @@ from scipy.interpolate import interp1d
 from numpy.random import default_rng
 
 from ..config import DispatchConfigManager, LoadsConfigManager, ResConfigManager
+import chronix2grid.constants as cst
+from chronix2grid import tracing
 
 
 def make_generation_input_output_directories(input_folder, case, year, output_folder):
@@ -32,6 +36,7 @@ def make_generation_input_output_directories(input_folder, case, year, output_fo
     return dispatch_input_folder, dispatch_input_folder_case, dispatch_output_folder
 
 
+@tracing.traced('noise generation')
 def generate_coarse_noise(prng, params, data_type, add_dim):
     """
     This function generates a spatially and temporally correlated noise.
@@ -44,7 +49,7 @@ def generate_coarse_noise(prng, params, data_type, add_dim):
             precision. Also define the correlation scales
 
     Output:
-        (np.array) 3D autocorrelated noise
+        (np.array) 3D autocorrelated noise, of the dtype given by params (see generation_dtype)
     """
 
     # Get computation domain size
@@ -63,11 +68,137 @@ def generate_coarse_noise(prng, params, data_type, add_dim):
     Nt_comp = int(T // dt_corr + 1) + add_dim
 
     # Generate gaussian noise input·
-    output = prng.normal(0, 1, (Nx_comp, Ny_comp, Nt_comp))
+    # Drawn in float64 whatever the dtype of the generation, so that a seed gives the same noise
+    output = prng.normal(0, 1, (Nx_comp, Ny_comp, Nt_comp)).astype(generation_dtype(params), copy=False)
 
     return output
 
-def interpolate_noise(computation_noise, params, locations, time_scale, add_dim):
+
+def generation_dtype(params):
+    """
+    Floating point type of the generated arrays, given by params["dtype"] (float64 by default, see --dtype)
+    """
+    return np.dtype(params.get('dtype', cst.DEFAULT_DTYPE))
+
+class SparseNoise:
+    """
+    Coarse noise drawn only on some cells of the mesh, see :func:`generate_sparse_coarse_noise`.
+
+    It is indexed like the dense 3D noise of :func:`generate_coarse_noise`, noise[x, y, :], with integer or integer
+    array coordinates of cells it holds.
+
+    Attributes
+    ----------
+    cells: ``list``
+        (x, y) indices of the cells in the coarse mesh
+    values: ``np.array``
+        noise of the cells, of shape (number of cells, number of coarse time steps), possibly with leading dimensions
+        (one noise by scenario, see :func:`stack_noises`)
+    """
+    def __init__(self, cells, values):
+        self.cells = cells
+        self.values = values
+        self._rows = {cell: row for row, cell in enumerate(cells)}
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    @property
+    def shape(self):
+        return self.values.shape[:-2] + (max((x + 1 for x, _ in self.cells), default=0),
+                                         max((y + 1 for _, y in self.cells), default=0),
+                                         self.values.shape[-1])
+
+    def __getitem__(self, key):
+        if key[0] is Ellipsis:
+            key = key[1:]
+        x, y, time_index = key
+        if np.ndim(x) == 0:
+            return self.values[..., self._rows[(int(x), int(y))], time_index]
+        rows = np.array([self._rows[(int(i), int(j))] for i, j in zip(x, y)], dtype=int)
+        return self.values[..., rows, time_index]
+
+
+def stack_noises(noises):
+    """
+    Stacks the coarse noises of several scenarios on the same cells along a new leading dimension, to interpolate them
+    together with :func:`interpolate_noise_batch`
+
+    Input:
+        noises: (list) dense noises, or :class:`SparseNoise` on the same locations
+    """
+    if isinstance(noises[0], SparseNoise):
+        return SparseNoise(noises[0].cells, np.stack([noise.values for noise in noises]))
+    return np.stack(noises)
+
+
+def ensemble_batch_size(n_steps, n_series, max_batch_bytes, n_arrays=4, dtype=float):
+    """
+    Number of scenarios of an ensemble computed together so that their n_arrays arrays of dtype of shape
+    (n_steps, n_series) fit in max_batch_bytes, at least 1
+    """
+    scenario_bytes = n_arrays * n_steps * max(n_series, 1) * np.dtype(dtype).itemsize
+    return max(1, int(max_batch_bytes // scenario_bytes))
+
+
+def coarse_cells(params, locations):
+    """
+    Cells of the coarse mesh used by the spatial interpolation at the given locations: the 4 neighbours of each one
+
+    Input:
+        locations: (tuple of np.array) x and y coordinates of the points of interest
+
+    Output:
+        (list) sorted (x, y) indices of the cells
+    """
+    x, y = (np.asarray(coordinates, dtype=float) for coordinates in locations)
+    x_minus = (x // params['dx_corr']).astype(int)
+    y_minus = (y // params['dy_corr']).astype(int)
+    cells = set()
+    for x_neighbor in [x_minus, x_minus + 1]:
+        for y_neighbor in [y_minus, y_minus + 1]:
+            cells.update(zip(x_neighbor.tolist(), y_neighbor.tolist()))
+    return sorted(cells)
+
+
+@tracing.traced('noise generation')
+def generate_sparse_coarse_noise(seed, params, data_type, locations):
+    """
+    Same noise model as :func:`generate_coarse_noise`, drawn only on the cells of the coarse mesh that are used by the
+    given locations, and without extra time steps.
+
+    The noise of each cell comes from its own random generator, seeded with the seed, the data type and the cell
+    indices: it does not depend on the other cells, hence on the other locations.
+
+    Input:
+        seed: (int) seed of the noise field
+        params: (dict) Defines the mesh dimensions and
+            precision. Also define the correlation scales
+        locations: (tuple of np.array) x and y coordinates of the points of interest
+
+    Output:
+        (SparseNoise) autocorrelated noise on the used cells
+    """
+    Nt_comp = int(params['T'] // params[data_type + '_corr'] + 1)
+    cells = coarse_cells(params, locations)
+    data_type_id = zlib.crc32(data_type.encode())
+    values = np.empty((len(cells), Nt_comp), dtype=generation_dtype(params))
+    for row, (x, y) in enumerate(cells):
+        # locations may be out of the mesh, on cells of negative index
+        values[row] = default_rng([seed, data_type_id, x & 0xFFFFFFFF, y & 0xFFFFFFFF]).normal(0, 1, Nt_comp)
+    return SparseNoise(cells, values)
+
+
+def draw_noise_seed(prng):
+    """
+    Seed of a sparse noise field, drawn from the random generator of the scenario
+    """
+    return int(prng.integers(2 ** 32))
+
+
+@tracing.traced('interpolation')
+def interpolate_noise(computation_noise, params, locations, time_scale, add_dim, time_slice=None):
     """
     This interpolates an autocarrelated noise mesh, to make it more granular.
 
@@ -76,6 +207,7 @@ def interpolate_noise(computation_noise, params, locations, time_scale, add_dim)
         params: (dict) Defines the mesh dimensions and
             precision. Also define the correlation scales
         locations: (dict) Defines the location of the points of interest in the domain
+        time_slice: (slice) If given, only these time steps of the fine mesh are computed
 
     Output:
         (dict of np.array) returns one time series per location mentioned in dict locations
@@ -94,7 +226,8 @@ def interpolate_noise(computation_noise, params, locations, time_scale, add_dim)
     # Compute number of element in each dimension
     Nx_comp = int(Lx // dx_corr + 1) + add_dim
     Ny_comp = int(Ly // dy_corr + 1) + add_dim
-    Nt_comp = int(T // dt_corr + 1) + add_dim
+    # add_dim extra time steps for a dense noise, none for a sparse one
+    Nt_comp = computation_noise.shape[-1]
 
     # Get interpolation temporal mesh size
     dt = params['dt']
@@ -131,6 +264,8 @@ def interpolate_noise(computation_noise, params, locations, time_scale, add_dim)
     # 2nd step : temporal quadratic interpolation
     t_comp = np.linspace(0, int(T), int(Nt_comp), endpoint=True)
     t_inter = np.linspace(0, int(T), int(Nt_inter), endpoint=True)
+    if time_slice is not None:
+        t_inter = t_inter[time_slice]
     if Nt_comp == 2:
         f2 = interp1d(t_comp, output, kind='linear')
     elif Nt_comp == 3:
@@ -143,10 +278,282 @@ def interpolate_noise(computation_noise, params, locations, time_scale, add_dim)
 
     return output
 
+@tracing.traced('interpolation')
+def interpolate_noise_batch(computation_noise, params, locations, time_scale, add_dim, time_slice=None):
+    """
+    Same as :func:`interpolate_noise` for many locations at once: the time series of the neighbours of all the
+    locations are gathered with fancy indexing, weighted and summed as arrays, and a single spline is built and
+    evaluated along the time axis for all the locations. Results are the same as with one call of
+    :func:`interpolate_noise` per location.
+
+    Input:
+        computation_noise: (np.array) Autocorrelated signal computed on a coarse mesh
+        params: (dict) Defines the mesh dimensions and
+            precision. Also define the correlation scales
+        locations: (tuple of np.array) x and y coordinates of the points of interest
+        time_slice: (slice) If given, only these time steps of the fine mesh are computed
+
+    Output:
+        (np.array) one time series per location, of shape (number of locations, number of time steps). If
+            computation_noise has leading dimensions (one noise by scenario, see :func:`stack_noises`), they are
+            kept in front
+    """
+    T = params['T']
+    dx_corr = params['dx_corr']
+    dy_corr = params['dy_corr']
+    # add_dim extra time steps for a dense noise, none for a sparse one
+    Nt_comp = computation_noise.shape[-1]
+    Nt_inter = T // params['dt'] + 1
+
+    x, y = (np.asarray(coordinates, dtype=float) for coordinates in locations)
+
+    # Get coordinates of closest points in the coarse mesh
+    x_minus = (x // dx_corr).astype(int)
+    x_plus = (x // dx_corr + 1).astype(int)
+    y_minus = (y // dy_corr).astype(int)
+    y_plus = (y // dy_corr + 1).astype(int)
+
+    # 1st step : spatial interpolation, neighbours summed in the same order as in interpolate_noise
+    # Computed in the dtype of the noise (see generation_dtype), distances are in float64
+    dtype = computation_noise.dtype
+    output = np.zeros(computation_noise.shape[:-3] + (len(x), Nt_comp), dtype=dtype)
+    dist_tot = np.zeros(len(x))
+    for x_neighbor in [x_minus, x_plus]:
+        for y_neighbor in [y_minus, y_plus]:
+            dist = 1 / (np.sqrt((x - dx_corr * x_neighbor) ** 2 + (y - dy_corr * y_neighbor) ** 2) + 1)
+            output += dist.astype(dtype, copy=False)[:, np.newaxis] * computation_noise[..., x_neighbor, y_neighbor, :]
+            dist_tot += dist
+    output /= dist_tot.astype(dtype, copy=False)[:, np.newaxis]
+
+    # 2nd step : temporal interpolation of all the locations with one spline
+    t_comp = np.linspace(0, int(T), int(Nt_comp), endpoint=True)
+    t_inter = np.linspace(0, int(T), int(Nt_inter), endpoint=True)
+    if time_slice is not None:
+        t_inter = t_inter[time_slice]
+    if Nt_comp == 2:
+        # linear interp1d of a single series goes through np.interp, which rounds differently from the 2-D version
+        output = np.array([np.interp(t_inter, t_comp, series) for series in output.reshape(-1, Nt_comp)]
+                          ).reshape(output.shape[:-1] + (len(t_inter),))
+    elif Nt_comp > 2:
+        f2 = interp1d(t_comp, output, kind='quadratic' if Nt_comp == 3 else 'cubic', axis=-1)
+        output = f2(t_inter)
+
+    # scipy evaluates splines in float64
+    return output.astype(dtype, copy=False)
+
+def split_time_windows(params, time_window):
+    """
+    Splits the horizon of a scenario into consecutive time windows that can be generated independently
+
+    Parameters
+    ----------
+    params: ``dict``
+        generation parameters, with keys "start_date", "end_date" and "dt"
+    time_window: ``str``
+        "week" or "month"
+
+    Returns
+    -------
+    windows: ``list``
+        one tuple (window_id, start, stop) per window. start and stop are the indices of the first and last + 1
+        time steps of the window in the generated chronics
+    """
+    datetime_index = pd.date_range(
+        start=params['start_date'],
+        end=params['end_date'],
+        freq=str(params['dt']) + 'min')
+    # The last time step is only used to compute the forecasts, it is not part of the chronics
+    n_steps = len(datetime_index) - 1
+
+    if time_window == 'week':
+        steps_per_week = 7 * 24 * 60 // int(params['dt'])
+        bounds = list(range(0, n_steps, steps_per_week))
+    elif time_window == 'month':
+        months = datetime_index[:n_steps].year * 12 + datetime_index[:n_steps].month
+        bounds = [0] + list(np.flatnonzero(np.diff(months)) + 1)
+    else:
+        raise ValueError(f'Unknown time window {time_window}, should be one of {cst.TIME_WINDOWS}')
+    bounds.append(n_steps)
+    return [(window_id, int(start), int(stop)) for window_id, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+
+def window_prng(seed, window_id):
+    """
+    Random generator dedicated to one time window of a scenario. It only depends on the seed of the scenario
+    and on the window, so that results do not depend on the number of cores used
+    """
+    if seed is None:
+        raise ValueError('A seed is required to generate a scenario by time windows')
+    return default_rng([int(seed), int(window_id)])
+
+
+def map_windows(func, windows, pool=None):
+    """
+    Applies func to each window, in a pool of processes if one is given. Results are returned in the order of windows
+    """
+    if pool is None:
+        return [func(window) for window in windows]
+    if not tracing.is_enabled():
+        return pool.map(func, windows, chunksize=1)
+    # Spans recorded in the pool are sent back with the results
+    results = []
+    traced_func = partial(_traced_window, func, tracing.get_context())
+    for result, spans in pool.map(traced_func, windows, chunksize=1):
+        tracing.add_spans(spans)
+        results.append(result)
+    return results
+
+
+def iter_windows(func, windows, pool=None):
+    """
+    Same as :func:`map_windows`, but results are yielded in the order of windows, as soon as they are computed. A pool
+    computes at most one window by process at a time, so that memory does not depend on the number of windows
+    """
+    # Pool has no public attribute for its number of processes
+    group_size = 1 if pool is None else pool._processes
+    for start in range(0, len(windows), group_size):
+        yield from map_windows(func, windows[start:start + group_size], pool)
+
+
+class StreamWriter:
+    """
+    Writes chronics block after block (one block by time window) in compressed csv files, without keeping the previous
+    blocks in memory. Files are the same as if the concatenated blocks were written at once.
+
+    Used as a context manager, that closes the files
+
+    Attributes
+    ----------
+    folder: ``str``
+        folder of the files, nothing is written if None
+    file_names: ``list``
+        names of the files without extension
+    """
+    def __init__(self, folder, file_names):
+        self.folder = folder
+        self.file_names = file_names
+        self._files = {}
+        self._with_header = set()
+
+    def __enter__(self):
+        if self.folder is not None:
+            for file_name in self.file_names:
+                self._files[file_name] = bz2.open(os.path.join(self.folder, f'{file_name}.csv.bz2'), 'wt')
+        return self
+
+    def write(self, blocks):
+        """
+        Appends the block of each file
+
+        Parameters
+        ----------
+        blocks: ``dict``
+            :class:`pandas.DataFrame` to append, by file name
+        """
+        for file_name, df in blocks.items():
+            if file_name not in self._files:
+                continue
+            with tracing.span('csv writing', file=file_name):
+                # Header with the first block only
+                df.to_csv(self._files[file_name], index=False, sep=';', header=(file_name not in self._with_header),
+                          float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
+            self._with_header.add(file_name)
+
+    def __exit__(self, *exc_info):
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        return False
+
+
+def _traced_window(func, context, window):
+    tracing.enable()
+    tracing.set_context(**context)
+    tracing.pop_spans()
+    with tracing.span('window', window_id=window[0]):
+        result = func(window)
+    return result, tracing.pop_spans()
+
+
+def window_dataframes(dict_, datetime_index, last_window, reordering=True):
+    """
+    Builds the chronics of one time window and their forecasts from series computed on the time steps of the window
+    plus the first time step of the next window (used for the forecast of the last time step of the window)
+
+    Returns
+    -------
+    df: :class:`pandas.DataFrame`
+    df_forecasted: :class:`pandas.DataFrame`
+        df shifted by one time step
+    """
+    df = pd.DataFrame(dict_, index=datetime_index)
+    df.index.name = 'datetime'
+    if reordering:
+        value = []
+        for name in list(df):
+            value.append(natural_keys(name))
+        new_ordering = [x for _, x in sorted(zip(value, list(df)))]
+        df = df[new_ordering]
+    df_forecasted = df.shift(-1).iloc[:-1]
+    df = df.iloc[:-1]
+    df_forecasted.index = df.index
+    if last_window:
+        # Same as a generation without windows: there is no forecast for the last time step
+        df_forecasted.iloc[-1] = 0.
+    return df, df_forecasted
+
+
 def natural_keys(text):
     return int([ c for c in re.split('(\d+)', text) ][1])
 
 
+def natural_order(names):
+    """
+    Positions of the names in the order of the columns of the written chronics: by the number in the name
+    (see natural_keys), then by name
+    """
+    return sorted(range(len(names)), key=lambda i: (natural_keys(names[i]), names[i]))
+
+
+def assemble_chronics(names, series, datetime_index):
+    """
+    Chronics and forecasted chronics of series computed on datetime_index, in a single pass: columns are ordered once
+    (see natural_order) and the last time step, only used by the forecasts, is dropped
+
+    Input:
+        names: (list) names of the series
+        series: (np.array) of shape (number of time steps, number of series)
+        datetime_index: (pandas.DatetimeIndex) time steps of series
+
+    Output:
+        (list) names in the order of the columns
+        (pandas.DatetimeIndex) time steps of the chronics
+        (np.array) chronics, a copy of series that can be modified in place (for instance to add noise)
+        (np.array) forecasted chronics: the value of the next time step, 0 for the last one
+    """
+    order = natural_order(names)
+    columns = [names[i] for i in order]
+    chronics = series[:-1][:, order]
+    forecasted = np.zeros_like(chronics)
+    forecasted[:-1] = chronics[1:]
+    return columns, pd.DatetimeIndex(datetime_index[:-1], freq=None, name='datetime'), chronics, forecasted
+
+
+def write_chronics(frames, folder):
+    """
+    Writes each chronic in folder as <name>.csv.bz2
+
+    Parameters
+    ----------
+    frames: ``dict``
+        :class:`pandas.DataFrame` by file name
+    """
+    for file_name, df in frames.items():
+        with tracing.span('csv writing', file=file_name):
+            df.to_csv(os.path.join(folder, f'{file_name}.csv.bz2'), index=False, sep=';',
+                      float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
+
+
 def time_parameters(weeks, start_date):
     result = dict()
     start_date = pd.to_datetime(start_date, format='%Y-%m-%d')
@@ -0,0 +1,39 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import os
+
+from chronix2grid.generation import generation_utils as gu
+from .LossBackend import LossBackend
+from .surrogate_loss_model import SurrogateLossModel
+
+
+class SurrogateLossBackend(LossBackend):
+    """
+    Backend that generates loss from the generated load, solar and wind chronics, thanks to a
+    :class:`chronix2grid.generation.loss.surrogate_loss_model.SurrogateLossModel` fitted beforehand on AC power flow
+    simulations (see the chronix2grid-fit-loss-model command). It can be used instead of the AC simulation of the
+    dispatch ("loss_grid2op_simulation" in params_opf.json) when the validation error of the model is acceptable.
+
+    The model is given by "loss_model" in params_loss.json: path of its json file, relative to the case folder. It is
+    read with :class:`chronix2grid.config.SurrogateLossConfigManager`
+    """
+    def run(self):
+        """
+        Evaluates the loss model on the generated chronics and writes loss chronics
+        """
+        self.loss_config_manager.validate_configuration()
+        params_loss = self.loss_config_manager.read_configuration()
+        case_folder = os.path.join(self.loss_config_manager.root_directory,
+                                   self.loss_config_manager.input_directories['params'])
+        model = SurrogateLossModel.from_json(os.path.join(case_folder, params_loss['loss_model']))
+        loss = model.predict(self.load, self.prod_solar, self.prod_wind)
+        loss = loss.astype(gu.generation_dtype(self.params), copy=False)
+        if self.write_results:
+            loss.to_csv(os.path.join(self.scenario_folder_path, 'loss.csv.bz2'), sep=';')
+        return loss
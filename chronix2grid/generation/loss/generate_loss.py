@@ -7,9 +7,10 @@
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
 import os
-import datetime as dt
 import pandas as pd
-import copy
+
+from chronix2grid.generation import pattern_cache
+from chronix2grid.generation import generation_utils as gu
 
 def main(input_folder, output_folder, load, prod_solar, prod_wind, params, params_loss, write_results = True):
     """
@@ -32,23 +33,16 @@ def main(input_folder, output_folder, load, prod_solar, prod_wind, params, param
 
 def generate_valid_loss(loss_pattern_path, params):
     # It is assumed that provided loss_pattern contains the requested time period and time step
-    params = copy.deepcopy(params)
-    
-    # Reading and parsing dates
-    dateparse = lambda x: dt.datetime.strptime(x, '%d/%m/%Y %H:%M')
-    loss_pattern = pd.read_csv(loss_pattern_path,
-                               usecols=[0, 1],
-                               parse_dates=[0],
-                               date_parser=dateparse,
-                               sep = ';')
-    loss_pattern.set_index(loss_pattern.columns[0], inplace=True)
+    # Parsed once per process (see LossPatternStore)
+    loss_pattern = pattern_cache.read_loss_pattern(loss_pattern_path)
 
-    # Extract subset of loss-pattern corresponding to the period studied
-    loss_pattern.index = loss_pattern.index.map(lambda t: t.replace(year=params['year']))  # does not work in some un indentified cases
+    # Extract subset of loss-pattern corresponding to the period studied, whatever the year of the pattern
     datetime_index = pd.date_range(
         start=params['start_date'],
         end=params['end_date'],
         freq=str(params['dt']) + 'min')
-    loss_pattern = loss_pattern.loc[datetime_index]
-    loss_pattern = loss_pattern.head(len(loss_pattern)-1)  # Last value is lonely for another day (same treatment as load and renewable)
-    return pd.Series(loss_pattern[loss_pattern.columns[0]])
+    loss = loss_pattern.select(datetime_index[:-1])  # Last value is lonely for another day (same treatment as load and renewable)
+    if loss.dtype.kind == 'f':
+        # Integer patterns are kept as they are
+        loss = loss.astype(gu.generation_dtype(params), copy=False)
+    return loss
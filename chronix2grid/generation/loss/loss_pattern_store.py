@@ -0,0 +1,131 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""
+Loss pattern indexed by (month, day, minute of the day), so that the loss of any period is a vectorized lookup
+whatever the year of the pattern and of the period.
+
+The csv pattern is parsed once and saved next to it as a binary .npy sidecar named after the hash of the csv content:
+other processes and runs load the sidecar instead of parsing the csv again, and a modified csv gets a new sidecar.
+"""
+
+import glob
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+LOSS_PATTERN_DATE_FORMAT = '%d/%m/%Y %H:%M'
+
+# Leap year: February 29th has a place in the store
+_STORE_SHAPE = (12, 31, 24 * 60)
+
+
+class LossPatternStore:
+    """
+    Values of a loss pattern by (month, day, minute of the day)
+
+    Attributes
+    ----------
+    values: :class:`numpy.ndarray`
+        read-only structured array of shape (12, 31, 1440), with fields "value" (in the dtype of the csv column) and
+        "valid" (False where the pattern has no value)
+    name: ``str``
+        name of the loss column of the csv
+    """
+    def __init__(self, values, name):
+        values.flags.writeable = False
+        self.values = values
+        self.name = name
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Parses a csv loss pattern: a date column (day/month/year hour:minute) and a loss column, separated by ";".
+        If several years are given, the last value of a (month, day, minute) is kept
+        """
+        pattern = pd.read_csv(path, usecols=[0, 1], sep=';')
+        date_column, name = pattern.columns
+        dates = pd.DatetimeIndex(pd.to_datetime(pattern[date_column], format=LOSS_PATTERN_DATE_FORMAT))
+        column = pattern[name].to_numpy()
+        values = np.zeros(_STORE_SHAPE, dtype=[('value', column.dtype), ('valid', bool)])
+        key = _key(dates)
+        values['value'][key] = column
+        values['valid'][key] = True
+        return cls(values, name)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads the sidecar of the csv pattern at path, or parses the csv and writes the sidecar if there is none
+        (silently skipped if the folder of the pattern is read-only)
+        """
+        with open(path, 'rb') as f:
+            content = f.read()
+        name = content.decode().splitlines()[0].split(';')[1]
+        sidecar_path = f'{path}.{hashlib.sha1(content).hexdigest()[:16]}.npy'
+        if os.path.isfile(sidecar_path):
+            try:
+                values = np.load(sidecar_path, allow_pickle=False)
+                if values.shape == _STORE_SHAPE:
+                    return cls(values, name)
+            except (OSError, ValueError, EOFError):
+                pass
+            # Corrupt sidecar: the csv is parsed again, and the sidecar replaced
+
+        store = cls.from_csv(path)
+        try:
+            # Sidecars of previous versions of the csv
+            for old_path in glob.glob(glob.escape(path) + '.*.npy'):
+                if old_path != sidecar_path:
+                    os.remove(old_path)
+            # Each process writes its own temporary file, the sidecar is replaced by a complete file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                            prefix=os.path.basename(path) + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, store.values, allow_pickle=False)
+                os.replace(tmp_path, sidecar_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        except OSError:
+            pass
+        return store
+
+    def select(self, datetime_index):
+        """
+        Loss pattern on datetime_index, whatever its year
+
+        Parameters
+        ----------
+        datetime_index: :class:`pandas.DatetimeIndex`
+
+        Returns
+        -------
+        :class:`pandas.Series`
+            indexed by datetime_index
+
+        Raises
+        ------
+        KeyError
+            if the pattern has no value for some dates of datetime_index
+        """
+        selected = self.values[_key(datetime_index)]
+        if not selected['valid'].all():
+            missing = datetime_index[~selected['valid']]
+            raise KeyError(f'The loss pattern has no value for {len(missing)} dates of the period, '
+                           f'for instance {missing[0]}')
+        index = pd.DatetimeIndex(datetime_index, freq=None, name=None)
+        return pd.Series(selected['value'], index=index, name=self.name)
+
+
+def _key(dates):
+    return dates.month.to_numpy() - 1, dates.day.to_numpy() - 1, (dates.hour * 60 + dates.minute).to_numpy()
@@ -0,0 +1,187 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""
+Regression model of the grid losses, fitted offline on chronics that went through an AC power flow (for instance
+scenarios generated with "loss_grid2op_simulation" or the chronics of a grid2op environment), and evaluated in
+vectorized form by :class:`chronix2grid.generation.loss.SurrogateLossBackend.SurrogateLossBackend`.
+
+In such chronics, the slack generator balances the losses, so that the loss of each time step is the total production
+minus the total load. The model is a least squares fit of a quadratic function of the total load, wind and solar
+productions and of the net injection of a region around the slack, plus hour of the day and season features.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from chronix2grid import constants as cst
+
+INJECTIONS = ['load', 'wind', 'solar', 'slack_region']
+
+
+class SurrogateLossModel:
+    """
+    Attributes
+    ----------
+    coefficients: :class:`numpy.ndarray`
+        coefficients of the features returned by :func:`design_matrix`
+    injections_mean: :class:`numpy.ndarray`
+        mean of the injections (see INJECTIONS) on the training set, used to scale them
+    injections_std: :class:`numpy.ndarray`
+        standard deviation of the injections on the training set
+    slack_region: ``list``
+        names of the loads and generators of the region around the slack
+    validation: ``dict``
+        errors in MW on the held-out chronics (see :func:`validation_errors`)
+    """
+    def __init__(self, coefficients, injections_mean, injections_std, slack_region, validation=None):
+        self.coefficients = np.asarray(coefficients, dtype=float)
+        self.injections_mean = np.asarray(injections_mean, dtype=float)
+        self.injections_std = np.asarray(injections_std, dtype=float)
+        self.slack_region = list(slack_region)
+        self.validation = validation or {}
+
+    @classmethod
+    def fit(cls, scenario_folders, prods_charac, slack_region=(), validation_share=cst.LOSS_MODEL_VALIDATION_SHARE,
+            seed=None):
+        """
+        Fits the model on the chronics of scenario_folders, holding out a share of them to compute its validation error
+
+        Parameters
+        ----------
+        scenario_folders: ``list``
+            folders with load_p.csv.bz2, prod_p.csv.bz2, start_datetime.info and time_interval.info, where prod_p
+            comes from an AC power flow
+        prods_charac: :class:`pandas.DataFrame`
+            characteristics of the generators of the grid, with columns "name" and "type"
+        slack_region: ``list``
+            names of the loads and generators of the region around the slack
+        validation_share: ``float``
+            share of the folders held out for the validation, at least one
+        seed: ``int`` or ``None``
+            seed of the choice of the held-out folders
+
+        Returns
+        -------
+        model: :class:`SurrogateLossModel`
+        """
+        if len(scenario_folders) < 2:
+            raise ValueError('At least 2 scenario folders are needed: one to fit the model, one to validate it')
+        simulations = [read_simulation(folder, prods_charac, slack_region) for folder in scenario_folders]
+        n_validation = min(max(1, int(round(validation_share * len(simulations)))), len(simulations) - 1)
+        validation_ids = set(np.random.default_rng(seed).permutation(len(simulations))[:n_validation])
+
+        train = [simulations[i] for i in range(len(simulations)) if i not in validation_ids]
+        injections = np.concatenate([injections for injections, _, _ in train])
+        std = injections.std(axis=0)
+        model = cls(np.zeros(0), injections.mean(axis=0), np.where(std > 0, std, 1.), slack_region)
+        design = np.concatenate([model.design_matrix(*simulation[:2]) for simulation in train])
+        loss = np.concatenate([loss for _, _, loss in train])
+        model.coefficients = np.linalg.lstsq(design, loss, rcond=None)[0]
+
+        validation = [simulations[i] for i in sorted(validation_ids)]
+        model.validation = validation_errors(
+            np.concatenate([loss for _, _, loss in validation]),
+            np.concatenate([model.predict_injections(*simulation[:2]) for simulation in validation]))
+        model.validation['scenarios'] = [os.path.basename(os.path.normpath(scenario_folders[i]))
+                                         for i in sorted(validation_ids)]
+        return model
+
+    def design_matrix(self, injections, datetime_index):
+        """
+        Features of each time step: constant, scaled injections and their products two by two, sine and cosine of
+        the hour of the day and of the day of the year
+        """
+        scaled = (injections - self.injections_mean) / self.injections_std
+        rows, cols = np.triu_indices(len(INJECTIONS))
+        hour = 2 * np.pi * (datetime_index.hour.to_numpy() * 60 + datetime_index.minute.to_numpy()) / (24 * 60)
+        season = 2 * np.pi * datetime_index.dayofyear.to_numpy() / 365.25
+        return np.column_stack([np.ones(len(scaled)), scaled, scaled[:, rows] * scaled[:, cols],
+                                np.sin(hour), np.cos(hour), np.sin(season), np.cos(season)])
+
+    def predict_injections(self, injections, datetime_index):
+        return self.design_matrix(injections, datetime_index) @ self.coefficients
+
+    def predict(self, load, prod_solar, prod_wind):
+        """
+        Loss of generated chronics
+
+        Parameters
+        ----------
+        load: :class:`pandas.DataFrame`
+            load chronics, indexed by date
+        prod_solar: :class:`pandas.DataFrame`
+        prod_wind: :class:`pandas.DataFrame`
+
+        Returns
+        -------
+        loss: :class:`pandas.Series`
+        """
+        region = set(self.slack_region)
+        region_injection = (prod_solar[[name for name in prod_solar if name in region]].sum(axis=1)
+                            + prod_wind[[name for name in prod_wind if name in region]].sum(axis=1)
+                            - load[[name for name in load if name in region]].sum(axis=1))
+        injections = np.column_stack([load.sum(axis=1), prod_wind.sum(axis=1), prod_solar.sum(axis=1),
+                                      region_injection])
+        return pd.Series(self.predict_injections(injections, pd.DatetimeIndex(load.index)), index=load.index,
+                         name='loss_p')
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(dict(coefficients=self.coefficients.tolist(), injections_mean=self.injections_mean.tolist(),
+                           injections_std=self.injections_std.tolist(), slack_region=self.slack_region,
+                           validation=self.validation), f, indent=4)
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, 'r') as f:
+            return cls(**json.load(f))
+
+
+def read_simulation(folder, prods_charac, slack_region=()):
+    """
+    Injections, dates and losses of chronics that went through an AC power flow
+
+    Returns
+    -------
+    injections: :class:`numpy.ndarray`
+        total load, wind, solar and net injection of the slack region (see INJECTIONS), one row by time step
+    datetime_index: :class:`pandas.DatetimeIndex`
+    loss: :class:`numpy.ndarray`
+        total production minus total load
+    """
+    load = pd.read_csv(os.path.join(folder, 'load_p.csv.bz2'), sep=';')
+    prod = pd.read_csv(os.path.join(folder, 'prod_p.csv.bz2'), sep=';')
+    with open(os.path.join(folder, 'start_datetime.info'), 'r') as f:
+        start_date = pd.to_datetime(f.read().strip(), format='%Y-%m-%d %H:%M')
+    with open(os.path.join(folder, cst.TIME_STEP_FILE_NAME), 'r') as f:
+        time_step = pd.to_timedelta(f.read().strip() + ':00')
+    datetime_index = pd.date_range(start_date, periods=len(load), freq=time_step)
+
+    types = prods_charac.set_index('name')['type']
+    region = set(slack_region)
+    wind = [name for name in prod if types.get(name) == 'wind']
+    solar = [name for name in prod if types.get(name) == 'solar']
+    region_injection = (prod[[name for name in wind + solar if name in region]].sum(axis=1)
+                        - load[[name for name in load if name in region]].sum(axis=1))
+    injections = np.column_stack([load.sum(axis=1), prod[wind].sum(axis=1), prod[solar].sum(axis=1),
+                                  region_injection])
+    return injections, datetime_index, (prod.sum(axis=1) - load.sum(axis=1)).to_numpy()
+
+
+def validation_errors(loss, predicted):
+    """
+    Mean absolute, root mean square and maximum errors in MW, and mean absolute error relative to the mean loss
+    """
+    errors = predicted - loss
+    mae = float(np.abs(errors).mean())
+    return dict(mae=mae, rmse=float(np.sqrt((errors ** 2).mean())), max_error=float(np.abs(errors).max()),
+                relative_mae=mae / float(np.abs(loss).mean()))
@@ -0,0 +1,136 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""
+Per process cache of the patterns that do not depend on the case: load weekly pattern, solar pattern,
+hydro guide curves and loss patterns (as a read-only :class:`LossPatternStore`).
+
+A process that generates several scenarios (or several cases in a batch run) reads each pattern file once. Entries are
+identified by the path, modification time and size of the file, so a modified file is read again. Readers always
+return a copy, since some generation functions modify the patterns in place.
+"""
+
+import collections
+import datetime as dt
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import chronix2grid.constants as cst
+from chronix2grid.generation.loss.loss_pattern_store import LossPatternStore
+
+
+def file_identity(path):
+    """
+    Identifies the content of a file without reading it: absolute path, modification time and size
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+
+class BoundedCache:
+    """
+    Least recently used cache with a maximum number of entries
+
+    Attributes
+    ----------
+    max_entries: ``int``
+    hits: ``int``
+        number of values found in the cache
+    misses: ``int``
+        number of values that had to be computed
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        # Computed out of the lock: two threads may read the same file once each, which is harmless
+        value = compute()
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = BoundedCache(cst.PATTERN_CACHE_MAX_ENTRIES)
+
+
+def _cached(kind, path, read):
+    return _cache.get_or_compute((kind, file_identity(path)), lambda: read(path))
+
+
+def _read_hydro_guide_curves(path):
+    dateparse = lambda x: dt.datetime.strptime(x, '%Y-%m-%d %H:%M')
+    hydro_pattern = pd.read_csv(path, usecols=[0, 2, 3], parse_dates=[0], date_parser=dateparse)
+    hydro_pattern.set_index(hydro_pattern.columns[0], inplace=True)
+    return hydro_pattern
+
+
+def read_load_weekly_pattern(path):
+    return _cached('load_weekly_pattern', path, pd.read_csv).copy()
+
+
+def read_solar_pattern(path):
+    return _cached('solar_pattern', path, np.load).copy()
+
+
+def read_hydro_guide_curves(path):
+    return _cached('hydro_guide_curves', path, _read_hydro_guide_curves).copy()
+
+
+def read_loss_pattern(path):
+    # The store is read-only, no need for a copy
+    return _cached('loss_pattern', path, LossPatternStore.load)
+
+
+def warm(patterns_folder, loss_patterns=()):
+    """
+    Reads the patterns found in patterns_folder, for instance in the main process before a pool of processes is
+    forked, so that the processes start with a filled cache
+
+    Parameters
+    ----------
+    patterns_folder: ``str``
+    loss_patterns: ``list``
+        file names of the loss patterns to read, as given by "loss_pattern" in params_loss.json of the cases
+    """
+    readers = [(read_load_weekly_pattern, 'load_weekly_pattern.csv'),
+               (read_solar_pattern, 'solar_pattern.npy'),
+               (read_hydro_guide_curves, 'hydro_french.csv')]
+    readers += [(read_loss_pattern, file_name) for file_name in loss_patterns]
+    for read, file_name in readers:
+        path = os.path.join(patterns_folder, file_name)
+        if os.path.isfile(path):
+            read(path)
+
+
+def clear():
+    _cache.clear()
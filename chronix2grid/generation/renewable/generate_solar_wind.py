@@ -8,6 +8,7 @@
 
 import os
 import json
+from functools import partial
 
 # Other Python libraries
 import pandas as pd
@@ -18,6 +19,227 @@ from numpy.random import default_rng
 from . import solar_wind_utils as swutils
 from .. import generation_utils as utils
 import chronix2grid.constants as cst
+from chronix2grid import tracing
+
+
+def compute_coarse_noises(prng, params, prods_charac):
+    """
+    Generates the coarse spatio-temporal noises shared by all the solar and wind generators of the grid
+
+    Returns
+    -------
+    noises: ``dict``
+        3D autocorrelated noises, with keys "solar", "long_wind", "medium_wind" and "short_wind". If
+        params["sparse_noise"] is set, they are :class:`chronix2grid.generation.generation_utils.SparseNoise`
+        on the cells used by the solar (resp. wind) generators only
+    add_dim: ``int``
+        number of extra cells added to each dimension of the coarse mesh so that it contains all the generators
+    """
+    scale_solar_coord_for_correlation = float(params["scale_solar_coord_for_correlation"]) if "scale_solar_coord_for_correlation" in params else None
+    add_dim = 0
+    dx_corr = int(params['dx_corr'])
+    dy_corr = int(params['dy_corr'])
+    for x, y, type_gen  in zip(prods_charac["x"], prods_charac["y"], prods_charac["type"]):
+        if type_gen == "solar" and scale_solar_coord_for_correlation is not None:
+            x = scale_solar_coord_for_correlation * x
+            y = scale_solar_coord_for_correlation * y
+        x_plus = int(x // dx_corr + 1)
+        y_plus = int(y // dy_corr + 1)
+        add_dim = max(y_plus, add_dim)
+        add_dim = max(x_plus, add_dim)
+    noises = {}
+    if params.get('sparse_noise'):
+        types = prods_charac['type'].values
+        locations = {}
+        for type_gen in ['solar', 'wind']:
+            x = prods_charac['x'].values[types == type_gen].astype(float)
+            y = prods_charac['y'].values[types == type_gen].astype(float)
+            if type_gen == 'solar' and scale_solar_coord_for_correlation is not None:
+                x = scale_solar_coord_for_correlation * x
+                y = scale_solar_coord_for_correlation * y
+            locations[type_gen] = (x, y)
+        for data_type in ['solar', 'long_wind', 'medium_wind', 'short_wind']:
+            noises[data_type] = utils.generate_sparse_coarse_noise(
+                utils.draw_noise_seed(prng), params, data_type, locations[data_type.split('_')[-1]])
+        return noises, add_dim
+    for data_type in ['solar', 'long_wind', 'medium_wind', 'short_wind']:
+        noises[data_type] = utils.generate_coarse_noise(prng, params, data_type, add_dim=add_dim)
+    return noises, add_dim
+
+
+def compute_prods_series(prng, params, prods_charac, solar_pattern, noises, add_dim, time_slice=None,
+                         by_generator=False):
+    """
+    Computes the solar and wind series of every generator from the coarse noises
+
+    Generators are split by type once, and the series of all the solar (resp. wind) generators are computed together
+    (see :func:`chronix2grid.generation.renewable.solar_wind_utils.compute_solar_series_batch`). Random numbers are
+    drawn in the same order as when generators are computed one after the other, so that a seed gives the same
+    chronics as with previous versions.
+
+    Parameters
+    ----------
+    by_generator: ``bool``
+        if True, use the legacy loop on the generators (:func:`compute_prods_series_by_generator`). Set by
+        params["by_generator"] in the generation functions
+
+    Returns
+    -------
+    prods_series: ``dict``
+        series of all the solar and wind generators, by name
+    solar_series: ``dict``
+        series of the solar generators, by name
+    wind_series: ``dict``
+        series of the wind generators, by name
+    """
+    if by_generator:
+        return compute_prods_series_by_generator(prng, params, prods_charac, solar_pattern, noises, add_dim,
+                                                 time_slice=time_slice)
+    solar_names, solar_matrix, wind_names, wind_matrix = compute_prods_matrices(
+        prng, params, prods_charac, solar_pattern, noises, add_dim, time_slice=time_slice)
+    return split_series(prods_charac, solar_names, solar_matrix, wind_names, wind_matrix)
+
+
+def compute_prods_matrices(prng, params, prods_charac, solar_pattern, noises, add_dim, time_slice=None,
+                           by_generator=False):
+    """
+    Computes the series of all the solar generators together, then of all the wind generators
+
+    Parameters
+    ----------
+    prng: :class:`numpy.random.Generator` or ``list``
+        one generator by scenario if the noises have a leading scenario dimension (see :func:`main_ensemble`)
+    by_generator: ``bool``
+        if True, the series are computed by the legacy loop on the generators
+        (:func:`compute_prods_series_by_generator`), for one scenario only
+
+    Returns
+    -------
+    solar_names: ``list``
+    solar_matrix: ``np.array`` or ``None``
+        shape (solar generators, time steps), after the scenario dimension if any. None without solar generator
+    wind_names: ``list``
+    wind_matrix: ``np.array`` or ``None``
+        shape (wind generators, time steps), after the scenario dimension if any. None without wind generator
+    """
+    if by_generator:
+        if isinstance(prng, list):
+            raise ValueError('The legacy loop on the generators computes one scenario at a time')
+        _, solar_series, wind_series = compute_prods_series_by_generator(prng, params, prods_charac, solar_pattern,
+                                                                         noises, add_dim, time_slice=time_slice)
+        return (list(solar_series), np.array(list(solar_series.values())) if solar_series else None,
+                list(wind_series), np.array(list(wind_series.values())) if wind_series else None)
+
+    smoothdist = params['smoothdist']
+    scale_solar_coord_for_correlation = float(params["scale_solar_coord_for_correlation"]) if "scale_solar_coord_for_correlation" in params else None
+
+    types = prods_charac['type'].values
+    solar = prods_charac[types == 'solar']
+    wind = prods_charac[types == 'wind']
+    solar_matrix = None
+    if len(solar):
+        solar_matrix = swutils.compute_solar_series_batch(
+            (solar['x'].values, solar['y'].values),
+            solar['Pmax'].values,
+            noises['solar'],
+            params, solar_pattern,
+            time_scale=params['solar_corr'],
+            add_dim=add_dim,
+            scale_solar_coord_for_correlation=scale_solar_coord_for_correlation,
+            time_slice=time_slice)
+    wind_matrix = None
+    if len(wind):
+        wind_matrix = swutils.compute_wind_series_batch(
+            prng,
+            (wind['x'].values, wind['y'].values),
+            wind['Pmax'].values,
+            noises['long_wind'],
+            noises['medium_wind'],
+            noises['short_wind'],
+            params, smoothdist,
+            add_dim=add_dim,
+            time_slice=time_slice)
+    return list(solar['name']), solar_matrix, list(wind['name']), wind_matrix
+
+
+def split_series(prods_charac, solar_names, solar_matrix, wind_names, wind_matrix):
+    """
+    Series by generator name of the matrices of one scenario returned by :func:`compute_prods_matrices`
+
+    Returns
+    -------
+    Same as :func:`compute_prods_series`
+    """
+    solar_series = dict(zip(solar_names, solar_matrix)) if solar_matrix is not None else {}
+    wind_series = dict(zip(wind_names, wind_matrix)) if wind_matrix is not None else {}
+
+    # In the order of the generators
+    prods_series = {}
+    for name, type_gen in zip(prods_charac['name'], prods_charac['type'].values):
+        if type_gen == 'solar':
+            prods_series[name] = solar_series[name]
+        elif type_gen == 'wind':
+            prods_series[name] = wind_series[name]
+    return prods_series, solar_series, wind_series
+
+
+def compute_prods_series_by_generator(prng, params, prods_charac, solar_pattern, noises, add_dim, time_slice=None):
+    """
+    Computes the solar and wind series of the generators one after the other. Reference implementation of
+    :func:`compute_prods_series`, with the same results
+
+    Returns
+    -------
+    prods_series: ``dict``
+        series of all the solar and wind generators, by name
+    solar_series: ``dict``
+        series of the solar generators, by name
+    wind_series: ``dict``
+        series of the wind generators, by name
+    """
+    smoothdist = params['smoothdist']
+    scale_solar_coord_for_correlation = float(params["scale_solar_coord_for_correlation"]) if "scale_solar_coord_for_correlation" in params else None
+    prods_series = {}
+    for name in prods_charac['name']:
+        mask = (prods_charac['name'] == name)
+        if prods_charac[mask]['type'].values == 'solar':
+            locations = [prods_charac[mask]['x'].values[0], prods_charac[mask]['y'].values[0]]
+            Pmax = prods_charac[mask]['Pmax'].values[0]
+            prods_series[name] = swutils.compute_solar_series(
+                prng,
+                locations,
+                Pmax,
+                noises['solar'],
+                params, solar_pattern, smoothdist,
+                time_scale=params['solar_corr'],
+                add_dim=add_dim,
+                scale_solar_coord_for_correlation=scale_solar_coord_for_correlation,
+                time_slice=time_slice)
+
+        elif prods_charac[mask]['type'].values == 'wind':
+            locations = [prods_charac[mask]['x'].values[0], prods_charac[mask]['y'].values[0]]
+            Pmax = prods_charac[mask]['Pmax'].values[0]
+            prods_series[name] = swutils.compute_wind_series(
+                prng,
+                locations,
+                Pmax,
+                noises['long_wind'],
+                noises['medium_wind'],
+                noises['short_wind'],
+                params, smoothdist,
+                add_dim=add_dim,
+                time_slice=time_slice)
+
+    # Séparation ds séries solaires et éoliennes
+    solar_series = {}
+    wind_series = {}
+    for name in prods_charac['name']:
+        mask = (prods_charac['name'] == name)
+        if prods_charac[mask]['type'].values == 'solar':
+            solar_series[name] = prods_series[name]
+        elif prods_charac[mask]['type'].values == 'wind':
+            wind_series[name] = prods_series[name]
+    return prods_series, solar_series, wind_series
 
 
 def main(scenario_destination_path, seed, params, prods_charac, solar_pattern, write_results = True):
@@ -44,7 +266,6 @@ def main(scenario_destination_path, seed, params, prods_charac, solar_pattern, w
     """
 
     prng = default_rng(seed)
-    smoothdist = params['smoothdist']
 
     # Define datetime indices
     datetime_index = pd.date_range(
@@ -67,132 +288,231 @@ def main(scenario_destination_path, seed, params, prods_charac, solar_pattern, w
 
     # Generate GLOBAL temperature noise
     print('Computing global auto-correlated spatio-temporal noise for sun and wind...')
-    scale_solar_coord_for_correlation = float(params["scale_solar_coord_for_correlation"]) if "scale_solar_coord_for_correlation" in params else None
-    add_dim = 0
-    dx_corr = int(params['dx_corr'])
-    dy_corr = int(params['dy_corr'])
-    for x, y, type_gen  in zip(prods_charac["x"], prods_charac["y"], prods_charac["type"]):
-        if type_gen == "solar" and scale_solar_coord_for_correlation is not None:
-            x = scale_solar_coord_for_correlation * x
-            y = scale_solar_coord_for_correlation * y
-        x_plus = int(x // dx_corr + 1)
-        y_plus = int(y // dy_corr + 1)
-        add_dim = max(y_plus, add_dim)
-        add_dim = max(x_plus, add_dim)
-    solar_noise = utils.generate_coarse_noise(prng, params, 'solar', add_dim=add_dim)
-    long_scale_wind_noise = utils.generate_coarse_noise(prng, params, 'long_wind', add_dim=add_dim)
-    medium_scale_wind_noise = utils.generate_coarse_noise(prng, params, 'medium_wind', add_dim=add_dim)
-    short_scale_wind_noise = utils.generate_coarse_noise(prng, params, 'short_wind', add_dim=add_dim)
+    noises, add_dim = compute_coarse_noises(prng, params, prods_charac)
 
     # Compute Wind and solar series of scenario
     print('Generating solar and wind production chronics')
-    prods_series = {}
-    for name in prods_charac['name']:
-        mask = (prods_charac['name'] == name)
-        if prods_charac[mask]['type'].values == 'solar':
-            locations = [prods_charac[mask]['x'].values[0], prods_charac[mask]['y'].values[0]]
-            Pmax = prods_charac[mask]['Pmax'].values[0]
-            prods_series[name] = swutils.compute_solar_series(
-                prng,
-                locations,
-                Pmax,
-                solar_noise,
-                params, solar_pattern, smoothdist,
-                time_scale=params['solar_corr'],
-                add_dim=add_dim,
-                scale_solar_coord_for_correlation=scale_solar_coord_for_correlation)
+    solar_names, solar_matrix, wind_names, wind_matrix = compute_prods_matrices(
+        prng, params, prods_charac, solar_pattern, noises, add_dim, by_generator=bool(params.get('by_generator')))
 
-        elif prods_charac[mask]['type'].values == 'wind':
-            locations = [prods_charac[mask]['x'].values[0], prods_charac[mask]['y'].values[0]]
-            Pmax = prods_charac[mask]['Pmax'].values[0]
-            prods_series[name] = swutils.compute_wind_series(
-                prng,
-                locations,
-                Pmax,
-                long_scale_wind_noise,
-                medium_scale_wind_noise,
-                short_scale_wind_noise,
-                params, smoothdist,
-                add_dim=add_dim)
+    return write_prods(prng, solar_names, solar_matrix, wind_names, wind_matrix, datetime_index,
+                       scenario_destination_path, params, prods_charac, write_results)
 
-    # Séparation ds séries solaires et éoliennes
-    solar_series = {}
-    wind_series = {}
-    for name in prods_charac['name']:
-        mask = (prods_charac['name'] == name)
-        if prods_charac[mask]['type'].values == 'solar':
-            solar_series[name] = prods_series[name]
-        elif prods_charac[mask]['type'].values == 'wind':
-            wind_series[name] = prods_series[name]
 
-    # Time index
-    prods_series['datetime'] = datetime_index
-    solar_series['datetime'] = datetime_index
-    wind_series['datetime'] = datetime_index
+def write_prods(prng, solar_names, solar_matrix, wind_names, wind_matrix, datetime_index, scenario_destination_path,
+                params, prods_charac, write_results=True):
+    """
+    Adds the gaussian noise of the scenario to the solar and wind productions and writes them with their forecasts
+    (see :func:`chronix2grid.generation.renewable.solar_wind_utils.assemble_prods`)
 
+    Parameters
+    ----------
+    solar_names, solar_matrix, wind_names, wind_matrix: as returned by :func:`compute_prods_matrices` for one scenario
+
+    Returns
+    -------
+    Same as :func:`main`
+    """
     # Save files
     if scenario_destination_path is not None:
         print('Saving files in zipped csv')
         if not os.path.exists(scenario_destination_path):
             os.makedirs(scenario_destination_path)
-            
-    prod_solar_forecasted =  swutils.create_csv(
-        prng,
-        solar_series,
-        os.path.join(scenario_destination_path, 'solar_p_forecasted.csv.bz2') if scenario_destination_path is not None else None,
-        reordering=True,
-        shift=True,
-        write_results=write_results,
-        index=False
-    )
-
-    prod_solar = swutils.create_csv(
-        prng,
-        solar_series,
-        os.path.join(scenario_destination_path, 'solar_p.csv.bz2') if scenario_destination_path is not None else None,
-        reordering=True,
-        noise=params['planned_std'],
-        write_results=write_results
-    )
-
-    prod_wind_forecasted = swutils.create_csv(
-        prng,
-        wind_series,
-        os.path.join(scenario_destination_path, 'wind_p_forecasted.csv.bz2') if scenario_destination_path is not None else None,
-        reordering=True,
-        shift=True,
-        write_results=write_results,
-        index=False
-    )
-
-    prod_wind = swutils.create_csv(
-        prng,
-        wind_series, os.path.join(scenario_destination_path, 'wind_p.csv.bz2') if scenario_destination_path is not None else None,
-        reordering=True,
-        noise=params['planned_std'],
-        write_results=write_results
-    )
-
-    prod_p = swutils.create_csv(
-        prng,
-        prods_series, os.path.join(scenario_destination_path, 'prod_p.csv.bz2') if scenario_destination_path is not None else None,
-        reordering=True,
-        noise=params['planned_std'],
-        write_results=write_results
-    )
 
+    chronics = swutils.assemble_prods(prng, solar_names, solar_matrix, wind_names, wind_matrix, datetime_index,
+                                      params['planned_std'], dtype=utils.generation_dtype(params))
+    if write_results:
+        utils.write_chronics(chronics, scenario_destination_path)
+    write_prod_v(scenario_destination_path, prods_charac, len(chronics['prod_p']), write_results)
+
+    return (chronics['solar_p'], chronics['solar_p_forecasted'],
+            chronics['wind_p'], chronics['wind_p_forecasted'])
+
+
+def main_ensemble(scenario_destination_paths, seeds, params, prods_charac, solar_pattern, write_results=True,
+                  max_batch_bytes=cst.ENSEMBLE_MAX_BATCH_BYTES):
+    """
+    Same as :func:`main` for several scenarios of the same period, computed together by batches: the coarse noises
+    of a batch are stacked along a leading scenario dimension and interpolated in one pass, and the solar pattern is
+    interpolated once.
+
+    Each scenario gives the same chronics as :func:`main` with its own seed.
+
+    Parameters
+    ----------
+    scenario_destination_paths (list): where the results of each scenario are written
+    seeds (list): random seed of each scenario
+    max_batch_bytes (int): memory allowed to the productions of the scenarios computed together
+
+    Returns
+    -------
+    list: prod_solar, prod_solar_forecasted, prod_wind and prod_wind_forecasted of each scenario, as returned by
+    :func:`main`
+    """
+    if params.get('by_generator'):
+        # The legacy loop on the generators computes one scenario at a time
+        return [main(scenario_destination_path, seed, params, prods_charac, solar_pattern, write_results)
+                for scenario_destination_path, seed in zip(scenario_destination_paths, seeds)]
+    datetime_index = pd.date_range(
+        start=params['start_date'],
+        end=params['end_date'],
+        freq=str(params['dt']) + 'min')
+    solar_pattern = solar_pattern[:-1]
+    batch_size = utils.ensemble_batch_size(len(datetime_index), len(prods_charac), max_batch_bytes,
+                                           dtype=utils.generation_dtype(params))
+    print('Generating solar and wind production chronics of ' + str(len(seeds)) + ' scenarios by batches of '
+          + str(batch_size))
+
+    results = []
+    for batch_start in range(0, len(seeds), batch_size):
+        prngs = [default_rng(seed) for seed in seeds[batch_start:batch_start + batch_size]]
+        scenario_noises = [compute_coarse_noises(prng, params, prods_charac) for prng in prngs]
+        add_dim = scenario_noises[0][1]
+        noises = {data_type: utils.stack_noises([noise[data_type] for noise, _ in scenario_noises])
+                  for data_type in scenario_noises[0][0]}
+        solar_names, solar_matrix, wind_names, wind_matrix = compute_prods_matrices(
+            prngs, params, prods_charac, solar_pattern, noises, add_dim)
+        for i, prng in enumerate(prngs):
+            results.append(write_prods(prng, solar_names, solar_matrix[i] if solar_matrix is not None else None,
+                                       wind_names, wind_matrix[i] if wind_matrix is not None else None,
+                                       datetime_index, scenario_destination_paths[batch_start + i], params,
+                                       prods_charac, write_results))
+    return results
+
+
+def prod_v_chronics(prods_charac, n_steps):
+    """
+    Voltage setpoints of the generators, constant over the n_steps time steps
+    """
     prod_v = prods_charac[['name', 'V']].set_index('name')
     prod_v = prod_v.T
     prod_v.index = [0]
-    prod_v = prod_v.reindex(range(len(prod_p)))
+    prod_v = prod_v.reindex(range(n_steps))
     prod_v = prod_v.fillna(method='ffill') * 1.04
+    return prod_v
+
+
+def write_prod_v(scenario_destination_path, prods_charac, n_steps, write_results=True):
+    prod_v = prod_v_chronics(prods_charac, n_steps)
     
     if write_results:
-        prod_v.to_csv(
-            os.path.join(scenario_destination_path, 'prod_v.csv.bz2') if scenario_destination_path is not None else None,
-            sep=';',
-            index=False,
-            float_format=cst.FLOATING_POINT_PRECISION_FORMAT
-        )
-
-    return prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted
\ No newline at end of file
+        with tracing.span('csv writing', file='prod_v'):
+            prod_v.to_csv(
+                os.path.join(scenario_destination_path, 'prod_v.csv.bz2') if scenario_destination_path is not None else None,
+                sep=';',
+                index=False,
+                float_format=cst.FLOATING_POINT_PRECISION_FORMAT
+            )
+    return prod_v
+
+
+def main_by_windows(scenario_destination_path, seed, params, prods_charac, solar_pattern, time_window,
+                    pool=None, write_results=True, stream=False):
+    """
+    Same as :func:`main`, but the horizon of the scenario is split into time windows (weeks or months) that are
+    generated independently, possibly in a pool of processes.
+
+    The coarse solar and wind noises are generated once for the whole horizon with the seed of the scenario, so that
+    the chronics are continuous between two windows. The other random draws of each window come from its own random
+    generator (see :func:`chronix2grid.generation.generation_utils.window_prng`): results only depend on the seed and
+    on the windows, not on the number of processes.
+
+    Parameters
+    ----------
+    time_window (str): "week" or "month"
+    pool (multiprocessing.Pool): pool in which windows are generated. If None, they are generated one after the other
+    stream (bool): if True, each window is written as soon as it is generated and then released, so that memory
+        does not depend on the length of the horizon. Chronics are not returned
+
+    Returns
+    -------
+    Same as :func:`main`, None for each chronic if stream
+    """
+    windows = utils.split_time_windows(params, time_window)
+    print('Generating solar and wind production chronics by ' + str(time_window) + ' (' + str(len(windows)) + ' windows)')
+    # Drawn once for the whole horizon, and shared by the windows
+    coarse_noises = compute_coarse_noises(default_rng(seed), params, prods_charac)
+    generate_window = partial(main_window, seed, params, prods_charac, solar_pattern, len(windows), coarse_noises)
+    if stream:
+        stream_windows(scenario_destination_path, prods_charac, generate_window, windows, pool, write_results)
+        return None, None, None, None
+    results = utils.map_windows(generate_window, windows, pool)
+
+    (prod_solar, prod_solar_forecasted, prod_wind,
+     prod_wind_forecasted, prod_p) = [pd.concat(dfs) for dfs in zip(*results)]
+
+    if scenario_destination_path is not None:
+        print('Saving files in zipped csv')
+        if not os.path.exists(scenario_destination_path):
+            os.makedirs(scenario_destination_path)
+    if write_results:
+        for df, file_name in [(prod_solar_forecasted, 'solar_p_forecasted'), (prod_solar, 'solar_p'),
+                              (prod_wind_forecasted, 'wind_p_forecasted'), (prod_wind, 'wind_p'),
+                              (prod_p, 'prod_p')]:
+            with tracing.span('csv writing', file=file_name):
+                df.to_csv(os.path.join(scenario_destination_path, f'{file_name}.csv.bz2'), index=False, sep=';',
+                          float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
+    write_prod_v(scenario_destination_path, prods_charac, len(prod_p), write_results)
+
+    return prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted
+
+
+def stream_windows(scenario_destination_path, prods_charac, generate_window, windows, pool=None, write_results=True):
+    """
+    Generates the productions window after window with generate_window (see :func:`main_window`) and appends them
+    to the files of the scenario, the same as the ones written by :func:`main_by_windows`
+    """
+    if scenario_destination_path is not None and write_results:
+        print('Saving files in zipped csv')
+        if not os.path.exists(scenario_destination_path):
+            os.makedirs(scenario_destination_path)
+    folder = scenario_destination_path if write_results else None
+    file_names = ['solar_p_forecasted', 'solar_p', 'wind_p_forecasted', 'wind_p', 'prod_p', 'prod_v']
+    with utils.StreamWriter(folder, file_names) as writer:
+        for (prod_solar, prod_solar_forecasted, prod_wind,
+             prod_wind_forecasted, prod_p) in utils.iter_windows(generate_window, windows, pool):
+            writer.write(dict(solar_p_forecasted=prod_solar_forecasted, solar_p=prod_solar,
+                              wind_p_forecasted=prod_wind_forecasted, wind_p=prod_wind, prod_p=prod_p,
+                              prod_v=prod_v_chronics(prods_charac, len(prod_p))))
+
+
+def main_window(seed, params, prods_charac, solar_pattern, n_windows, coarse_noises, window):
+    """
+    Generates the solar and wind productions of one time window, as returned by
+    :func:`chronix2grid.generation.generation_utils.split_time_windows`
+
+    coarse_noises are the solar and wind noises of the whole horizon and their additional dimension, as returned by
+    :func:`compute_coarse_noises` with the seed of the scenario
+
+    Returns
+    -------
+    tuple of pandas.DataFrame: prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted, prod_p on the window
+    """
+    window_id, start, stop = window
+    datetime_index = pd.date_range(
+        start=params['start_date'],
+        end=params['end_date'],
+        freq=str(params['dt']) + 'min')
+    solar_pattern = solar_pattern[:-1]
+
+    # Same global noises as in function main, whatever the window
+    noises, add_dim = coarse_noises
+    prng = utils.window_prng(seed, window_id)
+
+    # One more time step than the window, for the forecast of its last time step
+    time_slice = slice(start, stop + 1)
+    _, solar_series, wind_series = compute_prods_series(prng, params, prods_charac, solar_pattern,
+                                                        noises, add_dim, time_slice=time_slice,
+                                                        by_generator=bool(params.get('by_generator')))
+    last_window = (window_id == n_windows - 1)
+    prod_solar, prod_solar_forecasted = utils.window_dataframes(solar_series, datetime_index[time_slice], last_window)
+    prod_wind, prod_wind_forecasted = utils.window_dataframes(wind_series, datetime_index[time_slice], last_window)
+
+    noise = params['planned_std']
+    dtype = utils.generation_dtype(params)
+    prod_solar = prod_solar * (1 + noise * prng.normal(0, 1, prod_solar.shape)).astype(dtype, copy=False)
+    prod_wind = prod_wind * (1 + noise * prng.normal(0, 1, prod_wind.shape)).astype(dtype, copy=False)
+    # Same noise as solar_p and wind_p (see solar_wind_utils.assemble_prods)
+    prod_p = pd.concat([prod_solar, prod_wind], axis=1)
+    prod_p = prod_p.iloc[:, utils.natural_order(list(prod_p.columns))]
+    return prod_solar, prod_solar_forecasted, prod_wind, prod_wind_forecasted, prod_p
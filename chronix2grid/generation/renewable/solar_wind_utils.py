@@ -7,6 +7,8 @@
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
 import copy
+import hashlib
+import os
 
 import numpy as np
 import pandas as pd
@@ -14,31 +16,41 @@ from scipy.interpolate import interp1d
 
 from .. import generation_utils as utils
 import chronix2grid.constants as cst
+from chronix2grid import tracing
+from chronix2grid.generation.pattern_cache import BoundedCache
 
-def compute_wind_series(prng, locations, Pmax, long_noise, medium_noise, short_noise, params, smoothdist, add_dim):
+_solar_pattern_cache = BoundedCache(cst.SOLAR_PATTERN_CACHE_MAX_ENTRIES)
+
+def compute_wind_series(prng, locations, Pmax, long_noise, medium_noise, short_noise, params, smoothdist, add_dim,
+                        time_slice=None):
     # Compute refined signals
     long_scale_signal = utils.interpolate_noise(
         long_noise,
         params,
         locations,
         time_scale=params['long_wind_corr'],
-        add_dim=add_dim)
+        add_dim=add_dim,
+        time_slice=time_slice)
     medium_scale_signal = utils.interpolate_noise(
         medium_noise,
         params,
         locations,
         time_scale=params['medium_wind_corr'],
-        add_dim=add_dim)
+        add_dim=add_dim,
+        time_slice=time_slice)
     short_scale_signal = utils.interpolate_noise(
         short_noise,
         params,
         locations,
         time_scale=params['short_wind_corr'],
-        add_dim=add_dim)
+        add_dim=add_dim,
+        time_slice=time_slice)
 
     # Compute seasonal pattern
     Nt_inter = int(params['T'] // params['dt'] + 1)
     t = np.linspace(0, params['T'], Nt_inter, endpoint=True)
+    if time_slice is not None:
+        t = t[time_slice]
     start_min = int(
         pd.Timedelta(params['start_date'] - pd.to_datetime('2018/01/01', format='%Y-%m-%d')).total_seconds() // 60)
     seasonal_pattern = np.cos((2 * np.pi / (365 * 24 * 60)) * (t - 30 * 24 * 60 - start_min))
@@ -60,15 +72,16 @@ def compute_wind_series(prng, locations, Pmax, long_noise, medium_noise, short_n
     wind_series[wind_series > 0.95 * Pmax] = 0.95 * Pmax
     return wind_series
 
-def compute_solar_series(prng, locations, Pmax, solar_noise, params, solar_pattern, smoothdist, time_scale, add_dim, scale_solar_coord_for_correlation=None):
+def compute_solar_series(prng, locations, Pmax, solar_noise, params, solar_pattern, smoothdist, time_scale, add_dim, scale_solar_coord_for_correlation=None,
+                         time_slice=None):
 
     # Compute noise at desired locations
     if scale_solar_coord_for_correlation is not None:
         locations = [float(scale_solar_coord_for_correlation) * float(locations[0]), float(scale_solar_coord_for_correlation) * float(locations[1])]
-    final_noise = utils.interpolate_noise(solar_noise, params, locations, time_scale, add_dim=add_dim)
+    final_noise = utils.interpolate_noise(solar_noise, params, locations, time_scale, add_dim=add_dim, time_slice=time_slice)
 
     # Compute solar pattern
-    solar_pattern = compute_solar_pattern(params, solar_pattern)
+    solar_pattern = compute_solar_pattern(params, solar_pattern, time_slice=time_slice)
 
     # Compute solar time series
     std_solar_noise = float(params['std_solar_noise'])
@@ -88,28 +101,134 @@ def compute_solar_series(prng, locations, Pmax, solar_noise, params, solar_patte
     solar_series[solar_series > 0.95 * Pmax] = 0.95 * Pmax
     return solar_series
 
-def compute_solar_pattern(params, solar_pattern):
+def compute_wind_series_batch(prng, locations, Pmax, long_noise, medium_noise, short_noise, params, smoothdist,
+                              add_dim, time_slice=None):
+    """
+    Same as :func:`compute_wind_series` for all the wind generators at once
+
+    The smoothing noise is drawn in a single call of shape (generators, time steps), which gives the same numbers
+    as one draw by generator in the same order: chronics are the same as with compute_wind_series for the same seed.
+
+    Input:
+        prng: (numpy.random.Generator) or one generator by scenario if the noises have a leading scenario dimension
+        locations: (tuple of np.array) x and y coordinates of the generators
+        Pmax: (np.array) maximum production of the generators
+
+    Output:
+        (np.array) wind production of shape (number of generators, number of time steps), after the leading
+            dimensions of the noises if any, in the dtype given by params
+    """
+    dtype = utils.generation_dtype(params)
+    Pmax = np.asarray(Pmax, dtype=dtype)[:, np.newaxis]
+    signals = {}
+    for scale, noise in [('long', long_noise), ('medium', medium_noise), ('short', short_noise)]:
+        signals[scale] = utils.interpolate_noise_batch(
+            noise,
+            params,
+            locations,
+            time_scale=params[f'{scale}_wind_corr'],
+            add_dim=add_dim,
+            time_slice=time_slice)
+
+    # Compute seasonal pattern
+    Nt_inter = int(params['T'] // params['dt'] + 1)
+    t = np.linspace(0, params['T'], Nt_inter, endpoint=True)
+    if time_slice is not None:
+        t = t[time_slice]
+    start_min = int(
+        pd.Timedelta(params['start_date'] - pd.to_datetime('2018/01/01', format='%Y-%m-%d')).total_seconds() // 60)
+    seasonal_pattern = np.cos((2 * np.pi / (365 * 24 * 60)) * (t - 30 * 24 * 60 - start_min)).astype(dtype, copy=False)
+
+    # Combine signals
+    std_short_wind_noise = float(params['std_short_wind_noise'])
+    std_medium_wind_noise = float(params['std_medium_wind_noise'])
+    std_long_wind_noise = float(params['std_long_wind_noise'])
+    signal = (0.7 + 0.3 * seasonal_pattern) * (0.3 + std_medium_wind_noise * signals['medium'] + std_long_wind_noise * signals['long'])
+    signal += std_short_wind_noise * signals['short']
+    signal = 1e-1 * np.exp(4 * signal)
+    if isinstance(prng, (list, tuple)):
+        # one generator by scenario of an ensemble
+        signal += np.stack([scenario_prng.uniform(0, smoothdist, signal.shape[1:]) for scenario_prng in prng])
+    else:
+        signal += prng.uniform(0, smoothdist, signal.shape)
+
+    signal[signal < 0.] = 0.
+    signal = smooth(signal)
+    wind_series = Pmax * signal
+    np.minimum(wind_series, 0.95 * Pmax, out=wind_series)
+    return wind_series
+
+def compute_solar_series_batch(locations, Pmax, solar_noise, params, solar_pattern, time_scale, add_dim,
+                               scale_solar_coord_for_correlation=None, time_slice=None):
+    """
+    Same as :func:`compute_solar_series` for all the solar generators at once: the solar pattern is interpolated once
+
+    Input:
+        locations: (tuple of np.array) x and y coordinates of the generators
+        Pmax: (np.array) maximum production of the generators
+
+    Output:
+        (np.array) solar production of shape (number of generators, number of time steps), after the leading
+            dimension of the noise if any, in the dtype given by params
+    """
+    dtype = utils.generation_dtype(params)
+    Pmax = np.asarray(Pmax, dtype=dtype)[:, np.newaxis]
+    x, y = (np.asarray(coordinates, dtype=float) for coordinates in locations)
+    if scale_solar_coord_for_correlation is not None:
+        x = float(scale_solar_coord_for_correlation) * x
+        y = float(scale_solar_coord_for_correlation) * y
+    final_noise = utils.interpolate_noise_batch(solar_noise, params, (x, y), time_scale, add_dim=add_dim,
+                                                time_slice=time_slice)
+
+    # Compute solar pattern
+    solar_pattern = compute_solar_pattern(params, solar_pattern, time_slice=time_slice).astype(dtype, copy=False)
+
+    # Compute solar time series
+    std_solar_noise = float(params['std_solar_noise'])
+    if "mean_solar_pattern" in params:
+        mean_solar_pattern = float(params["mean_solar_pattern"])
+    else:
+        # legacy behaviour
+        mean_solar_pattern = 0.75
+
+    signal = solar_pattern * (mean_solar_pattern + std_solar_noise * final_noise)
+    signal[signal < 0.] = 0.
+    signal = smooth(signal)
+    solar_series = Pmax * signal
+    np.minimum(solar_series, 0.95 * Pmax, out=solar_series)
+    return solar_series
+
+def compute_solar_pattern(params, solar_pattern, time_slice=None):
     """
     Loads a typical hourly pattern, and interpolates it to generate
     a smooth solar generation pattern between 0 and 1
 
+    The result is the same for all the solar generators: it is kept in a bounded cache of the process, shared by the
+    generators and the scenarios on the same period, and returned read-only.
+
     Input:
         computation_params: (dict) Defines the mesh dimensions and
             precision. Also define the correlation scales
         interpolation_params: (dict) params of the interpolation
+        time_slice: (slice) If given, only these time steps are computed
 
     Output:
         (np.array) A smooth solar pattern
     """
+    if time_slice is not None:
+        time_slice = (time_slice.start, time_slice.stop, time_slice.step)
+    key = (hashlib.blake2b(np.ascontiguousarray(solar_pattern).tobytes(), digest_size=16).digest(),
+           params['start_date'], params['end_date'], params['dt'], params['T'], time_slice)
+    return _solar_pattern_cache.get_or_compute(
+        key, lambda: _compute_solar_pattern(params, solar_pattern, time_slice))
 
+def _compute_solar_pattern(params, solar_pattern, time_slice):
     start_year = pd.to_datetime(str(params['start_date'].year) + '/01/01', format='%Y-%m-%d')
     end_min = int(pd.Timedelta(params['end_date'] - start_year).total_seconds() // 60)
 
     Nt_inter_hr = int(end_min // 60 + 1)
     N_repet = int((Nt_inter_hr - 1) // len(solar_pattern) + 1)
-    stacked_solar_pattern = solar_pattern
-    for i in range(N_repet - 1):
-        stacked_solar_pattern = np.append(stacked_solar_pattern, solar_pattern)
+    stacked_solar_pattern = np.tile(solar_pattern, N_repet)
 
     # The time is in minutes
     t_pattern = 60 * np.linspace(0, 8760 * N_repet, 8760 * N_repet, endpoint=False)
@@ -121,8 +240,11 @@ def compute_solar_pattern(params, solar_pattern):
     end_min = int(pd.Timedelta(params['end_date'] - start_year).total_seconds() // 60)
 
     t_inter = np.linspace(start_min, end_min, Nt_inter, endpoint=True)
+    if time_slice is not None:
+        t_inter = t_inter[slice(*time_slice)]
     output = f2(t_inter)
     output = output * (output > 0)
+    output.setflags(write=False)
 
     return output
 
@@ -160,8 +282,53 @@ def smooth(x, alpha=0.5, beta=None):
     return x
 
 
+def assemble_prods(prng, solar_names, solar_matrix, wind_names, wind_matrix, datetime_index, noise, dtype=float):
+    """
+    Builds the solar and wind chronics and their forecasts in a single pass, with the same results as create_csv for
+    solar_p and wind_p: columns are ordered once, forecasts are the productions of the next time step, and the gaussian
+    noise is applied in place to the realized chronics. prod_p gathers the columns of solar_p and wind_p, noise
+    included
+
+    Input:
+        solar_matrix, wind_matrix: (np.array) productions of shape (number of generators, number of time steps), or
+            None without generator, see compute_prods_matrices
+        datetime_index: (pandas.DatetimeIndex) time steps of the productions
+        noise: (float) standard deviation of the gaussian noise of the realized chronics
+
+    Output:
+        (dict of pandas.DataFrame) solar_p, solar_p_forecasted, wind_p, wind_p_forecasted and prod_p
+    """
+    chronics = {}
+    realized = []
+    for carrier, names, matrix in [('solar', solar_names, solar_matrix), ('wind', wind_names, wind_matrix)]:
+        if matrix is None:
+            matrix = np.zeros((0, len(datetime_index)), dtype=dtype)
+        columns, index, prod, prod_forecasted = utils.assemble_chronics(names, matrix.T, datetime_index)
+        prod *= (1 + noise * prng.normal(0, 1, prod.shape)).astype(dtype, copy=False)
+        chronics[f'{carrier}_p'] = pd.DataFrame(prod, index=index, columns=columns)
+        chronics[f'{carrier}_p_forecasted'] = pd.DataFrame(prod_forecasted, index=index, columns=columns)
+        realized.append((columns, prod))
+
+    # Columns of solar_p and wind_p are copied once at their position in prod_p
+    (solar_columns, solar_p), (wind_columns, wind_p) = realized
+    columns = solar_columns + wind_columns
+    order = utils.natural_order(columns)
+    position = np.empty(len(order), dtype=int)
+    position[order] = np.arange(len(order))
+    prod_p = np.empty((len(index), len(columns)), dtype=np.result_type(solar_p, wind_p))
+    prod_p[:, position[:len(solar_columns)]] = solar_p
+    prod_p[:, position[len(solar_columns):]] = wind_p
+    chronics['prod_p'] = pd.DataFrame(prod_p, index=index, columns=[columns[i] for i in order])
+    return chronics
+
+
 def create_csv(prng, dict_, path, reordering=True, noise=None, shift=False,
-               write_results=True, index=False):
+               write_results=True, index=False, dtype=float):
+    """
+    Builds the chronics of the given production series and writes them in path
+
+    dtype is the one of the series: the gaussian noise, drawn in float64, is cast to it
+    """
     if type(dict_) is dict:
         df = pd.DataFrame.from_dict(dict_)
     else:
@@ -176,13 +343,14 @@ def create_csv(prng, dict_, path, reordering=True, noise=None, shift=False,
         new_ordering = [x for _ ,x in sorted(zip(value ,list(df)))]
         df = df[new_ordering]
     if noise is not None:
-        df *= ( 1 +noise * prng.normal(0, 1, df.shape))
+        df *= ( 1 +noise * prng.normal(0, 1, df.shape)).astype(dtype, copy=False)
     if shift:
         df = df.shift(-1)
         df = df.fillna(0)
     if write_results:
-        df.to_csv(path, index=index, sep=';',
-                  float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
+        with tracing.span('csv writing', file=os.path.basename(str(path))):
+            df.to_csv(path, index=index, sep=';',
+                      float_format=cst.FLOATING_POINT_PRECISION_FORMAT)
 
     return df
 
@@ -24,7 +24,7 @@ from numpy.random import default_rng
 
 from chronix2grid.generation.consumption import ConsumptionGeneratorBackend
 from chronix2grid.generation.renewable import RenewableBackend
-from chronix2grid.generation.dispatch.PypsaDispatchBackend import PypsaDispatcher
+import chronix2grid.default_backend as def_bk
 from chronix2grid.getting_started.example.input.generation.patterns import ref_pattern_path
 from chronix2grid.generation.dispatch.EconomicDispatch import ChroniXScenario
 
@@ -233,7 +233,7 @@ def generate_economic_dispatch(path_env, start_date_dt, end_date_dt, dt, number_
     gens_charac_this["pmax"] = gens_charac_this["Pmax"]
     gens_charac_this["pmin"] = gens_charac_this["Pmin"]
     gens_charac_this["cost_per_mw"] = gens_charac_this["marginal_cost"]
-    economic_dispatch = PypsaDispatcher.from_dataframe(gens_charac_this)
+    economic_dispatch = def_bk.DISPATCHER.from_dataframe(gens_charac_this)
     
     # need to hack it to work...
     n_gen = len(name_gen)
@@ -541,7 +541,7 @@ def _fix_losses_one_scenario(env_for_loss,
     df["pmax"] = df["Pmax"]
     df["pmin"] = df["Pmin"]
     df["cost_per_mw"] = df["marginal_cost"]
-    economic_dispatch = PypsaDispatcher.from_dataframe(df)
+    economic_dispatch = def_bk.DISPATCHER.from_dataframe(df)
     economic_dispatch.read_hydro_guide_curves(os.path.join(ref_pattern_path, 'hydro_french.csv'))
     economic_dispatch._chronix_scenario = ChroniXScenario(loads=1.0 * load_df,
                                                           prods=pd.DataFrame(1.0 * gen_p_orig, columns=env_for_loss.name_gen),
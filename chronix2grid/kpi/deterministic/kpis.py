@@ -21,6 +21,8 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import seaborn as sns
 
+from chronix2grid import tracing
+
 
 
 # Class definition
@@ -161,6 +163,7 @@ class EconomicDispatchValidator:
         if save_plots:
             fig.savefig(path_name)
 
+    @tracing.traced('kpi energy_mix')
     def energy_mix(self, save_plots = True):
         """
         Compute piecharts for total energy mix
@@ -217,6 +220,7 @@ class EconomicDispatchValidator:
         fig.add_trace(go.Scatter(x=x, y=y, stackgroup=stacked, name = name),
                       row=in_row, col=in_col)
 
+    @tracing.traced('kpi plot_carriers_pw')
     def plot_carriers_pw(self, curve = 'synthetic' ,stacked=True, max_col_splot=2, save_html = True, wind_solar_only = False):
         """
         Generate a temporal view of production by generators, one graph per carrier.
@@ -392,6 +396,7 @@ class EconomicDispatchValidator:
         return mw_per_month
 
         
+    @tracing.traced('kpi hydro_kpi')
     def hydro_kpi(self, 
                   upper_quantile = 0.9,
                   lower_quantile = 0.1,
@@ -502,6 +507,7 @@ class EconomicDispatchValidator:
                                          
         return skewness_per_month, kurtosis_per_month
         
+    @tracing.traced('kpi wind_kpi')
     def wind_kpi(self, save_plots=True):
 
         '''
@@ -757,6 +763,7 @@ class EconomicDispatchValidator:
         
         return percen_cloud.round(self.precision)
         
+    @tracing.traced('kpi solar_kpi')
     def solar_kpi(self, 
                   cloud_quantile=0.95,
                   cond_below_cloud=0.85
@@ -880,6 +887,7 @@ class EconomicDispatchValidator:
         return syn_corr_solar, solar_night_ref, solar_night_syn, cloudiness_ref, cloudiness_syn
 
 
+    @tracing.traced('kpi wind_load_kpi')
     def wind_load_kpi(self, save_plots = True):
 
         '''
@@ -932,6 +940,7 @@ class EconomicDispatchValidator:
 
         return corr_rel
 
+    @tracing.traced('kpi nuclear_kpi')
     def nuclear_kpi(self, save_plots=True):
 
         """
@@ -988,6 +997,7 @@ class EconomicDispatchValidator:
 
         return None
 
+    @tracing.traced('kpi thermal_kpi')
     def thermal_kpi(self,
                   upper_quantile=0.9,
                   lower_quantile=0.1,
@@ -1088,6 +1098,7 @@ class EconomicDispatchValidator:
         return stat_ref_high_price, stat_ref_low_price, ref_agg_mw_per_month, \
                stat_syn_high_price, stat_syn_low_price, syn_agg_mw_per_month
 
+    @tracing.traced('kpi thermal_load_kpi')
     def thermal_load_kpi(self, save_plots = True):
 
         '''
@@ -1139,6 +1150,7 @@ class EconomicDispatchValidator:
         return corr_rel
 
 
+    @tracing.traced('kpi load_kpi')
     def load_kpi(self, save_plots = True):
         """
         Compute KPIs about load chronics
@@ -13,10 +13,10 @@ import json
 
 # Chronix2grid modules
 from .preprocessing.pivot_KPI import pivot_format
-from .deterministic.kpis import EconomicDispatchValidator
 from ..generation import generation_utils as gu
 from .. import constants as cst
 from .. import utils as ut
+from .. import tracing
 
 
 def main(kpi_input_folder, generation_output_folder, scenario_names,
@@ -41,6 +41,9 @@ def main(kpi_input_folder, generation_output_folder, scenario_names,
 
     """
 
+    # lazy import: plotting libraries (matplotlib, plotly, seaborn) are only imported when KPIs are computed
+    from .deterministic.kpis import EconomicDispatchValidator
+
     ut.check_scenario(n_scenarios, scenario_id)
 
     print('=====================================================================================================================================')
@@ -73,22 +76,23 @@ def main(kpi_input_folder, generation_output_folder, scenario_names,
             print('Warning: KPI are incomplete. Computation has been made on '+str(params['weeks'])+' weeks, but are meant to be computed on 52 weeks')
 
         # Read reference and synthetic chronics, but also KPI configuration, in pivot format. 2 modes: with or without full dispatch
-        if wind_solar_only:
-            # Get reference and synthetic dispatch and loads
-            (ref_dispatch, ref_consumption, syn_dispatch, syn_consumption,
-             paramsKPI) = pivot_format(
-                scenario_generation_output_folder, kpi_input_folder, year,
-                prods_charac, loads_charac, wind_solar_only,
-                params, case)
-            ref_prices = None
-            prices = None
-        else:
-            # Get reference and synthetic dispatch and loads
-            (ref_dispatch, ref_consumption, syn_dispatch, syn_consumption,
-             ref_prices, prices, paramsKPI) = pivot_format(
-                scenario_generation_output_folder, kpi_input_folder, year,
-                prods_charac, loads_charac, wind_solar_only,
-                params, case)
+        with tracing.span('kpi pivot format'):
+            if wind_solar_only:
+                # Get reference and synthetic dispatch and loads
+                (ref_dispatch, ref_consumption, syn_dispatch, syn_consumption,
+                 paramsKPI) = pivot_format(
+                    scenario_generation_output_folder, kpi_input_folder, year,
+                    prods_charac, loads_charac, wind_solar_only,
+                    params, case)
+                ref_prices = None
+                prices = None
+            else:
+                # Get reference and synthetic dispatch and loads
+                (ref_dispatch, ref_consumption, syn_dispatch, syn_consumption,
+                 ref_prices, prices, paramsKPI) = pivot_format(
+                    scenario_generation_output_folder, kpi_input_folder, year,
+                    prods_charac, loads_charac, wind_solar_only,
+                    params, case)
 
         ## Start and Run Economic dispatch validator
         # -- + -- + -- + -- + -- + -- + --
@@ -6,13 +6,17 @@
 # SPDX-License-Identifier: MPL-2.0
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
+import cProfile
+import json
 import os
 import time
+import tracemalloc
 import pathlib
 import shutil
 
 import click
 import multiprocessing
+import pandas as pd
 from functools import partial
 from numpy.random import default_rng
 
@@ -20,11 +24,17 @@ from chronix2grid.GeneratorBackend import GeneratorBackend
 from chronix2grid import constants as cst
 from chronix2grid.generation import generate_chronics as gen
 from chronix2grid.generation import generation_utils as gu
+from chronix2grid.generation import pattern_cache
 from chronix2grid.kpi import main as kpis
 from chronix2grid.output_processor import (
     output_processor_to_chunks, write_start_dates_for_chunks)
 from chronix2grid.seed_manager import (parse_seed_arg, generate_default_seed,
                                        dump_seeds)
+from chronix2grid.manifest import ScenarioManifest, config_hash
+from chronix2grid.scenario_scheduler import run_scenarios
+from chronix2grid.stage_scheduler import reset_peak_memory
+from chronix2grid import run_metrics
+from chronix2grid import tracing
 from chronix2grid import utils as ut
 
 
@@ -54,23 +64,451 @@ from chronix2grid import utils as ut
                    'in the chosen output directory.')
 @click.option('--scenario_name', default='', help='subname to add to the generated scenario output folder, as Scenario_subname_i')
 @click.option('--nb_core', default=1, help='number of cores to parallelize the number of scenarios')
+@click.option('--time-window', default=None, type=click.Choice(cst.TIME_WINDOWS),
+              help='Generate loads and renewables of each scenario by week or month windows, '
+                   'in parallel on nb_core cores (scenarios are then generated one after the other). '
+                   'The windows of the dispatch are also solved in parallel')
+@click.option('--resume', is_flag=True,
+              help='Resume a previous run in the same output folder: completed scenarios and stages are skipped, '
+                   'incomplete or failed ones are generated again. Seeds must be the same as in the previous run.')
+@click.option('--scenario-timeout', default=None, type=float,
+              help='Maximum duration of the generation of one scenario in seconds')
+@click.option('--retries', default=0, help='Number of times a failed scenario is generated again')
+@click.option('--max-tasks-per-child', default=cst.DEFAULT_MAX_TASKS_PER_CHILD,
+              help='Number of scenarios after which a process is replaced by a new one, to release memory')
+@click.option('--prometheus', is_flag=True,
+              help='Also write the run metrics in Prometheus text format, for a node exporter textfile collector')
+@click.option('--trace', is_flag=True,
+              help='Record where the time goes in each scenario and write it as Chrome trace events in trace.json')
+@click.option('--profile', is_flag=True,
+              help='Profile each scenario with cProfile and write its statistics in <scenario>.pstats')
+@click.option('--trace-memory', is_flag=True,
+              help='Record the peak memory allocated during each stage in the manifest of each scenario')
+@click.option('--kpi-workers', default=0,
+              help='Number of processes computing KPIs while the next scenarios are generated. '
+                   'With 0, KPIs are computed by the process that has generated the scenario')
+@click.option('--max-in-flight', default=None, type=int,
+              help='Maximum number of scenarios being generated or waiting for their KPIs, to bound memory. '
+                   'By default nb_core + kpi-workers')
+@click.option('--dtype', default=cst.DEFAULT_DTYPE, type=click.Choice(cst.DTYPES),
+              help='Floating point type of the generated chronics. float32 halves the memory of loads and '
+                   'renewables, with deviations far below the precision of the written files')
+@click.option('--stream', is_flag=True,
+              help='Write loads and renewables window after window (of --time-window, month by default) without '
+                   'keeping them in memory, for long horizons. Not possible with D and T')
+@click.option('--ensemble-batch-size', default=None, type=click.IntRange(min=1),
+              help='Generate loads and renewables of this number of scenarios together in each process, reading the '
+                   'configuration and computing what does not depend on the seeds once. Only for L and R')
 def generate_mp(case, start_date, weeks, by_n_weeks, n_scenarios, mode,
              input_folder, output_folder, scenario_name,
-             seed_for_loads, seed_for_res, seed_for_dispatch, nb_core, ignore_warnings):
+             seed_for_loads, seed_for_res, seed_for_dispatch, nb_core, ignore_warnings, time_window, resume,
+             scenario_timeout, retries, max_tasks_per_child, prometheus, trace, profile, trace_memory,
+             kpi_workers, max_in_flight, dtype, stream, ensemble_batch_size):
     prng = default_rng()
-    generate_mp_core(prng, case, start_date, weeks, by_n_weeks, n_scenarios, mode,
-                     input_folder, output_folder, scenario_name,
-                     seed_for_loads, seed_for_res, seed_for_dispatch, nb_core, ignore_warnings)
+    errors = generate_mp_core(prng, case, start_date, weeks, by_n_weeks, n_scenarios, mode,
+                              input_folder, output_folder, scenario_name,
+                              seed_for_loads, seed_for_res, seed_for_dispatch, nb_core, ignore_warnings,
+                              time_window=time_window, resume=resume, scenario_timeout=scenario_timeout,
+                              retries=retries, max_tasks_per_child=max_tasks_per_child, prometheus=prometheus,
+                              trace=trace, profile=profile, trace_memory=trace_memory,
+                              kpi_workers=kpi_workers, max_in_flight=max_in_flight, dtype=dtype, stream=stream,
+                              ensemble_batch_size=ensemble_batch_size)
+    if errors:
+        raise click.ClickException(f'{len(errors)} scenario(s) failed')
+
+
+@click.command()
+@click.option('--jobs', required=True, type=click.Path(exists=True, dir_okay=False),
+              help='JSON file with the list of jobs, each one with a case, start_date, weeks and n_scenarios, '
+                   'and optionally by_n_weeks, mode, scenario_name and seeds as in chronix2grid')
+@click.option('--mode', default='LRT', help='Steps to execute for the jobs that do not give their own mode')
+@click.option('--by-n-weeks', default=4, help='Size of the output chunks in weeks for the jobs that do not give it')
+@click.option('--input-folder',
+              default=os.path.join(pathlib.Path(__file__).parent.absolute(),
+                                   cst.DEFAULT_INPUT_FOLDER_NAME),
+              help='Directory to read input files from.')
+@click.option('--output-folder',
+              default=os.path.join(os.path.normpath(os.getcwd()),
+                                   cst.DEFAULT_OUTPUT_FOLDER_NAME),
+              help='Directory to store output files.')
+@click.option('--ignore-warnings', is_flag=True,
+              help='Ignore the warnings related to the existence of data files '
+                   'in the chosen output directory.')
+@click.option('--nb_core', default=1, help='number of cores shared by the scenarios of all the jobs')
+@click.option('--resume', is_flag=True,
+              help='Resume a previous batch in the same output folder')
+@click.option('--scenario-timeout', default=None, type=float,
+              help='Maximum duration of the generation of one scenario in seconds')
+@click.option('--retries', default=0, help='Number of times a failed scenario is generated again')
+@click.option('--max-tasks-per-child', default=cst.DEFAULT_MAX_TASKS_PER_CHILD,
+              help='Number of scenarios after which a process is replaced by a new one, to release memory')
+@click.option('--prometheus', is_flag=True,
+              help='Also write the run metrics in Prometheus text format, for a node exporter textfile collector')
+@click.option('--kpi-workers', default=0,
+              help='Number of processes computing KPIs while the next scenarios are generated')
+@click.option('--max-in-flight', default=None, type=int,
+              help='Maximum number of scenarios being generated or waiting for their KPIs, to bound memory')
+@click.option('--dtype', default=cst.DEFAULT_DTYPE, type=click.Choice(cst.DTYPES),
+              help='Floating point type of the generated chronics')
+@click.option('--time-window', default=None, type=click.Choice(cst.TIME_WINDOWS),
+              help='Generate each scenario by week or month windows, in parallel on nb_core cores '
+                   '(scenarios are then generated one after the other)')
+@click.option('--trace', is_flag=True,
+              help='Record where the time goes in each scenario and write it as Chrome trace events in trace.json')
+@click.option('--profile', is_flag=True,
+              help='Profile each scenario with cProfile and write its statistics in <scenario>.pstats')
+@click.option('--trace-memory', is_flag=True,
+              help='Record the peak memory allocated during each stage in the manifest of each scenario')
+@click.option('--stream', is_flag=True,
+              help='Write loads and renewables window after window without keeping them in memory. '
+                   'Not possible with D and T')
+def generate_batch(jobs, mode, by_n_weeks, input_folder, output_folder, ignore_warnings, nb_core, resume,
+                   scenario_timeout, retries, max_tasks_per_child, prometheus, kpi_workers, max_in_flight, dtype,
+                   time_window, trace, profile, trace_memory, stream):
+    with open(jobs, 'r') as f:
+        jobs = json.load(f)
+    prng = default_rng()
+    errors = generate_batch_core(prng, jobs, input_folder, output_folder, nb_core, mode=mode,
+                                 by_n_weeks=by_n_weeks, ignore_warnings=ignore_warnings, resume=resume,
+                                 scenario_timeout=scenario_timeout, retries=retries,
+                                 max_tasks_per_child=max_tasks_per_child, prometheus=prometheus,
+                                 kpi_workers=kpi_workers, max_in_flight=max_in_flight, dtype=dtype,
+                                 time_window=time_window, trace=trace, profile=profile, trace_memory=trace_memory,
+                                 stream=stream)
+    if errors:
+        raise click.ClickException(f'{len(errors)} scenario(s) failed')
+
+
+@click.command()
+@click.option('--case', default='case118_l2rpn_neurips_1x', help='case folder in which the loss model is written')
+@click.option('--corpus', required=True, multiple=True, type=click.Path(exists=True, file_okay=False),
+              help='Folder of chronics that went through an AC power flow (load_p and prod_p with the losses), '
+                   'repeated for each simulation')
+@click.option('--slack-region', default='',
+              help='Comma separated names of the loads and renewable generators of the region around the slack')
+@click.option('--validation-share', default=cst.LOSS_MODEL_VALIDATION_SHARE,
+              help='Share of the corpus held out to compute the validation error')
+@click.option('--seed', default=None, type=int, help='Seed of the choice of the held-out simulations')
+@click.option('--model-file', default='loss_model.json',
+              help='Name of the model file in the case folder, to be given as "loss_model" in params_loss.json')
+@click.option('--input-folder',
+              default=os.path.join(pathlib.Path(__file__).parent.absolute(),
+                                   cst.DEFAULT_INPUT_FOLDER_NAME),
+              help='Directory to read input files from.')
+def fit_loss_model(case, corpus, slack_region, validation_share, seed, model_file, input_folder):
+    slack_region = [name.strip() for name in slack_region.split(',') if name.strip()]
+    model = fit_loss_model_core(input_folder, case, list(corpus), slack_region, validation_share, seed, model_file)
+    print('Validation error on ' + ', '.join(model.validation['scenarios']) + ': ' +
+          ', '.join(f'{key}={model.validation[key]:.4g}' for key in ['mae', 'rmse', 'max_error', 'relative_mae']))
+
+
+def fit_loss_model_core(input_folder, case, corpus, slack_region=(), validation_share=cst.LOSS_MODEL_VALIDATION_SHARE,
+                        seed=None, model_file='loss_model.json'):
+    """
+    Fits a :class:`chronix2grid.generation.loss.surrogate_loss_model.SurrogateLossModel` on the corpus of AC
+    simulations and writes it in the case folder
+    """
+    from chronix2grid.generation.loss.surrogate_loss_model import SurrogateLossModel
+    case_folder = os.path.join(input_folder, cst.GENERATION_FOLDER_NAME, case)
+    prods_charac = pd.read_csv(os.path.join(case_folder, 'prods_charac.csv'), sep=',')
+    model = SurrogateLossModel.fit(corpus, prods_charac, slack_region, validation_share, seed)
+    model.to_json(os.path.join(case_folder, model_file))
+    return model
 
 
 def generate_mp_core(prng, case, start_date, weeks, by_n_weeks, n_scenarios, mode,
              input_folder, output_folder, scenario_name,
-             seed_for_loads, seed_for_res, seed_for_dispatch, nb_core, ignore_warnings):
+             seed_for_loads, seed_for_res, seed_for_dispatch, nb_core, ignore_warnings, time_window=None,
+             resume=False, scenario_timeout=None, retries=0,
+             max_tasks_per_child=cst.DEFAULT_MAX_TASKS_PER_CHILD, prometheus=False, trace=False,
+             profile=False, trace_memory=False, kpi_workers=0, max_in_flight=None, dtype=cst.DEFAULT_DTYPE,
+             stream=False, ensemble_batch_size=None):
 
     start_time = time.time()
-    print(case)
-    # create folders
+    if stream:
+        time_window = check_stream(mode, time_window)
+    if ensemble_batch_size is not None:
+        check_ensemble(mode, time_window)
+    defer_kpi = kpi_workers > 0 and 'K' in mode
+    multiprocessing_func, scen_names, generation_output_folder = prepare_scenarios(
+        prng, case, start_date, weeks, by_n_weeks, n_scenarios, mode, input_folder, output_folder, scenario_name,
+        seed_for_loads, seed_for_res, seed_for_dispatch, ignore_warnings, time_window=time_window, resume=resume,
+        dtype=dtype, ensemble=ensemble_batch_size is not None, trace=trace, profile=profile,
+        trace_memory=trace_memory, defer_kpi=defer_kpi, stream=stream, sequential_stages=scenario_timeout is not None)
+
+    # progress of the run, written in the output folder each time a scenario is finished
+    # scenarios are generated one after the other by time windows
+    metrics = run_metrics.RunMetrics(n_scenarios, generation_output_folder, prometheus=prometheus,
+                                     workers=1 if time_window is not None else nb_core)
+    metrics.write()
+    # spans of the scenarios, sent back by the workers
+    tracing.enable(trace)
+    spans = []
+
+    def on_result(name, error, result):
+        if result is not None:
+            spans.extend(result.pop('spans', []))
+        metrics.update(name, error, result)
+
+    # KPIs can be computed in their own pool while the next scenarios are generated
+    pipeline = dict(max_in_flight=max_in_flight)
+    if defer_kpi:
+        pipeline.update(post_func=partial(finish_scenario, trace), post_workers=kpi_workers)
 
+    # multi-processing
+    iterable = [i for i in range(n_scenarios)]
+    if ensemble_batch_size is not None:
+        # Each task generates a group of scenarios, whose metrics are shared by its scenarios
+        groups = [iterable[start:start + ensemble_batch_size] for start in range(0, n_scenarios, ensemble_batch_size)]
+        group_names = [ensemble_name(scen_names, group) for group in groups]
+
+        def on_group_result(name, error, result):
+            group = groups[group_names.index(name)]
+            if result is not None:
+                spans.extend(result.pop('spans', []))
+            for scenario_id in group:
+                scenario_name = scen_names(scenario_id)
+                metrics.update(scenario_name, error, ensemble_scenario_result(result, scenario_name))
+
+        errors = run_scenarios(
+            partial(run_ensemble_task, multiprocessing_func, groups), list(range(len(groups))), nb_core,
+            scenario_names=group_names.__getitem__, timeout=scenario_timeout, retries=retries,
+            max_tasks_per_child=max_tasks_per_child, errors_folder=generation_output_folder,
+            on_result=on_group_result)
+    elif time_window is not None:
+        errors = run_scenarios_by_windows(
+            multiprocessing_func, iterable, nb_core, time_window, max_tasks_per_child, scenario_names=scen_names,
+            timeout=scenario_timeout, retries=retries, errors_folder=generation_output_folder, on_result=on_result,
+            **pipeline)
+    else:
+        errors = run_scenarios(
+            multiprocessing_func, iterable, nb_core, scenario_names=scen_names, timeout=scenario_timeout,
+            retries=retries, max_tasks_per_child=max_tasks_per_child, errors_folder=generation_output_folder,
+            on_result=on_result, **pipeline)
+    print('multiprocessing done')
+    print('Time taken = {} seconds'.format(time.time() - start_time))
+    print('removing temporary folders if exist:')
+    rm_temporary_folders(input_folder, case)
+    if trace:
+        trace_path = os.path.join(generation_output_folder, cst.TRACE_FILE_NAME)
+        tracing.write_chrome_trace(trace_path, spans + tracing.pop_spans())
+        print('Trace of the run written in ' + trace_path)
+    if errors:
+        print(f'{len(errors)} scenario(s) failed: {sorted(errors)}. '
+              f'See {os.path.join(generation_output_folder, cst.ERRORS_FILE_NAME)}')
+    return errors
+
+def check_stream(mode, time_window):
+    """
+    Checks that the scenarios of mode can be generated in stream
+
+    Returns
+    -------
+    time_window: ``str``
+        time window of the stream, month by default
+    """
+    if 'D' in mode or 'T' in mode:
+        raise ValueError('Loads and renewables generated in stream are not kept in memory, '
+                         'they cannot be used by the loss (D) and dispatch (T) generation')
+    return cst.DEFAULT_STREAM_TIME_WINDOW if time_window is None else time_window
+
+def check_ensemble(mode, time_window):
+    """
+    Checks that the scenarios of mode can be generated by ensembles (see :func:`generate_ensemble`)
+    """
+    if any(stage not in 'LR' for stage in mode):
+        raise ValueError('Only loads (L) and renewables (R) can be generated by ensembles, '
+                         'the other stages are run scenario by scenario')
+    if time_window is not None:
+        raise ValueError('An ensemble is generated on the whole period, not by time windows')
+
+def run_scenarios_by_windows(func, scenario_ids, nb_core, time_window, max_tasks_per_child, **kwargs):
+    """
+    Runs the scenarios one after the other with :func:`chronix2grid.scenario_scheduler.run_scenarios`, the time
+    windows of each scenario being shared by the processes of a pool. func receives time_window and window_pool
+    as keyword arguments
+    """
+    window_pool = multiprocessing.Pool(nb_core, maxtasksperchild=max_tasks_per_child)
+    try:
+        errors = run_scenarios(partial(func, time_window=time_window, window_pool=window_pool), scenario_ids,
+                               nb_core, sequential=True, **kwargs)
+        window_pool.close()
+    except BaseException:
+        window_pool.terminate()
+        raise
+    finally:
+        window_pool.join()
+    return errors
+
+def generate_batch_core(prng, jobs, input_folder, output_folder, nb_core, mode='LRT', by_n_weeks=4,
+                        ignore_warnings=False, resume=False, scenario_timeout=None, retries=0,
+                        max_tasks_per_child=cst.DEFAULT_MAX_TASKS_PER_CHILD, prometheus=False,
+                        kpi_workers=0, max_in_flight=None, dtype=cst.DEFAULT_DTYPE, time_window=None, trace=False,
+                        profile=False, trace_memory=False, stream=False):
+    """
+    Generates the scenarios of several cases or periods with a single pool of processes, so that processes are not
+    started again for each job and the patterns shared by the cases are read once by process
+    (see :mod:`chronix2grid.generation.pattern_cache`)
+
+    The other options are the ones of :func:`generate_mp_core`, for all the jobs. With time_window, the scenarios are
+    generated one after the other and the pool is shared by their windows
+
+    Parameters
+    ----------
+    jobs: ``list``
+        dictionaries with keys case, start_date, weeks and n_scenarios, and optionally by_n_weeks, mode,
+        scenario_name, seed_for_loads, seed_for_res and seed_for_dispatch
+    mode: ``str``
+        mode of the jobs that do not give their own
+    by_n_weeks: ``int``
+        size of the output chunks of the jobs that do not give their own
+    dtype: ``str``
+        floating point type of the generated chronics, "float64" or "float32"
+
+    Returns
+    -------
+    errors: ``dict``
+        errors of the failed scenarios, by "case/start_date/scenario" name. They are also written with the run
+        metrics in output_folder
+    """
+    start_time = time.time()
+    keys = [(job['case'], job['start_date']) for job in jobs]
+    if len(set(keys)) != len(keys):
+        raise ValueError('Two jobs of a batch cannot have the same case and start date: '
+                         'they would be written in the same output folder')
+
+    funcs = []
+    tasks = []
+    names = []
+    loss_patterns = set()
+    if stream:
+        for job in jobs:
+            time_window = check_stream(job.get('mode', mode), time_window)
+    for job_index, job in enumerate(jobs):
+        job_mode = job.get('mode', mode)
+        multiprocessing_func, scen_names, _ = prepare_scenarios(
+            prng, job['case'], job['start_date'], job['weeks'], job.get('by_n_weeks', by_n_weeks),
+            job['n_scenarios'], job_mode, input_folder, output_folder, job.get('scenario_name', ''),
+            job.get('seed_for_loads'), job.get('seed_for_res'), job.get('seed_for_dispatch'), ignore_warnings,
+            time_window=time_window, resume=resume, dtype=dtype, trace=trace, profile=profile,
+            trace_memory=trace_memory, defer_kpi=kpi_workers > 0 and 'K' in job_mode, stream=stream,
+            sequential_stages=scenario_timeout is not None)
+        funcs.append(multiprocessing_func)
+        for scenario_id in range(job['n_scenarios']):
+            tasks.append((job_index, scenario_id))
+            names.append('/'.join([job['case'], job['start_date'], scen_names(scenario_id)]))
+        if 'D' in job_mode:
+            loss_patterns.add(read_loss_pattern_name(input_folder, job['case']))
+
+    # Read in this process before the pool is created: forked processes start with the patterns in memory
+    pattern_cache.warm(os.path.join(input_folder, cst.GENERATION_FOLDER_NAME, 'patterns'),
+                       loss_patterns=sorted(loss_patterns))
+
+    os.makedirs(output_folder, exist_ok=True)
+    metrics = run_metrics.RunMetrics(len(tasks), output_folder, prometheus=prometheus,
+                                     workers=1 if time_window is not None else nb_core)
+    metrics.write()
+    tracing.enable(trace)
+    spans = []
+
+    def on_result(name, error, result):
+        if result is not None:
+            spans.extend(result.pop('spans', []))
+        metrics.update(name, error, result)
+
+    pipeline = dict(max_in_flight=max_in_flight)
+    if kpi_workers > 0:
+        pipeline.update(post_func=partial(finish_scenario, trace), post_workers=kpi_workers)
+
+    run_task = partial(run_batch_task, funcs, tasks)
+    task_ids = list(range(len(tasks)))
+    options = dict(scenario_names=names.__getitem__, timeout=scenario_timeout, retries=retries,
+                   errors_folder=output_folder, on_result=on_result, **pipeline)
+    if time_window is not None:
+        errors = run_scenarios_by_windows(run_task, task_ids, nb_core, time_window, max_tasks_per_child, **options)
+    else:
+        errors = run_scenarios(run_task, task_ids, nb_core, max_tasks_per_child=max_tasks_per_child, **options)
+    print('multiprocessing done')
+    print('Time taken = {} seconds'.format(time.time() - start_time))
+    print('removing temporary folders if exist:')
+    for case in sorted(set(job['case'] for job in jobs)):
+        rm_temporary_folders(input_folder, case)
+    if trace:
+        trace_path = os.path.join(output_folder, cst.TRACE_FILE_NAME)
+        tracing.write_chrome_trace(trace_path, spans + tracing.pop_spans())
+        print('Trace of the batch written in ' + trace_path)
+    if errors:
+        print(f'{len(errors)} scenario(s) failed: {sorted(errors)}. '
+              f'See {os.path.join(output_folder, cst.ERRORS_FILE_NAME)}')
+    return errors
+
+def run_batch_task(funcs, tasks, task_id, **kwargs):
+    """
+    Generates the scenario of a batch of index task_id with the function of its job, and its other keyword arguments
+    (time_window and window_pool)
+    """
+    job_index, scenario_id = tasks[task_id]
+    return funcs[job_index](scenario_id, **kwargs)
+
+def run_ensemble_task(func, groups, group_id):
+    """
+    Generates the group of scenarios of index group_id with :func:`generate_ensemble`
+    """
+    return func(groups[group_id])
+
+def ensemble_name(scen_names, scenario_ids):
+    """
+    Name of a group of scenarios generated together, used as key in the errors file
+    """
+    if len(scenario_ids) == 1:
+        return scen_names(scenario_ids[0])
+    return scen_names(scenario_ids[0]) + '-' + scen_names(scenario_ids[-1])
+
+def ensemble_scenario_result(result, scenario_name):
+    """
+    Share of one scenario in the result of :func:`generate_ensemble`, as the result of :func:`generate_per_scenario`.
+    None if the scenario has been skipped
+    """
+    if result is None or scenario_name not in result['scenarios']:
+        return None
+    n_scenarios = len(result['scenarios'])
+    return dict(duration=result['duration'] / n_scenarios,
+                stages={stage: duration / n_scenarios for stage, duration in result['stages'].items()},
+                opf_solve_times=[])
+
+def read_loss_pattern_name(input_folder, case):
+    params_filepath = os.path.join(input_folder, cst.GENERATION_FOLDER_NAME, case, 'params_loss.json')
+    if not os.path.isfile(params_filepath):
+        return 'loss_pattern.csv'
+    with open(params_filepath, 'r') as loss_param_json:
+        return json.load(loss_param_json).get('loss_pattern') or 'loss_pattern.csv'
+
+def prepare_scenarios(prng, case, start_date, weeks, by_n_weeks, n_scenarios, mode,
+                      input_folder, output_folder, scenario_name,
+                      seed_for_loads, seed_for_res, seed_for_dispatch, ignore_warnings, time_window=None,
+                      resume=False, dtype=cst.DEFAULT_DTYPE, ensemble=False, **scenario_options):
+    """
+    Creates the output folders and draws the seeds of the scenarios of one case
+
+    Parameters
+    ----------
+    dtype: ``str``
+        floating point type of the generated chronics, "float64" or "float32"
+    ensemble: ``bool``
+        if True, multiprocessing_func is :func:`generate_ensemble`. Only trace is used in scenario_options
+    scenario_options:
+        keyword arguments of :func:`generate_per_scenario` (trace, profile, trace_memory, defer_kpi, stream,
+        sequential_stages)
+
+    Returns
+    -------
+    multiprocessing_func: ``callable``
+        generates the scenario of the given id, or the scenarios of the given list of ids if ensemble
+    scen_names: ``callable``
+        name of the scenario of the given id
+    generation_output_folder: ``str``
+    """
+    print(case)
     # get scenario name ids
     scenario_base_name = cst.SCENARIO_FOLDER_BASE_NAME
     if scenario_name:
@@ -78,9 +516,10 @@ def generate_mp_core(prng, case, start_date, weeks, by_n_weeks, n_scenarios, mod
 
     scen_names = gu.folder_name_pattern(scenario_base_name, n_scenarios)
 
+    # When resuming, the output folder is expected not to be empty
     generation_output_folder, kpi_output_folder = create_directory_tree(
         case, start_date, output_folder, scenario_base_name, n_scenarios, mode,
-        warn_user=not ignore_warnings)
+        warn_user=not (ignore_warnings or resume))
 
     # seeds
     default_seed = generate_default_seed(prng)
@@ -112,21 +551,21 @@ def generate_mp_core(prng, case, start_date, weeks, by_n_weeks, n_scenarios, mod
         seeds_for_res = [seed_for_res]
         seeds_for_disp = [seed_for_dispatch]
 
-    # multi-processing
-    pool = multiprocessing.Pool(nb_core)
-    iterable = [i for i in range(n_scenarios)]
+    run_config_hash = compute_config_hash(input_folder, case, start_date, weeks, by_n_weeks, time_window, dtype)
+    if ensemble:
+        multiprocessing_func = partial(
+            generate_ensemble,
+            case, start_date, weeks, by_n_weeks, mode, input_folder, generation_output_folder, scen_names,
+            seeds_for_loads, seeds_for_res, seeds_for_disp,
+            resume=resume, config_hash=run_config_hash, dtype=dtype, trace=scenario_options.get('trace', False))
+        return multiprocessing_func, scen_names, generation_output_folder
     multiprocessing_func = partial(
         generate_per_scenario,
         case, start_date, weeks, by_n_weeks, mode, input_folder,
         kpi_output_folder, generation_output_folder, scen_names,
-        seeds_for_loads, seeds_for_res, seeds_for_disp, ignore_warnings)
-
-    pool.map(multiprocessing_func, iterable)
-    pool.close()
-    print('multiprocessing done')
-    print('Time taken = {} seconds'.format(time.time() - start_time))
-    print('removing temporary folders if exist:')
-    rm_temporary_folders(input_folder, case)
+        seeds_for_loads, seeds_for_res, seeds_for_disp, ignore_warnings,
+        resume=resume, config_hash=run_config_hash, dtype=dtype, **scenario_options)
+    return multiprocessing_func, scen_names, generation_output_folder
 
 def rm_temporary_folders(input_folder, case):
     grid2op_tempo = os.path.join(input_folder, cst.GENERATION_FOLDER_NAME, case, 'chronics')
@@ -136,10 +575,19 @@ def rm_temporary_folders(input_folder, case):
 
 def generate_per_scenario(case, start_date, weeks, by_n_weeks, mode,
              input_folder, kpi_output_folder, generation_output_folder, scen_names,
-             seeds_for_loads, seeds_for_res, seeds_for_dispatch, ignore_warnings, scenario_id):
+             seeds_for_loads, seeds_for_res, seeds_for_dispatch, ignore_warnings, scenario_id,
+             time_window=None, window_pool=None, resume=False, config_hash=None, trace=False,
+             profile=False, trace_memory=False, defer_kpi=False, dtype=cst.DEFAULT_DTYPE, stream=False,
+             sequential_stages=False):
     
     n_scenarios_sub_p = 1  # one scenario to compute per process``
     scenario_name = scen_names(scenario_id)
+    start_time = time.perf_counter()
+    # durations and spans left by a previous scenario of the same process that has failed
+    run_metrics.pop_durations()
+    tracing.enable(trace)
+    tracing.pop_spans()
+    tracing.set_context(scenario_id=scenario_id, scenario=scenario_name)
 
     # get scenario seeds
     seed_for_loads = seeds_for_loads[scenario_id]
@@ -164,17 +612,172 @@ def generate_per_scenario(case, start_date, weeks, by_n_weeks, mode,
     print('scenario_path: '+scenario_path)
     dump_seeds(scenario_path, scenario_seeds)
 
-    # go to generate chronics
-    generate_inner(
-        case, start_date, weeks, by_n_weeks, n_scenarios_sub_p, mode,
-        input_folder, kpi_output_folder, generation_output_folder,
-        scen_names, seed_for_loads, seed_for_res, seed_for_dispatch, scenario_id)
+    if config_hash is None:
+        config_hash = compute_config_hash(input_folder, case, start_date, weeks, by_n_weeks, time_window, dtype)
+    scenario_manifest = ScenarioManifest(scenario_path, scenario_name, scenario_seeds, config_hash, mode)
+    if resume:
+        scenario_manifest.resume()
+        if scenario_manifest.is_completed():
+            print(scenario_name + ' has already been generated, it is skipped')
+            return None
+    scenario_manifest.save()
+
+    # cProfile and tracemalloc only see the current thread and mix concurrent stages, and the scenario timeout only
+    # interrupts the current thread: stages are run one by one
+    stage_workers = 1 if (profile or trace_memory or sequential_stages) else None
+    profiler = cProfile.Profile() if profile else None
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        # go to generate chronics
+        with tracing.span('scenario'):
+            stage_durations = generate_inner(
+                case, start_date, weeks, by_n_weeks, n_scenarios_sub_p, mode,
+                input_folder, kpi_output_folder, generation_output_folder,
+                scen_names, seed_for_loads, seed_for_res, seed_for_dispatch, scenario_id,
+                time_window=time_window, window_pool=window_pool, manifest=scenario_manifest,
+                stage_workers=stage_workers, defer_kpi=defer_kpi, dtype=dtype, stream=stream)
+    finally:
+        # Also written when the scenario fails or times out, this is when it is the most useful
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(generation_output_folder, scenario_name + cst.PROFILE_FILE_EXTENSION))
+        if trace_memory:
+            tracemalloc.stop()
+    result = dict(duration=time.perf_counter() - start_time,
+                  opf_solve_times=run_metrics.pop_durations().get('opf', []),
+                  spans=tracing.pop_spans())
+    if defer_kpi:
+        # KPIs and manifest completion are left to finish_scenario, in another process
+        result['stages'], result['kpi_task'] = stage_durations
+        result['manifest'] = scenario_manifest
+        return result
+    scenario_manifest.complete()
+    result['stages'] = stage_durations
+    return result
+
+
+def generate_ensemble(case, start_date, weeks, by_n_weeks, mode, input_folder, generation_output_folder, scen_names,
+                      seeds_for_loads, seeds_for_res, seeds_for_disp, scenario_ids, resume=False, config_hash=None,
+                      dtype=cst.DEFAULT_DTYPE, trace=False, max_batch_bytes=cst.ENSEMBLE_MAX_BATCH_BYTES):
+    """
+    Generates the loads and renewables of several scenarios together
+    (see :meth:`chronix2grid.GeneratorBackend.GeneratorBackend.run_ensemble`). Each scenario is the same as the one
+    of :func:`generate_per_scenario`, with the same seeds and manifest
+
+    Parameters
+    ----------
+    scenario_ids: ``list``
+        ids of the scenarios of the ensemble
+    max_batch_bytes: ``int``
+        memory allowed to the chronics of the scenarios computed together
+
+    Returns
+    -------
+    result: ``dict`` or ``None``
+        duration, stage durations and spans of the ensemble, and the names of the scenarios generated. None if all the
+        scenarios have been skipped
+    """
+    start_time = time.perf_counter()
+    run_metrics.pop_durations()
+    tracing.enable(trace)
+    tracing.pop_spans()
+    tracing.set_context(scenario=ensemble_name(scen_names, scenario_ids))
+    if config_hash is None:
+        config_hash = compute_config_hash(input_folder, case, start_date, weeks, by_n_weeks, None, dtype)
+
+    manifests = {}
+    for scenario_id in scenario_ids:
+        scenario_name = scen_names(scenario_id)
+        scenario_seeds = dict(loads=seeds_for_loads[scenario_id], renewables=seeds_for_res[scenario_id],
+                              dispatch=seeds_for_disp[scenario_id])
+        scenario_path = os.path.join(generation_output_folder, scenario_name)
+        dump_seeds(scenario_path, scenario_seeds)
+        scenario_manifest = ScenarioManifest(scenario_path, scenario_name, scenario_seeds, config_hash, mode)
+        if resume:
+            scenario_manifest.resume()
+            if scenario_manifest.is_completed():
+                print(scenario_name + ' has already been generated, it is skipped')
+                continue
+        scenario_manifest.save()
+        manifests[scenario_id] = scenario_manifest
+    if not manifests:
+        return None
+
+    generator = GeneratorBackend()
+    generator.dtype = dtype
+    scenario_ids = list(manifests)
+    with tracing.span('ensemble', n_scenarios=len(scenario_ids)):
+        generator.run_ensemble(case, os.path.join(input_folder, cst.GENERATION_FOLDER_NAME),
+                               generation_output_folder, scen_names, gu.time_parameters(weeks, start_date), mode,
+                               scenario_ids, [seeds_for_loads[i] for i in scenario_ids],
+                               [seeds_for_res[i] for i in scenario_ids], max_batch_bytes=max_batch_bytes)
+    for scenario_manifest in manifests.values():
+        for stage in mode:
+            scenario_manifest.stage_completed(stage)
+        scenario_manifest.complete()
+    return dict(duration=time.perf_counter() - start_time, stages=dict(generator.stage_durations),
+                opf_solve_times=[], spans=tracing.pop_spans(),
+                scenarios=[scen_names(scenario_id) for scenario_id in scenario_ids])
+
+
+def finish_scenario(trace, scenario_id, result):
+    """
+    Computes the KPIs of a scenario generated by :func:`generate_per_scenario` with ``defer_kpi=True``,
+    then completes its manifest
+
+    Parameters
+    ----------
+    trace: ``bool``
+        whether spans are recorded
+    scenario_id: ``int``
+    result: ``dict`` or ``None``
+        result of :func:`generate_per_scenario`. None if the scenario has been skipped
+
+    Returns
+    -------
+    result: ``dict`` or ``None``
+        same as the one of :func:`generate_per_scenario` without deferred KPIs
+    """
+    if result is None:
+        return None
+    kpi_task = result.pop('kpi_task')
+    manifest = result.pop('manifest')
+    tracing.enable(trace)
+    tracing.pop_spans()
+    tracing.set_context(scenario_id=scenario_id, scenario=manifest.data['scenario'])
+    start_time = time.perf_counter()
+    result['stages'].update(compute_kpis(manifest=manifest, **kpi_task))
+    manifest.complete()
+    result['duration'] += time.perf_counter() - start_time
+    result['spans'] = result['spans'] + tracing.pop_spans()
+    return result
+
+
+def compute_config_hash(input_folder, case, start_date, weeks, by_n_weeks, time_window, dtype=cst.DEFAULT_DTYPE):
+    run_settings = dict(start_date=start_date, weeks=weeks, by_n_weeks=by_n_weeks, time_window=time_window)
+    if dtype != cst.DEFAULT_DTYPE:
+        # Same hash as before the option for float64 runs, so that they can be resumed
+        run_settings['dtype'] = dtype
+    return config_hash(os.path.join(input_folder, cst.GENERATION_FOLDER_NAME), case, **run_settings)
     
 
 def generate_inner(case, start_date, weeks, by_n_weeks, n_scenarios, mode,
                    input_folder, kpi_output_folder, generation_output_folder,
                    scen_names, seed_for_loads, seed_for_res,
-                   seed_for_dispatch, scenario_id=None):
+                   seed_for_dispatch, scenario_id=None, time_window=None, window_pool=None,
+                   manifest=None, stage_workers=None, defer_kpi=False, dtype=cst.DEFAULT_DTYPE, stream=False):
+    """
+    Generates the chronics of a scenario and computes its KPIs, depending on mode
+
+    Returns
+    -------
+    stage_durations: ``dict``
+        duration of each stage in seconds. If defer_kpi is True, the KPIs are not computed, and the keyword
+        arguments of :func:`compute_kpis` are also returned
+    """
 
     ut.check_scenario(n_scenarios, scenario_id)
     time_parameters = gu.time_parameters(weeks, start_date)
@@ -187,14 +790,28 @@ def generate_inner(case, start_date, weeks, by_n_weeks, n_scenarios, mode,
     )
 
     year = time_parameters['year']
+    stage_durations = {}
+    params, loads_charac, prods_charac = None, None, None
 
     # Chronic generation
     if 'L' in mode or 'R' in mode:
         generator = GeneratorBackend()
+        generator.time_window = time_window
+        generator.window_pool = window_pool
+        generator.dtype = dtype
+        generator.stream = stream
+        if stage_workers is not None:
+            generator.stage_workers = stage_workers
+        if manifest is not None:
+            generator.completed_stages = manifest.completed_stages
+            generator.on_stage_completed = manifest.stage_completed
         params, loads_charac, prods_charac = gen.main(generator,
             case, n_scenarios, generation_input_folder,
             generation_output_folder, scen_names, time_parameters,
             mode, scenario_id, seed_for_loads, seed_for_res, seed_for_dispatch)
+        stage_durations.update(generator.stage_durations)
+        if manifest is not None and generator.stage_peak_memory:
+            manifest.record_peak_memory(generator.stage_peak_memory)
         scenario_name = scen_names(scenario_id)
         if by_n_weeks is not None and 'T' in mode:
             output_processor_to_chunks(
@@ -204,20 +821,56 @@ def generate_inner(case, start_date, weeks, by_n_weeks, n_scenarios, mode,
                 generation_output_folder, scenario_name, weeks, by_n_weeks,
                 n_scenarios, start_date, int(params['dt']))
 
-    # KPI formatting and computing
-    if 'R' in mode and 'K' in mode and 'T' not in mode:
+    kpi_task = dict(kpi_input_folder=kpi_input_folder, generation_output_folder=generation_output_folder,
+                    scen_names=scen_names, kpi_output_folder=kpi_output_folder, year=year, case=case,
+                    n_scenarios=n_scenarios, mode=mode, params=params, loads_charac=loads_charac,
+                    prods_charac=prods_charac, scenario_id=scenario_id)
+    if defer_kpi:
+        return stage_durations, kpi_task
+    stage_durations.update(compute_kpis(manifest=manifest, **kpi_task))
+    return stage_durations
+
+
+def compute_kpis(kpi_input_folder, generation_output_folder, scen_names, kpi_output_folder, year, case,
+                 n_scenarios, mode, params, loads_charac, prods_charac, scenario_id=None, manifest=None):
+    """
+    KPI formatting and computing, if K is in mode and unless a previous run has already done it
+
+    Returns
+    -------
+    stage_durations: ``dict``
+        duration of K in seconds, if it has been computed
+    """
+    stage_durations = {}
+    kpi_done = manifest is not None and 'K' in manifest.completed_stages
+    if kpi_done or 'K' not in mode:
+        return stage_durations
+
+    start_kpi = time.perf_counter()
+    if tracemalloc.is_tracing():
+        reset_peak_memory()
+    if 'R' in mode and 'T' not in mode:
         # Get and format solar and wind on all timescale, then compute KPI and save plots
         wind_solar_only = True
-        kpis.main(kpi_input_folder, generation_output_folder, scen_names,
-                  kpi_output_folder, year, case, n_scenarios, wind_solar_only,
-                  params, loads_charac, prods_charac, scenario_id)
+        with tracing.span('stage', stage='K'):
+            kpis.main(kpi_input_folder, generation_output_folder, scen_names,
+                      kpi_output_folder, year, case, n_scenarios, wind_solar_only,
+                      params, loads_charac, prods_charac, scenario_id)
 
-    elif 'T' in mode and 'K' in mode:
+    elif 'T' in mode:
         # Get and format dispatched chronics, then compute KPI and save plots
         wind_solar_only = False
-        kpis.main(kpi_input_folder, generation_output_folder, scen_names,
-                  kpi_output_folder, year, case, n_scenarios, wind_solar_only,
-                  params, loads_charac, prods_charac, scenario_id)
+        with tracing.span('stage', stage='K'):
+            kpis.main(kpi_input_folder, generation_output_folder, scen_names,
+                      kpi_output_folder, year, case, n_scenarios, wind_solar_only,
+                      params, loads_charac, prods_charac, scenario_id)
+
+    stage_durations['K'] = time.perf_counter() - start_kpi
+    if manifest is not None:
+        if tracemalloc.is_tracing():
+            manifest.record_peak_memory({'K': tracemalloc.get_traced_memory()[1]})
+        manifest.stage_completed('K')
+    return stage_durations
 
 
 def create_directory_tree(case, start_date, output_directory, scenario_name,
@@ -0,0 +1,237 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""
+Manifests of generated scenarios, used to resume an interrupted generation run.
+
+Each scenario folder contains a manifest (:data:`chronix2grid.constants.MANIFEST_FILE_NAME`) that records the seeds of
+the scenario, a hash of the configuration it was generated with and the stages (L, R, D, T, K) that are completed.
+Once all the requested stages are done, the size and checksum of every file of the scenario are added to it.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+import re
+import threading
+
+import chronix2grid.constants as cst
+
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_COMPLETED = 'completed'
+
+
+def file_checksum(path, block_size=2 ** 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def describe_files(folder):
+    """
+    Size and sha256 checksum of every file in folder and its sub folders (except the manifest itself)
+
+    Returns
+    -------
+    files: ``dict``
+        {relative path: {"size": ``int``, "sha256": ``str``}}
+    """
+    files = {}
+    for root, _, file_names in os.walk(folder):
+        for file_name in sorted(file_names):
+            if file_name.startswith(cst.MANIFEST_FILE_NAME):
+                continue
+            path = os.path.join(root, file_name)
+            files[os.path.relpath(path, folder)] = dict(size=os.path.getsize(path), sha256=file_checksum(path))
+    return files
+
+
+def config_hash(input_folder, case, **run_settings):
+    """
+    Hash of the inputs of a generation run: files of the case folder and of the patterns folder, sub folders
+    included (except the temporary ones, see CONFIG_HASH_IGNORED_FOLDERS), and settings of the run such as
+    start date and number of weeks
+
+    Parameters
+    ----------
+    input_folder: ``str``
+        generation input folder, that contains the case folder
+    case: ``str``
+    run_settings:
+        any other setting that has an impact on the generated chronics
+    """
+    sha = hashlib.sha256()
+    sha.update(json.dumps(run_settings, sort_keys=True, default=str).encode())
+    for folder in [os.path.join(input_folder, case), os.path.join(input_folder, 'patterns')]:
+        if not os.path.isdir(folder):
+            continue
+        for root, folder_names, file_names in os.walk(folder):
+            # Temporary folders written during generation are skipped, sub folders are visited in a stable order
+            folder_names[:] = sorted(name for name in folder_names if name not in cst.CONFIG_HASH_IGNORED_FOLDERS)
+            for file_name in sorted(file_names):
+                if _is_derived_file(file_name):
+                    continue
+                path = os.path.join(root, file_name)
+                sha.update(os.path.relpath(path, folder).replace(os.sep, '/').encode())
+                sha.update(file_checksum(path).encode())
+    return sha.hexdigest()
+
+
+def _is_derived_file(file_name):
+    # Binary sidecars of the loss patterns (see loss_pattern_store) and their temporary files, written
+    # during a run and derived from a file that is hashed anyway
+    return file_name.endswith('.tmp') or re.search(r'\.[0-9a-f]{16}\.npy$', file_name) is not None
+
+
+def read_manifest(scenario_path):
+    path = os.path.join(scenario_path, cst.MANIFEST_FILE_NAME)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except ValueError:
+        # manifest written partially, the scenario has to be generated again
+        return None
+
+
+def write_manifest(scenario_path, manifest):
+    """
+    Writes the manifest in a temporary file first, so that an interrupted run never leaves a partial manifest
+    """
+    path = os.path.join(scenario_path, cst.MANIFEST_FILE_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def dispatch_failed(scenario_path):
+    return os.path.exists(os.path.join(scenario_path, cst.DISPATCH_FAILED_FILE_NAME))
+
+
+class ScenarioManifest:
+    """
+    Manifest of one scenario, updated each time a stage of its generation is completed
+
+    Attributes
+    ----------
+    scenario_path: ``str``
+        folder of the scenario, where the manifest is written
+    data: ``dict``
+        content of the manifest
+    """
+    def __init__(self, scenario_path, scenario_name, seeds, config_hash, mode):
+        self.scenario_path = scenario_path
+        self.data = dict(
+            scenario=scenario_name,
+            status=STATUS_IN_PROGRESS,
+            mode=mode,
+            seeds={key: (int(seed) if seed is not None else None) for key, seed in seeds.items()},
+            config_hash=config_hash,
+            stages={},
+            files={}
+        )
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # The manifest can be sent to another process, for instance to compute the KPIs of the scenario
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def completed_stages(self):
+        return set(self.data['stages'])
+
+    def stages_completed(self):
+        """
+        True if all the stages of the requested mode have already been completed
+        """
+        return all(stage in self.data['stages'] for stage in self.data['mode'])
+
+    def is_completed(self):
+        """
+        True if the scenario is completed: all its stages are completed, and so are the steps that follow them
+        (output chunks, checksums of the files, see :meth:`complete`)
+        """
+        return self.data['status'] == STATUS_COMPLETED and self.stages_completed()
+
+    def resume(self):
+        """
+        Reads the manifest of a previous run of the scenario, and keeps its completed stages if they can be trusted:
+        same seeds and configuration, unchanged files for a completed scenario and no failed dispatch.
+        Otherwise, the scenario will be generated from scratch
+
+        Returns
+        -------
+        completed_stages: ``set``
+        """
+        previous = read_manifest(self.scenario_path)
+        if previous is None:
+            return self.completed_stages
+        if previous.get('seeds') != self.data['seeds'] or previous.get('config_hash') != self.data['config_hash']:
+            print('Seeds or configuration have changed since the previous run: generating the scenario again')
+            return self.completed_stages
+        if previous.get('status') == STATUS_COMPLETED:
+            files = describe_files(self.scenario_path)
+            if any(files.get(name) != description for name, description in previous['files'].items()):
+                print('Files of the previous run are missing or modified: generating the scenario again')
+                return self.completed_stages
+
+        stages = dict(previous.get('stages', {}))
+        if dispatch_failed(self.scenario_path):
+            # Dispatch and what depends on it have to be computed again
+            for stage in ['T', 'K']:
+                stages.pop(stage, None)
+        elif previous.get('status') == STATUS_COMPLETED:
+            self.data['status'] = STATUS_COMPLETED
+            self.data['files'] = previous['files']
+        self.data['stages'] = stages
+        return self.completed_stages
+
+    def stage_completed(self, stage):
+        """
+        Records that a stage is completed. A dispatch that has written the DISPATCH_FAILED marker is not completed
+        """
+        with self._lock:
+            if stage == 'T' and dispatch_failed(self.scenario_path):
+                return
+            self.data['stages'][stage] = dict(completed_at=dt.datetime.now().isoformat(timespec='seconds'))
+            self.save()
+
+    def record_peak_memory(self, peak_memory):
+        """
+        Records the peak memory allocated during each stage, in bytes (see the --trace-memory option)
+        """
+        with self._lock:
+            self.data.setdefault('peak_memory', {}).update(
+                {stage: int(peak) for stage, peak in peak_memory.items()})
+            self.save()
+
+    def complete(self):
+        """
+        Records the size and checksum of the files of the scenario once all the stages are completed
+        """
+        with self._lock:
+            if not self.stages_completed():
+                self.save()
+                return
+            self.data['status'] = STATUS_COMPLETED
+            self.data['files'] = describe_files(self.scenario_path)
+            self.save()
+
+    def save(self):
+        write_manifest(self.scenario_path, self.data)
@@ -79,6 +79,7 @@ def output_processor_to_chunks(output_path, scenario_name, by_n_weeks, n_scenari
             csv_files_to_process = [
                 os.path.join(output_path, scenario_name, csv_file) for csv_file in csv_files_to_process
                 if os.path.isfile(os.path.join(output_path, scenario_name, csv_file))
+                and not csv_file.startswith(cst.MANIFEST_FILE_NAME)
             ]
             generate_chunks(csv_files_to_process, chunk_size)
 
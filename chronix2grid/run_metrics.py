@@ -0,0 +1,191 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""
+Progress and throughput metrics of a generation run.
+
+Workers record the durations of their OPF solves with :func:`record_duration`, and each generated scenario returns
+its metrics (duration of each stage, OPF solve times) to the main process. There, :class:`RunMetrics` aggregates
+them and writes, each time a scenario is finished, a JSON file (and optionally a file in Prometheus text format)
+in the output folder.
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import chronix2grid.constants as cst
+
+_durations = {}
+_durations_lock = threading.Lock()
+
+
+def record_duration(name, seconds):
+    """
+    Records a duration (for instance of an OPF solve) in the current process
+    """
+    with _durations_lock:
+        _durations.setdefault(name, []).append(float(seconds))
+
+
+def pop_durations():
+    """
+    Returns the durations recorded in the current process since the last call, by name
+    """
+    with _durations_lock:
+        durations = dict(_durations)
+        _durations.clear()
+    return durations
+
+
+def describe(values):
+    """
+    Count, sum, mean, median, 95th percentile and maximum of a list of durations
+    """
+    if len(values) == 0:
+        return dict(count=0)
+    values = np.asarray(values, dtype=float)
+    return dict(count=int(len(values)),
+                total=float(values.sum()),
+                mean=float(values.mean()),
+                p50=float(np.percentile(values, 50)),
+                p95=float(np.percentile(values, 95)),
+                max=float(values.max()))
+
+
+def write_atomic(path, content):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+class RunMetrics:
+    """
+    Aggregates the metrics of the scenarios of a run and writes them in the output folder
+
+    Attributes
+    ----------
+    n_scenarios: ``int``
+        number of scenarios of the run
+    output_folder: ``str`` or ``None``
+        folder where metrics are written. None not to write them
+    prometheus: ``bool``
+        whether to also write metrics in Prometheus text format
+    workers: ``int``
+        number of scenarios generated at the same time, to estimate the time to completion
+    """
+    def __init__(self, n_scenarios, output_folder=None, prometheus=False, workers=1):
+        self.n_scenarios = n_scenarios
+        self.output_folder = output_folder
+        self.prometheus = prometheus
+        self.workers = max(1, workers)
+        self.start_time = time.time()
+        self.done = set()
+        self.failed = set()
+        self.skipped = set()
+        self.stage_durations = {}
+        self.scenario_durations = []
+        self.opf_solve_times = []
+
+    def update(self, scenario_name, error=None, scenario_metrics=None):
+        """
+        Takes into account a scenario that has just finished (successfully or not), then writes the metrics
+
+        Parameters
+        ----------
+        scenario_name: ``str``
+        error: ``dict`` or ``None``
+            error of the scenario, if it has failed
+        scenario_metrics: ``dict`` or ``None``
+            metrics returned by the scenario, with keys "duration", "stages" and "opf_solve_times". None without
+            error for a scenario skipped because it was already generated (resumed run)
+        """
+        if error is None and scenario_metrics is None:
+            self.skipped.add(scenario_name)
+            self.failed.discard(scenario_name)
+        elif error is None:
+            self.done.add(scenario_name)
+            self.failed.discard(scenario_name)
+        else:
+            self.failed.add(scenario_name)
+        if scenario_metrics:
+            if scenario_metrics.get('duration') is not None:
+                self.scenario_durations.append(scenario_metrics['duration'])
+            for stage, duration in scenario_metrics.get('stages', {}).items():
+                self.stage_durations.setdefault(stage, []).append(duration)
+            self.opf_solve_times.extend(scenario_metrics.get('opf_solve_times', []))
+        self.write()
+
+    def summary(self):
+        elapsed = time.time() - self.start_time
+        remaining = self.n_scenarios - len(self.done) - len(self.failed) - len(self.skipped)
+        eta = None
+        if self.scenario_durations:
+            # Only generated scenarios: skipped ones take no time and the elapsed time includes the start of the run
+            eta = float(np.mean(self.scenario_durations)) * remaining / self.workers
+        return dict(
+            scenarios=dict(total=self.n_scenarios, done=len(self.done), failed=len(self.failed),
+                           skipped=len(self.skipped), remaining=remaining),
+            elapsed_seconds=elapsed,
+            eta_seconds=eta,
+            scenario_duration=describe(self.scenario_durations),
+            stages={stage: describe(durations) for stage, durations in sorted(self.stage_durations.items())},
+            opf_solve_time=describe(self.opf_solve_times),
+            updated_at=time.strftime('%Y-%m-%dT%H:%M:%S'),
+        )
+
+    def write(self):
+        if self.output_folder is None:
+            return
+        summary = self.summary()
+        write_atomic(os.path.join(self.output_folder, cst.METRICS_FILE_NAME), json.dumps(summary, indent=4))
+        if self.prometheus:
+            write_atomic(os.path.join(self.output_folder, cst.PROMETHEUS_METRICS_FILE_NAME),
+                         to_prometheus(summary))
+
+
+def to_prometheus(summary):
+    """
+    Formats the summary of :class:`RunMetrics` in Prometheus text exposition format
+    """
+    lines = []
+
+    def header(name, help_text, metric_type):
+        lines.append(f'# HELP chronix2grid_{name} {help_text}')
+        lines.append(f'# TYPE chronix2grid_{name} {metric_type}')
+
+    def sample(name, value, **labels):
+        if value is None:
+            return
+        label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+        label_text = '{' + label_text + '}' if label_text else ''
+        lines.append(f'chronix2grid_{name}{label_text} {value}')
+
+    def add_summary(name, description, **labels):
+        for quantile, key in [('0.5', 'p50'), ('0.95', 'p95')]:
+            sample(name, description.get(key), quantile=quantile, **labels)
+        sample(name + '_sum', description.get('total', 0.), **labels)
+        sample(name + '_count', description['count'], **labels)
+
+    header('scenarios', 'Number of scenarios of the run by state', 'gauge')
+    for state in ['done', 'failed', 'skipped', 'remaining']:
+        sample('scenarios', summary['scenarios'][state], state=state)
+    header('elapsed_seconds', 'Time since the beginning of the run', 'gauge')
+    sample('elapsed_seconds', summary['elapsed_seconds'])
+    header('eta_seconds', 'Estimated time before the end of the run', 'gauge')
+    sample('eta_seconds', summary['eta_seconds'])
+    header('stage_duration_seconds', 'Duration of the generation stages', 'summary')
+    for stage, description in summary['stages'].items():
+        add_summary('stage_duration_seconds', description, stage=stage)
+    header('opf_solve_seconds', 'Duration of the OPF solves', 'summary')
+    add_summary('opf_solve_seconds', summary['opf_solve_time'])
+    return '\n'.join(lines) + '\n'
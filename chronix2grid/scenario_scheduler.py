@@ -0,0 +1,408 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""
+Fault tolerant execution of the scenarios of a generation run.
+
+Scenarios are sent one by one to the processes of a pool, so that a free process always takes the next scenario
+whatever the time taken by the others. A failing scenario does not stop the others: its error is captured, the
+scenario is tried again up to a given number of times, and the errors of the scenarios that still fail are written in
+:data:`chronix2grid.constants.ERRORS_FILE_NAME`.
+
+The end of each scenario (typically the KPIs) can be handed to a second pool, so that generation processes go on with
+the next scenarios meanwhile. The number of scenarios in flight is then bounded to keep the memory under control.
+
+The processes of both pools report the scenario they start, and are checked from the current process every
+:data:`chronix2grid.constants.SCENARIO_WATCH_INTERVAL` seconds. The scenario of a process that has died (killed by the
+system when out of memory, crashed in a C library...) is a failed attempt, with a ``WorkerLostError``, instead of a
+result the pool would wait for forever.
+
+A scenario timeout is first raised in the worker by SIGALRM. A worker that does not stop, for instance stuck in a C
+call where the signal is not handled, is terminated from the current process a grace period later
+(:data:`chronix2grid.constants.SCENARIO_TIMEOUT_GRACE`): the pool is replaced by a new one, and the other scenarios it
+was running are started again.
+"""
+
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import traceback
+import warnings
+from functools import partial
+
+import chronix2grid.constants as cst
+
+
+class ScenarioTimeoutError(Exception):
+    """
+    Raised in a worker when a scenario takes more time than allowed
+    """
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise ScenarioTimeoutError()
+
+
+def run_scenario(func, timeout, scenario_id, *args):
+    """
+    Runs func(scenario_id, *args) and captures its error, if any
+
+    Parameters
+    ----------
+    func: ``callable``
+        function that generates one scenario
+    timeout: ``float`` or ``None``
+        maximum duration of the scenario in seconds. Only available on systems with SIGALRM (not on Windows)
+    scenario_id: ``int``
+    args:
+        other arguments of func
+
+    Returns
+    -------
+    scenario_id: ``int``
+    error: ``dict`` or ``None``
+        None if the scenario succeeded. Otherwise, type, message and traceback of the error
+    result:
+        value returned by func, None if it has failed
+    """
+    # Signals can only be handled in the main thread
+    use_alarm = (timeout is not None and hasattr(signal, 'SIGALRM')
+                 and threading.current_thread() is threading.main_thread())
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
+    result = None
+    try:
+        result = func(scenario_id, *args)
+        error = None
+    except ScenarioTimeoutError:
+        error = dict(type='ScenarioTimeoutError',
+                     message=f'Scenario not finished after {timeout} seconds',
+                     traceback=traceback.format_exc())
+    except Exception as e:
+        error = dict(type=type(e).__name__, message=str(e), traceback=traceback.format_exc())
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    if error is not None:
+        error['duration'] = time.perf_counter() - start
+        error['pid'] = os.getpid()
+    return scenario_id, error, result
+
+
+# Queue where the processes of a watched pool report the tasks they start
+_started_tasks = None
+
+
+def _init_watched_worker(started_tasks):
+    global _started_tasks
+    _started_tasks = started_tasks
+
+
+def _run_watched(token, func, *args):
+    # The report is written in the pipe before the task starts, it is not lost if the process dies during the task
+    _started_tasks.put((token, os.getpid()))
+    return func(*args)
+
+
+class _WatchedPool:
+    """
+    Pool of processes whose scenario tasks are watched from the current process
+
+    A multiprocessing pool replaces a process that has died (killed by the system when out of memory, crashed in a C
+    library...) but waits forever for the result of its task. Here, each process reports the task it starts, so that
+    the tasks of the processes that have died, and the tasks past their deadline, are given up from the current process.
+
+    Parameters
+    ----------
+    processes: ``int``
+        number of processes of the pool
+    max_tasks_per_child: ``int`` or ``None``
+        number of tasks after which a process of the pool is replaced by a new one
+    events: ``queue.Queue``
+        where (step, token, (scenario_id, error, result)) is put at the end of each task
+    step: ``str``
+        step of the scenarios done by the pool, put in its events
+    timeout: ``float`` or ``None``
+        maximum duration of one task in seconds
+    """
+
+    def __init__(self, processes, max_tasks_per_child, events, step, timeout=None):
+        self.processes = processes
+        self.max_tasks_per_child = max_tasks_per_child
+        self.events = events
+        self.step = step
+        self.timeout = timeout
+        self.grace = min(timeout, cst.SCENARIO_TIMEOUT_GRACE) if timeout is not None else None
+        self.tokens = itertools.count()
+        # Tasks sent and not finished yet by token. The result of a task that is not there any more is ignored
+        self.tasks = {}
+        # Processes of the pool seen alive by pid, to get their exit code once they have died
+        self.workers = {}
+        # The pool waits forever for the results of the tasks of dead processes, it cannot be joined any more
+        self.lost_tasks = False
+        self.last_check = time.perf_counter()
+        self.started_tasks = None
+        self.pool = None
+        self._start()
+
+    def _start(self):
+        self.started_tasks = multiprocessing.SimpleQueue()
+        self.pool = multiprocessing.Pool(self.processes, initializer=_init_watched_worker,
+                                         initargs=(self.started_tasks,), maxtasksperchild=self.max_tasks_per_child)
+
+    def submit(self, func, scenario_id, *args):
+        """
+        Runs func(scenario_id, *args) in the pool with :func:`run_scenario`
+        """
+        token = next(self.tokens)
+        self.tasks[token] = dict(func=func, scenario_id=scenario_id, args=args, pid=None, start=None, lost_since=None)
+        self.pool.apply_async(
+            _run_watched, (token, run_scenario, func, self.timeout, scenario_id) + args,
+            callback=partial(_put_event, self.events, self.step, token),
+            error_callback=partial(_put_pool_error, self.events, self.step, token, scenario_id))
+
+    def finish(self, token):
+        """
+        Returns False if the task of token has already been given up, and its result must be ignored
+        """
+        return self.tasks.pop(token, None) is not None
+
+    def check(self):
+        """
+        Gives up the tasks of the processes that have died and the tasks past their deadline
+
+        The processes are checked at most every :data:`chronix2grid.constants.SCENARIO_WATCH_INTERVAL` seconds. When
+        a task is past its deadline, the pool is replaced by a new one and its other tasks are sent again to it.
+
+        Returns
+        -------
+        failed: ``list``
+            scenario id and error of each task given up
+        """
+        now = time.perf_counter()
+        if now - self.last_check < cst.SCENARIO_WATCH_INTERVAL:
+            return []
+        self.last_check = now
+        while not self.started_tasks.empty():
+            token, pid = self.started_tasks.get()
+            if token in self.tasks:
+                self.tasks[token].update(pid=pid, start=now)
+        alive = {process.pid: process for process in multiprocessing.active_children()}
+        self.workers.update(alive)
+
+        failed = []
+        expired = False
+        for token, task in list(self.tasks.items()):
+            pid = task['pid']
+            if pid is None:
+                continue
+            if pid not in alive:
+                # The result of the task may still be on its way: it is given up if it has not come at the next check
+                if task['lost_since'] is None:
+                    task['lost_since'] = now
+                    continue
+                del self.tasks[token]
+                self.lost_tasks = True
+                # Unknown if the pool has already replaced the process before it has been seen
+                exit_code = self.workers[pid].exitcode if pid in self.workers else None
+                message = f'Process {pid} has died before the end of the scenario'
+                if exit_code is not None:
+                    message += f' (exit code {exit_code})'
+                failed.append((task['scenario_id'], dict(
+                    type='WorkerLostError', traceback='', duration=now - task['start'], pid=pid, message=message)))
+            elif self.timeout is not None and now - task['start'] >= self.timeout + self.grace:
+                del self.tasks[token]
+                expired = True
+                failed.append((task['scenario_id'], dict(
+                    type='ScenarioTimeoutError', traceback='', duration=now - task['start'], pid=pid,
+                    message=f'Scenario not finished after {self.timeout} seconds, its process has been terminated')))
+        running = {task['pid'] for task in self.tasks.values()}
+        self.workers = {pid: worker for pid, worker in self.workers.items() if pid in alive or pid in running}
+        if expired:
+            self.restart()
+        return failed
+
+    def restart(self):
+        """
+        Terminates the processes of the pool and sends its tasks again to a new pool. This is not an attempt
+        """
+        self.pool.terminate()
+        self.pool.join()
+        tasks = self.tasks
+        self.tasks = {}
+        self.lost_tasks = False
+        self._start()
+        for task in tasks.values():
+            self.submit(task['func'], task['scenario_id'], *task['args'])
+
+    def close(self):
+        if self.lost_tasks:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+
+
+def run_scenarios(func, scenario_ids, nb_core, scenario_names=None, timeout=None, retries=0,
+                  max_tasks_per_child=cst.DEFAULT_MAX_TASKS_PER_CHILD, errors_folder=None, sequential=False,
+                  on_result=None, post_func=None, post_workers=1, max_in_flight=None):
+    """
+    Generates scenarios in a pool of processes, trying again the failed ones
+
+    Parameters
+    ----------
+    func: ``callable``
+        function that generates one scenario given its id. It must be picklable
+    scenario_ids: ``list``
+    nb_core: ``int``
+        number of processes of the pool
+    scenario_names: ``callable`` or ``None``
+        gives the name of a scenario from its id, used as key in the errors file
+    timeout: ``float`` or ``None``
+        maximum duration of one scenario in seconds (and of its post processing, if any), counted from the moment
+        a process of the pool starts it
+    retries: ``int``
+        number of times a failed scenario is tried again
+    max_tasks_per_child: ``int`` or ``None``
+        number of scenarios after which a process of the pool is replaced by a new one, to release the memory that
+        may be kept by some libraries. None to keep the processes until the end
+    errors_folder: ``str`` or ``None``
+        where the errors file is written
+    sequential: ``bool``
+        if True, scenarios are run one after the other in the current process, for instance when each scenario
+        uses its own pool of processes (generation by time windows). Otherwise a pool of nb_core processes is created
+    on_result: ``callable`` or ``None``
+        called in the current process with the name, the error (None on success) and the result of each scenario
+        as soon as it is finished
+    post_func: ``callable`` or ``None``
+        if given, post_func(scenario_id, result) is called with the result of func in a separate pool of
+        post_workers processes, and its own return value is the result of the scenario. Generation processes do not
+        wait for it and go on with the next scenarios. It must be picklable
+    post_workers: ``int``
+        number of processes of the post processing pool
+    max_in_flight: ``int`` or ``None``
+        maximum number of scenarios started and not finished yet (post processing included), so that results
+        waiting for post processing do not fill the memory. By default, nb_core + post_workers with post processing,
+        no limit otherwise
+
+    Returns
+    -------
+    errors: ``dict``
+        errors of the scenarios that have failed after all their attempts, by scenario name
+    """
+    if timeout is not None and not hasattr(signal, 'SIGALRM') and sequential:
+        warnings.warn('Scenario timeout is not available on this system, it is ignored', UserWarning)
+    if scenario_names is None:
+        scenario_names = str
+    if max_in_flight is None:
+        max_in_flight = nb_core + post_workers if post_func is not None else len(scenario_ids)
+    max_in_flight = max(1, max_in_flight)
+
+    attempts = {scenario_id: 0 for scenario_id in scenario_ids}
+    errors = {}
+    pending = collections.deque(scenario_ids)
+    # Results of the pools are sent by their callbacks, in the result handler thread of the pools
+    events = queue.Queue()
+    in_flight = 0
+
+    def handle_result(scenario_id, error, result):
+        attempts[scenario_id] += 1
+        name = scenario_names(scenario_id)
+        if on_result is not None:
+            on_result(name, error, result)
+        if error is None:
+            errors.pop(name, None)
+            return
+        error.update(scenario_id=scenario_id, attempts=attempts[scenario_id])
+        errors[name] = error
+        print(f'Scenario {name} failed (attempt {attempts[scenario_id]}): {error["type"]} {error["message"]}')
+        if attempts[scenario_id] <= retries:
+            pending.append(scenario_id)
+
+    scenario_pool = None
+    post_pool = None
+    pools = []
+    try:
+        if not sequential:
+            scenario_pool = _WatchedPool(nb_core, max_tasks_per_child, events, 'generated', timeout)
+            pools.append(scenario_pool)
+        if post_func is not None:
+            post_pool = _WatchedPool(post_workers, max_tasks_per_child, events, 'finished', timeout)
+            pools.append(post_pool)
+
+        while pending or in_flight:
+            if pending and in_flight < max_in_flight:
+                scenario_id = pending.popleft()
+                in_flight += 1
+                if scenario_pool is None:
+                    events.put(('generated', None, run_scenario(func, timeout, scenario_id)))
+                else:
+                    scenario_pool.submit(func, scenario_id)
+                    continue
+
+            watching = any(pool.tasks for pool in pools)
+            try:
+                event = events.get(timeout=cst.SCENARIO_WATCH_INTERVAL if watching else None)
+            except queue.Empty:
+                event = None
+            if events.empty():
+                # Tasks of dead processes or past their deadline are failed attempts
+                for pool in pools:
+                    for scenario_id, error in pool.check():
+                        in_flight -= 1
+                        handle_result(scenario_id, error, None)
+            if event is None:
+                continue
+
+            step, token, (scenario_id, error, result) = event
+            pool = scenario_pool if step == 'generated' else post_pool
+            if token is not None and not pool.finish(token):
+                continue
+            if step == 'generated' and error is None and post_pool is not None:
+                post_pool.submit(post_func, scenario_id, result)
+                continue
+            in_flight -= 1
+            handle_result(scenario_id, error, result)
+
+        for pool in pools:
+            pool.close()
+    finally:
+        for pool in pools:
+            pool.terminate()
+
+    if errors_folder is not None:
+        write_errors(errors_folder, errors)
+    return errors
+
+
+def _put_event(events, step, token, outcome):
+    events.put((step, token, outcome))
+
+
+def _put_pool_error(events, step, token, scenario_id, exception):
+    # Errors of the pool itself, for instance a result that cannot be pickled
+    error = dict(type=type(exception).__name__, message=str(exception), traceback='', duration=None, pid=None)
+    events.put((step, token, (scenario_id, error, None)))
+
+
+def write_errors(errors_folder, errors):
+    with open(os.path.join(errors_folder, cst.ERRORS_FILE_NAME), 'w') as f:
+        json.dump(errors, f, indent=4, sort_keys=True)
@@ -0,0 +1,149 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""
+Small scheduler that runs the generation stages of one scenario (L, R, D, T) as a dependency graph.
+The KPIs (K) are computed once the scheduler is done, possibly in another process (see main.compute_kpis).
+
+Stages that do not depend on each other (typically L and R, which use separate seeds and share no data)
+are run concurrently in a pool of threads. Each stage keeps its own random generator, so the results do
+not depend on the order in which independent stages are executed.
+"""
+
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from chronix2grid import tracing
+
+STAGE_DEPENDENCIES = {
+    'L': (),
+    'R': (),
+    'D': ('L', 'R'),
+    'T': ('L', 'R', 'D'),
+}
+
+
+def reset_peak_memory():
+    """
+    Resets the peak memory traced by :mod:`tracemalloc`, so that it is measured by stage. Before python 3.9, which
+    has no tracemalloc.reset_peak, tracing is started again: the peak then only counts the memory allocated since
+    """
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+class StageScheduler:
+    """
+    Runs a set of stages, each one being started as soon as all the stages it depends on are finished.
+
+    Dependencies on stages that have not been added to the scheduler are ignored, so that the same
+    dependency graph (:data:`STAGE_DEPENDENCIES`) can be used whatever the generation mode is.
+
+    Attributes
+    ----------
+    max_workers: ``int``
+        maximum number of stages running at the same time. With 1, stages are run sequentially in the order
+        in which they have been added
+    durations: ``dict``
+        wall time in seconds of each stage, filled by :func:`StageScheduler.run`
+    peak_memory: ``dict``
+        peak memory allocated by Python during each stage in bytes, only filled if :mod:`tracemalloc` is tracing.
+        It is only meaningful if stages are run sequentially (max_workers=1)
+    """
+    def __init__(self, max_workers=2):
+        self.max_workers = max(1, int(max_workers))
+        self.durations = {}
+        self.peak_memory = {}
+        self._stages = {}
+
+    def add_stage(self, name, func, depends_on=None):
+        """
+        Registers a stage
+
+        Parameters
+        ----------
+        name: ``str``
+            name of the stage, such as "L" or "R"
+        func: ``callable``
+            function that computes the stage. It receives a ``dict`` with the results of the stages that are
+            already finished, and its own return value is made available to the stages that depend on it
+        depends_on: ``tuple`` or ``None``
+            names of the stages that must be finished before this one starts. By default, dependencies are
+            read from :data:`STAGE_DEPENDENCIES`
+        """
+        if name in self._stages:
+            raise ValueError(f'Stage {name} has already been added to the scheduler')
+        if depends_on is None:
+            depends_on = STAGE_DEPENDENCIES.get(name, ())
+        self._stages[name] = (func, tuple(depends_on))
+
+    def _is_ready(self, name, results):
+        _, depends_on = self._stages[name]
+        return all(dep in results for dep in depends_on if dep in self._stages)
+
+    def _timed(self, name, finished_results):
+        func, _ = self._stages[name]
+        trace_memory = tracemalloc.is_tracing()
+        if trace_memory:
+            reset_peak_memory()
+        start = time.perf_counter()
+        with tracing.span('stage', stage=name):
+            result = func(finished_results)
+        self.durations[name] = time.perf_counter() - start
+        if trace_memory:
+            self.peak_memory[name] = tracemalloc.get_traced_memory()[1]
+        return result
+
+    def run(self):
+        """
+        Runs all the registered stages
+
+        Returns
+        -------
+        results: ``dict``
+            return value of each stage, by stage name
+        """
+        for name, (_, depends_on) in self._stages.items():
+            unknown = [dep for dep in depends_on if dep not in STAGE_DEPENDENCIES and dep not in self._stages]
+            if unknown:
+                raise ValueError(f'Stage {name} depends on unknown stages {unknown}')
+
+        results = {}
+        pending = list(self._stages)
+        running = {}
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while pending or running:
+                ready = [name for name in pending if self._is_ready(name, results)]
+                if ready and (len(ready) == 1 or self.max_workers == 1) and not running:
+                    # Nothing to run concurrently: the stage is run in the calling thread, so that it can be
+                    # interrupted by a signal (see chronix2grid.scenario_scheduler) and profiled
+                    name = ready[0]
+                    pending.remove(name)
+                    results[name] = self._timed(name, dict(results))
+                    continue
+                for name in ready:
+                    pending.remove(name)
+                    running[executor.submit(self._timed, name, dict(results))] = name
+                if not running:
+                    raise RuntimeError(f'Circular dependency between stages {pending}')
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+        finally:
+            # On error, the stages not started are cancelled (the cancel_futures argument of shutdown needs python
+            # 3.9) and the running ones are waited for: the scenario may be generated again in the same folder
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=True)
+        return results
@@ -0,0 +1,130 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+"""
+Lightweight spans to see where the wall time of a generation run goes.
+
+Code to be measured is wrapped in ``with span('name', key=value):``. When tracing is disabled (the default), a span
+costs almost nothing. Once enabled with :func:`enable`, each span records its start, duration, process id, thread id
+and tags, plus the tags of the current context (such as the scenario id, see :func:`set_context`). Each process
+keeps its own spans: workers send them back to the main process with :func:`pop_spans`, where they are exported as
+Chrome trace events (:func:`write_chrome_trace`), to be opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_enabled = False
+_context = {}
+_spans = []
+_spans_lock = threading.Lock()
+
+
+def enable(enabled=True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def set_context(**tags):
+    """
+    Tags added to every span recorded afterwards in the current process, for instance ``scenario_id``
+    """
+    _context.clear()
+    _context.update(tags)
+
+
+def get_context():
+    return dict(_context)
+
+
+@contextmanager
+def span(name, **tags):
+    """
+    Records the duration of the code in the ``with`` block
+
+    Parameters
+    ----------
+    name: ``str``
+        name of the span, for instance "interpolation"
+    tags:
+        any json serializable information on the span, for instance the OPF window
+    """
+    if not _enabled:
+        yield
+        return
+    # Wall clock is shared by all the processes of the run, perf_counter is more precise for the duration
+    start = time.time()
+    start_counter = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start_counter
+        args = dict(_context)
+        args.update(tags)
+        record = dict(name=name, start=start, duration=duration, pid=os.getpid(),
+                      tid=threading.get_ident(), args=args)
+        with _spans_lock:
+            _spans.append(record)
+
+
+def traced(name):
+    """
+    Decorator that records each call of a function as a span
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def pop_spans():
+    """
+    Returns the spans recorded in the current process since the last call
+    """
+    with _spans_lock:
+        spans = list(_spans)
+        _spans.clear()
+    return spans
+
+
+def add_spans(spans):
+    """
+    Adds spans recorded in another process, for instance in a pool of time windows
+    """
+    with _spans_lock:
+        _spans.extend(spans)
+
+
+def to_chrome_trace(spans):
+    """
+    Converts spans to Chrome trace-event format: one complete event ("ph": "X") by span, times in microseconds
+    """
+    events = []
+    for record in sorted(spans, key=lambda record: record['start']):
+        events.append(dict(name=record['name'], cat='chronix2grid', ph='X',
+                           ts=record['start'] * 1e6, dur=record['duration'] * 1e6,
+                           pid=record['pid'], tid=record['tid'], args=record['args']))
+    return dict(traceEvents=events, displayTimeUnit='ms')
+
+
+def write_chrome_trace(path, spans):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(to_chrome_trace(spans), f, default=str)
+    os.replace(tmp_path, path)
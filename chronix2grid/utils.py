@@ -6,6 +6,19 @@
 # SPDX-License-Identifier: MPL-2.0
 # This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
 
+import inspect
+
+
 def check_scenario(n_scenarios, scenario_id):
     if n_scenarios == 1 and scenario_id is None:
         raise RuntimeError("scenario_id must not be None when n_scenarios == 1.")
+
+
+def accepts_keyword(func, name):
+    """
+    True if func (or the constructor of a class) can be called with the keyword argument name, for instance to give
+    an option to backends that may be replaced by ones written before it existed
+    """
+    parameters = inspect.signature(func).parameters.values()
+    return any(parameter.name == name and parameter.kind != inspect.Parameter.POSITIONAL_ONLY
+               or parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters)
@@ -46,7 +46,7 @@ setup(name='Chronix2Grid',
                         "PyUtilib==5.7.3",
                         "requests>=2.23.0",
                         "seaborn>=0.10.0",
-                        "scipy>=1.4.1",
+                        "scipy>=1.6.0",
                         "widgetsnbextension>=3.5.1",
                         "lightsim2grid"
                         ],
@@ -69,5 +69,7 @@ setup(name='Chronix2Grid',
                                     'getting_started/example/input/kpi/case118_l2rpn_neurips_1x/paramsKPI.json',
                                     'getting_started/example/input/kpi/case118_l2rpn_neurips_1x/France/eco2mix/*.csv',
                                     'getting_started/example/input/kpi/case118_l2rpn_neurips_1x/France/renewable_ninja/*.csv']},
-      entry_points={'console_scripts': ['chronix2grid=chronix2grid.main:generate_mp']}
+      entry_points={'console_scripts': ['chronix2grid=chronix2grid.main:generate_mp',
+                                          'chronix2grid-batch=chronix2grid.main:generate_batch',
+                                          'chronix2grid-fit-loss-model=chronix2grid.main:fit_loss_model']}
 )
@@ -1,6 +1,7 @@
 import datetime as dt
 import os
 import pdb
+import shutil
 import tempfile
 import unittest
 
@@ -13,6 +14,10 @@ import chronix2grid.default_backend as def_bk
 from chronix2grid.generation.dispatch.EconomicDispatch import (
             ChroniXScenario, init_dispatcher_from_config)
 from chronix2grid.generation.dispatch.utils import modify_hydro_ramps, modify_slack_characs
+from chronix2grid.generation._dispatch._PypsaDispatchBackend._EDispatch_L2RPN2020.run_economic_dispatch import (
+            _boundary_pu_t)
+from chronix2grid.generation._dispatch._PypsaDispatchBackend._EDispatch_L2RPN2020.utils import (
+            reconcile_window_boundaries)
 import grid2op
 from grid2op.Chronics import ChangeNothing
 
@@ -167,5 +172,74 @@ class TestChronixScenario(unittest.TestCase):
         self.assertEqual(float(simplified_chronix.solar_p.iloc[0]), 6)
 
 
+# LP solver of pypsa available in the environment, if any
+LP_SOLVER = next((name for name, command in [('cbc', 'cbc'), ('glpk', 'glpsol')] if shutil.which(command)), None)
+
+
+class TestRollingHorizon(unittest.TestCase):
+    def setUp(self):
+        # the nuclear cannot follow the step of the load at midnight, the gas can
+        self.env_df = pd.DataFrame(dict(name=['nuc', 'gas', 'solar_1', 'wind_1'],
+                                        type=['nuclear', 'thermal', 'solar', 'wind'],
+                                        pmax=[400., 400., 100., 100.],
+                                        max_ramp_up=[5., 400., 0., 0.],
+                                        max_ramp_down=[5., 400., 0., 0.],
+                                        cost_per_mw=[5., 60., 0., 0.]))
+        index = pd.date_range('2012-01-02', periods=3 * 24 * 12, freq='5min')
+        loads = pd.DataFrame(dict(load_1=np.where(index.day == 3, 380., 200.)), index=index)
+        prods = pd.DataFrame(dict(solar_1=0., wind_1=0.), index=index)
+        self.scenario = ChroniXScenario(loads, prods, dict(solar=['solar_1'], wind=['wind_1']), 'test')
+
+    def test_boundary_pu_t(self):
+        generators = pd.DataFrame(dict(p_nom=[400., 100.]), index=['nuc', 'gas'])
+        first_bounds = (pd.Series(dict(nuc=196.)), pd.Series(dict(nuc=204.)))
+        last_bounds = (pd.Series(dict(nuc=100., gas=np.nan)), pd.Series(dict(nuc=300., gas=np.nan)))
+        bounded = _boundary_pu_t(generators, 4, first_bounds, last_bounds, gen_max_pu_t=dict(nuc=np.full(4, 0.6)))
+        np.testing.assert_allclose(bounded['gen_min_pu_t']['nuc'], [0.49, 0., 0., 0.25])
+        np.testing.assert_allclose(bounded['gen_max_pu_t']['nuc'], [0.51, 0.6, 0.6, 0.6])
+        self.assertNotIn('gas', bounded['gen_min_pu_t'])
+        self.assertEqual(_boundary_pu_t(generators, 4, None, None), dict(gen_min_pu_t={}, gen_max_pu_t={}))
+
+    def test_reconcile_window_boundaries(self):
+        index = pd.date_range('2012-01-02', periods=6, freq='5min')
+        results = [pd.DataFrame(dict(nuc=production), index=index[2 * i:2 * i + 2])
+                   for i, production in enumerate([[200., 200.], [300., 300.], [300., 300.]])]
+        ramp = pd.Series(dict(nuc=5.))
+        calls = []
+
+        def solve_window(window_id, first_bounds, last_bounds):
+            # as a solver would: the window starts as high as possible and ramps up once
+            calls.append((window_id, last_bounds is not None))
+            start = first_bounds[1]['nuc']
+            if last_bounds is not None and start + 5. < last_bounds[0]['nuc']:
+                return None, 'infeasible'
+            return pd.DataFrame(dict(nuc=[start, start + 5.]), index=results[window_id].index), 'optimal'
+
+        reconciled, conditions = reconcile_window_boundaries(results, ramp, ramp, solve_window)
+        # the second window cannot reach the third one: both are dispatched again
+        self.assertEqual(calls, [(1, True), (1, False), (2, False)])
+        self.assertEqual(conditions, {1: 'optimal', 2: 'optimal'})
+        dispatch = pd.concat(reconciled)['nuc']
+        self.assertLessEqual(dispatch.diff().abs().max(), 5.)
+
+    @unittest.skipIf(LP_SOLVER is None, 'the dispatch of pypsa needs the cbc or glpk solver')
+    def test_pypsa_ramp_coupling(self):
+        from chronix2grid.generation.dispatch.PypsaDispatchBackend import PypsaDispatcher
+        dispatcher = PypsaDispatcher.from_dataframe(self.env_df)
+        dispatcher.chronix_scenario = self.scenario
+        params = dict(step_opf_min=5, mode_opf='day', reactive_comp=1., ramp_coupling_opf=True,
+                      overlap_opf_min=60)
+        results = dispatcher.run(dispatcher.net_load(0., 'agg_load'), self.scenario.solar_p.sum(axis=1),
+                                 self.scenario.wind_p.sum(axis=1), params, pyomo=False, solver_name=LP_SOLVER)
+        self.assertEqual(len(results.terminal_conditions), 3)
+        nuc = results.chronix.prods_dispatch['nuc']
+        self.assertEqual(len(nuc), len(self.scenario.loads))
+        # ramps are respected across the boundaries of the days
+        ramp = 5. - PypsaDispatcher.RampCorrectingFactor
+        for start in ['2012-01-03 00:00', '2012-01-04 00:00']:
+            step = nuc[start] - nuc[pd.Timestamp(start) - pd.Timedelta('5min')]
+            self.assertLessEqual(abs(step), ramp + 1e-3)
+
+
 if __name__ == '__main__':
     unittest.main()
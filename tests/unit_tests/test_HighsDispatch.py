@@ -0,0 +1,227 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.random import default_rng
+from scipy.optimize import linprog
+
+from chronix2grid.generation.dispatch.EconomicDispatch import ChroniXScenario, DispatchResults
+from chronix2grid.generation.dispatch.HighsDispatchBackend import HighsDispatcher
+from chronix2grid.generation._dispatch._HighsDispatchBackend.HighsEconomicDispatch import solve_dispatch
+from chronix2grid.generation._dispatch._PypsaDispatchBackend._EDispatch_L2RPN2020.utils import get_windows
+
+
+class TestSolveDispatch(unittest.TestCase):
+    def test_merit_order(self):
+        p_nom = np.array([100., 50., 80.])
+        cost = np.array([30., 10., 20.])
+        no_ramp = np.full(3, np.nan)
+        demand = np.array([40., 100., 200.])
+        dispatch, condition = solve_dispatch(p_nom, cost, no_ramp, no_ramp, np.zeros((3, 3)), np.ones((3, 3)),
+                                             demand)
+        self.assertEqual(condition, 'optimal')
+        np.testing.assert_allclose(dispatch, [[0., 40., 0.], [0., 50., 50.], [70., 50., 80.]], atol=1e-9)
+
+    def test_ramps(self):
+        p_nom = np.array([100., 100.])
+        cost = np.array([10., 50.])
+        # the cheap generator can only increase by 10 MW by step
+        dispatch, condition = solve_dispatch(p_nom, cost, np.array([0.1, np.nan]), np.array([0.1, np.nan]),
+                                             np.zeros((3, 2)), np.ones((3, 2)), np.array([20., 50., 50.]))
+        self.assertEqual(condition, 'optimal')
+        np.testing.assert_allclose(dispatch, [[20., 0.], [30., 20.], [40., 10.]], atol=1e-9)
+
+    def test_infeasible(self):
+        _, condition = solve_dispatch(np.array([10.]), np.array([1.]), np.array([np.nan]), np.array([np.nan]),
+                                      np.zeros((2, 1)), np.ones((2, 1)), np.array([5., 20.]))
+        self.assertEqual(condition, 'infeasible')
+
+    def test_same_cost_as_dense_formulation(self):
+        prng = default_rng(0)
+        n_gens, n_snapshots = 6, 48
+        p_nom = prng.uniform(50, 200, n_gens)
+        cost = prng.uniform(10, 60, n_gens)
+        ramp_up = np.where(np.arange(n_gens) % 3 == 0, np.nan, prng.uniform(0.02, 0.2, n_gens))
+        ramp_down = ramp_up * 1.5
+        p_min_pu = np.zeros((n_snapshots, n_gens))
+        p_min_pu[:, 1] = 0.2
+        p_max_pu = prng.uniform(0.5, 1, (n_snapshots, n_gens))
+        demand = 0.5 * (p_max_pu * p_nom).sum(axis=1)
+        dispatch, condition = solve_dispatch(p_nom, cost, ramp_up, ramp_down, p_min_pu, p_max_pu, demand)
+        self.assertEqual(condition, 'optimal')
+
+        # One row by constraint, variables snapshot after snapshot
+        a_eq = np.kron(np.identity(n_snapshots), np.ones((1, n_gens)))
+        a_ub, b_ub = [], []
+        for g in range(n_gens):
+            for t in range(1, n_snapshots):
+                for sign, limit in [(1, ramp_up[g]), (-1, ramp_down[g])]:
+                    if np.isfinite(limit):
+                        row = np.zeros(n_snapshots * n_gens)
+                        row[t * n_gens + g], row[(t - 1) * n_gens + g] = sign, -sign
+                        a_ub.append(row)
+                        b_ub.append(limit * p_nom[g])
+        bounds = list(zip((p_min_pu * p_nom).ravel(), (p_max_pu * p_nom).ravel()))
+        expected = linprog(np.tile(cost, n_snapshots), A_ub=np.array(a_ub), b_ub=b_ub, A_eq=a_eq, b_eq=demand,
+                           bounds=bounds, method='highs')
+        self.assertAlmostEqual((dispatch * cost).sum() / expected.fun, 1., places=9)
+        np.testing.assert_allclose(dispatch.sum(axis=1), demand)
+        self.assertTrue(np.all(dispatch <= p_max_pu * p_nom + 1e-9))
+        self.assertTrue(np.all(dispatch >= p_min_pu * p_nom - 1e-9))
+
+
+class TestHighsDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.env_df = pd.DataFrame(dict(name=['nuc', 'hydro_1', 'coal', 'gas', 'solar_1', 'wind_1'],
+                                        type=['nuclear', 'hydro', 'thermal', 'thermal', 'solar', 'wind'],
+                                        pmax=[400., 100., 200., 200., 100., 150.],
+                                        max_ramp_up=[5., 10., 20., 40., 0., 0.],
+                                        max_ramp_down=[5., 10., 20., 40., 0., 0.],
+                                        cost_per_mw=[5., 0., 30., 60., 0., 0.]))
+        index = pd.date_range('2012-01-02', periods=2 * 24 * 12, freq='5min')
+        hours = index.hour.to_numpy() + index.minute.to_numpy() / 60
+        loads = pd.DataFrame(dict(load_1=450 + 100 * np.sin(np.pi * hours / 24),
+                                  load_2=np.full(len(index), 100.)), index=index)
+        prods = pd.DataFrame(dict(solar_1=np.clip(80 * np.sin(np.pi * (hours - 6) / 12), 0, None),
+                                  wind_1=np.full(len(index), 60.)), index=index)
+        self.scenario = ChroniXScenario(loads, prods, dict(solar=['solar_1'], wind=['wind_1']), 'test')
+
+        self.folder = tempfile.mkdtemp()
+        self.hydro_file_path = os.path.join(self.folder, 'hydro.csv')
+        hours = pd.date_range('2012-01-01', '2012-12-31 23:00', freq='H')
+        pd.DataFrame(dict(date=hours.strftime('%Y-%m-%d %H:%M'), x=0, p_min_u=0.2, p_max_u=0.7)).to_csv(
+            self.hydro_file_path, index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def run_dispatch(self, **kwargs):
+        dispatcher = HighsDispatcher.from_dataframe(self.env_df)
+        dispatcher.read_hydro_guide_curves(self.hydro_file_path)
+        dispatcher.chronix_scenario = self.scenario
+        hydro_constraints = dispatcher.make_hydro_constraints_from_res_load_scenario()
+        params = dict(step_opf_min=5, mode_opf='day', reactive_comp=1.)
+        results = dispatcher.run(dispatcher.net_load(0., 'agg_load'), self.scenario.solar_p.sum(axis=1),
+                                 self.scenario.wind_p.sum(axis=1), params, gen_constraints=hydro_constraints,
+                                 **kwargs)
+        return dispatcher, results
+
+    def test_run(self):
+        dispatcher, results = self.run_dispatch()
+        self.assertIsInstance(results, DispatchResults)
+        self.assertEqual(results.terminal_conditions, ['optimal', 'optimal'])
+        prods = results.chronix.prods_dispatch
+        self.assertEqual(list(prods.columns), ['nuc', 'hydro_1', 'coal', 'gas', 'agg_solar', 'agg_wind'])
+        self.assertEqual(len(prods), len(self.scenario.loads))
+        np.testing.assert_allclose(prods.sum(axis=1).values, self.scenario.loads.sum(axis=1).values)
+        # ramp limits of the generators, in MW by 5 minutes, reduced by RampCorrectingFactor
+        for name, ramp in [('nuc', 5.), ('coal', 20.)]:
+            self.assertLessEqual(prods[name].diff().abs().max(), ramp - dispatcher.RampCorrectingFactor + 1e-6)
+        np.testing.assert_array_less(prods['agg_solar'].values, self.scenario.solar_p['solar_1'].values + 1e-6)
+        # hydro guide curves, on a p_nom reduced by PmaxCorrectingFactor
+        p_nom = 100. - dispatcher.PmaxCorrectingFactor
+        self.assertTrue(prods['hydro_1'].between(0.2 * p_nom - 1e-6, 0.7 * p_nom + 1e-6).all())
+        self.assertTrue(results.chronix.marginal_prices.notna().all())
+
+    def test_by_carrier(self):
+        dispatcher, results = self.run_dispatch(by_carrier=True)
+        prods = results.chronix.prods_dispatch
+        self.assertEqual(list(prods.columns), ['nuclear', 'hydro', 'thermal', 'solar', 'wind'])
+        np.testing.assert_allclose(prods.sum(axis=1).values, self.scenario.loads.sum(axis=1).values)
+
+    def test_models_are_reused(self):
+        dispatcher, results = self.run_dispatch()
+        # both windows are days of 288 snapshots
+        self.assertEqual(list(dispatcher._models), [288])
+        model = dispatcher._models[288]
+        params = dict(step_opf_min=5, mode_opf='day', reactive_comp=1.)
+        load = 1.01 * dispatcher.net_load(0., 'agg_load')
+        hydro_constraints = dispatcher.make_hydro_constraints_from_res_load_scenario()
+        # generators are compared once per run, not once per window
+        calls = []
+        use_generators = dispatcher.use_generators
+        dispatcher.use_generators = lambda generators: calls.append(use_generators(generators))
+        new_results = dispatcher.run(load, self.scenario.solar_p.sum(axis=1), self.scenario.wind_p.sum(axis=1),
+                                     params, gen_constraints=hydro_constraints)
+        self.assertEqual(len(calls), 1)
+        self.assertIs(dispatcher._models[288], model)
+        np.testing.assert_allclose(new_results.chronix.prods_dispatch.sum(axis=1).values, load.values.ravel())
+
+        # a new marginal cost gives a new linear program
+        dispatcher.modify_marginal_costs({'thermal': 10.})
+        dispatcher.run(load, self.scenario.solar_p.sum(axis=1), self.scenario.wind_p.sum(axis=1), params,
+                       gen_constraints=dispatcher.make_hydro_constraints_from_res_load_scenario())
+        self.assertIsNot(dispatcher._models[288], model)
+
+
+class TestRollingHorizon(unittest.TestCase):
+    def setUp(self):
+        # the nuclear cannot follow the step of the load at midnight, the gas can
+        self.env_df = pd.DataFrame(dict(name=['nuc', 'gas', 'solar_1', 'wind_1'],
+                                        type=['nuclear', 'thermal', 'solar', 'wind'],
+                                        pmax=[400., 400., 100., 100.],
+                                        max_ramp_up=[5., 400., 0., 0.],
+                                        max_ramp_down=[5., 400., 0., 0.],
+                                        cost_per_mw=[5., 60., 0., 0.]))
+        index = pd.date_range('2012-01-02', periods=3 * 24 * 12, freq='5min')
+        loads = pd.DataFrame(dict(load_1=np.where(index.day == 3, 380., 200.)), index=index)
+        prods = pd.DataFrame(dict(solar_1=0., wind_1=0.), index=index)
+        self.scenario = ChroniXScenario(loads, prods, dict(solar=['solar_1'], wind=['wind_1']), 'test')
+
+    def run_dispatch(self, **kwargs):
+        dispatcher = HighsDispatcher.from_dataframe(self.env_df)
+        dispatcher.chronix_scenario = self.scenario
+        params = dict(step_opf_min=5, mode_opf='day', reactive_comp=1.)
+        params.update(kwargs.pop('params', {}))
+        results = dispatcher.run(dispatcher.net_load(0., 'agg_load'), self.scenario.solar_p.sum(axis=1),
+                                 self.scenario.wind_p.sum(axis=1), params, **kwargs)
+        np.testing.assert_allclose(results.chronix.prods_dispatch.sum(axis=1).values,
+                                   self.scenario.loads.sum(axis=1).values)
+        return dispatcher, results
+
+    def test_ramp_coupling(self):
+        ramp = 5. - HighsDispatcher.RampCorrectingFactor
+        _, results = self.run_dispatch()
+        self.assertGreater(results.chronix.prods_dispatch['nuc'].diff().abs().max(), 100.)
+
+        _, results = self.run_dispatch(params=dict(ramp_coupling_opf=True))
+        self.assertEqual(results.terminal_conditions, ['optimal'] * 3)
+        nuc = results.chronix.prods_dispatch['nuc']
+        self.assertLessEqual(nuc.diff().abs().max(), ramp + 1e-6)
+        # the nuclear of each day starts from the previous day
+        for start in ['2012-01-03 00:00', '2012-01-04 00:00']:
+            step = nuc[start] - nuc[pd.Timestamp(start) - pd.Timedelta('5min')]
+            self.assertLessEqual(abs(step), ramp + 1e-6)
+
+    def test_overlap(self):
+        dispatcher, results = self.run_dispatch(params=dict(overlap_opf_min=60))
+        self.assertEqual(len(results.chronix.prods_dispatch), len(self.scenario.loads))
+        # the first day has no previous window
+        self.assertEqual(sorted(dispatcher._models), [288, 300])
+
+    def test_pool(self):
+        _, expected = self.run_dispatch(params=dict(ramp_coupling_opf=True))
+        with multiprocessing.Pool(2) as pool:
+            _, results = self.run_dispatch(params=dict(ramp_coupling_opf=True), pool=pool)
+        pd.testing.assert_frame_equal(results.chronix.prods_dispatch, expected.chronix.prods_dispatch)
+        self.assertEqual(results.terminal_conditions, expected.terminal_conditions)
+
+    def test_windows_are_in_chronological_order(self):
+        snapshots = pd.date_range('2012-12-20', '2013-01-10', freq='H')
+        windows = get_windows(snapshots, 'week')
+        starts = [snaps[0] for _, _, snaps in windows]
+        self.assertEqual(starts, sorted(starts))
+        self.assertEqual(sum(len(snaps) for _, _, snaps in windows), len(snapshots))
+        self.assertEqual(get_windows(snapshots, None)[0][2].equals(snapshots), True)
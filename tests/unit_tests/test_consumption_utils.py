@@ -0,0 +1,135 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import bz2
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.random import default_rng
+
+from chronix2grid.generation.consumption import consumption_utils as conso
+from chronix2grid.generation.consumption import generate_load
+
+
+class TestConsumptionUtils(unittest.TestCase):
+    def setUp(self):
+        prng = default_rng(0)
+        start_date = pd.Timestamp('2012-01-01')
+        end_date = start_date + pd.Timedelta(weeks=2)
+        self.params = dict(Lx=1000, Ly=1000, dx_corr=250, dy_corr=250, dt=5, temperature_corr=60 * 24,
+                           std_temperature_noise=0.1, start_date=start_date, end_date=end_date,
+                           T=int((end_date - start_date).total_seconds() // 60))
+        n_loads = 12
+        self.loads_charac = pd.DataFrame(dict(name=[f'load_{i}' for i in range(n_loads)],
+                                              type='residential',
+                                              x=prng.uniform(0, 1000, n_loads),
+                                              y=prng.uniform(0, 1000, n_loads),
+                                              Pmax=prng.uniform(10, 100, n_loads)))
+        # 6 weeks of pattern: 4 distinct weeks once the lag of 6 days is removed
+        datetimes = pd.date_range('2017-01-01', periods=6 * 7 * 24 * 12, freq='5min')
+        self.load_weekly_pattern = pd.DataFrame(dict(datetime=datetimes.strftime('%Y-%m-%d %H:%M:%S'),
+                                                     test=prng.uniform(0.5, 1.5, len(datetimes))))
+        self.n_comp = int(self.params['T'] // self.params['temperature_corr'] + 1) + 1
+        self.noise = prng.normal(size=(6, 6, self.n_comp))
+
+    def test_same_as_one_load_after_the_other(self):
+        for time_slice in [None, slice(100, 2000)]:
+            loads = conso.compute_loads(self.loads_charac, self.noise, self.params, self.load_weekly_pattern.copy(),
+                                        start_day=self.params['start_date'], add_dim=1, time_slice=time_slice)
+            self.assertEqual(list(loads), list(self.loads_charac['name']))
+
+            weekly_pattern = self.load_weekly_pattern.copy()['test'].values
+            for i, row in self.loads_charac.iterrows():
+                expected = conso.compute_residential([row['x'], row['y']], row['Pmax'], self.noise, self.params,
+                                                     weekly_pattern, index=i, day_lag=6, add_dim=1,
+                                                     time_slice=time_slice)
+                np.testing.assert_array_equal(loads[row['name']], expected)
+
+    def test_industrial_loads(self):
+        self.loads_charac.loc[3, 'type'] = 'industrial'
+        with self.assertRaises(NotImplementedError):
+            conso.compute_residential_loads(self.loads_charac, self.noise, self.params, self.load_weekly_pattern,
+                                            start_day=self.params['start_date'], add_dim=1)
+
+    def test_weekly_patterns_are_interpolated_once(self):
+        conso._load_pattern_cache.clear()
+        for scenario in range(2):
+            conso.compute_residential_loads(self.loads_charac, self.noise, self.params, self.load_weekly_pattern.copy(),
+                                            start_day=self.params['start_date'], add_dim=1)
+        # 4 distinct weeks for 12 loads (a week normalized again may differ by a rounding error)
+        self.assertLessEqual(conso._load_pattern_cache.misses, 8)
+        self.assertEqual(conso._load_pattern_cache.misses + conso._load_pattern_cache.hits, 24)
+        misses = conso._load_pattern_cache.misses
+        conso.compute_residential_loads(self.loads_charac, self.noise, self.params, self.load_weekly_pattern.copy(),
+                                        start_day=self.params['start_date'], add_dim=1)
+        self.assertEqual(conso._load_pattern_cache.misses, misses)
+
+    def test_ensemble(self):
+        params = dict(self.params, planned_std=0.01)
+        seeds = [1, 2, 3]
+        # batches of 2 scenarios
+        ensemble = generate_load.main_ensemble([None] * 3, seeds, params, self.loads_charac,
+                                               self.load_weekly_pattern, write_results=False,
+                                               max_batch_bytes=2 * 4 * 8 * len(self.loads_charac) * 4100)
+        for seed, (load_p, load_p_forecasted) in zip(seeds, ensemble):
+            expected_p, expected_forecasted = generate_load.main(None, seed, params, self.loads_charac,
+                                                                 self.load_weekly_pattern.copy(), write_results=False)
+            pd.testing.assert_frame_equal(load_p, expected_p)
+            pd.testing.assert_frame_equal(load_p_forecasted, expected_forecasted)
+
+    def test_float32(self):
+        names, loads = conso.compute_residential_loads(self.loads_charac, self.noise, self.params,
+                                                       self.load_weekly_pattern.copy(),
+                                                       start_day=self.params['start_date'], add_dim=1)
+        params = dict(self.params, dtype='float32')
+        noise = self.noise.astype(np.float32)
+        names_32, loads_32 = conso.compute_residential_loads(self.loads_charac, noise, params,
+                                                             self.load_weekly_pattern.copy(),
+                                                             start_day=self.params['start_date'], add_dim=1)
+        self.assertEqual(names_32, names)
+        self.assertEqual(loads_32.dtype, np.float32)
+        # Far below the precision of the written chronics (0.1 MW)
+        np.testing.assert_allclose(loads_32, loads, rtol=1e-5, atol=1e-4)
+
+    def test_stream(self):
+        params = dict(self.params, planned_std=0.01)
+        folder = tempfile.mkdtemp()
+        try:
+            generate_load.main_by_windows(os.path.join(folder, 'windows'), 1, params, self.loads_charac,
+                                          self.load_weekly_pattern, 'week')
+            self.assertEqual(generate_load.main_by_windows(os.path.join(folder, 'stream'), 1, params,
+                                                           self.loads_charac, self.load_weekly_pattern, 'week',
+                                                           stream=True), (None, None))
+            for file_name in ['load_p', 'load_p_forecasted', 'load_q', 'load_q_forecasted']:
+                with bz2.open(os.path.join(folder, 'windows', f'{file_name}.csv.bz2'), 'rt') as f:
+                    expected = f.read()
+                with bz2.open(os.path.join(folder, 'stream', f'{file_name}.csv.bz2'), 'rt') as f:
+                    self.assertEqual(f.read(), expected)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def test_assemble_loads(self):
+        names, loads = conso.compute_residential_loads(self.loads_charac, self.noise, self.params,
+                                                       self.load_weekly_pattern.copy(),
+                                                       start_day=self.params['start_date'], add_dim=1)
+        datetime_index = pd.date_range(self.params['start_date'], self.params['end_date'], freq='5min')
+        chronics = conso.assemble_loads(default_rng(1), names, loads, datetime_index, noise=0.01)
+
+        loads_series = {name: loads[:, i] for i, name in enumerate(names)}
+        loads_series['datetime'] = datetime_index
+        prng = default_rng(1)
+        load_p_forecasted = conso.create_csv(prng, loads_series, None, forecasted=True, shift=True,
+                                             write_results=False)
+        load_p = conso.create_csv(prng, loads_series, None, noise=0.01, write_results=False)
+        pd.testing.assert_frame_equal(chronics['load_p_forecasted'], load_p_forecasted)
+        pd.testing.assert_frame_equal(chronics['load_p'], load_p)
+        pd.testing.assert_frame_equal(chronics['load_q_forecasted'], 0.7 * load_p_forecasted)
@@ -0,0 +1,45 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import json
+import subprocess
+import sys
+import unittest
+
+HEAVY_MODULES = ['pypsa', 'grid2op', 'pandapower', 'plotly', 'matplotlib', 'seaborn']
+
+# Run in a fresh interpreter: in the test process, other tests may already have imported these modules
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import chronix2grid.main
+from chronix2grid.GeneratorBackend import GeneratorBackend
+generator = GeneratorBackend()
+duration = time.perf_counter() - start
+loaded = [name for name in {modules} if name in sys.modules]
+{extra}
+print(json.dumps(dict(duration=duration, loaded=loaded)))
+"""
+
+
+def run_import_script(extra=''):
+    script = IMPORT_SCRIPT.format(modules=HEAVY_MODULES, extra=extra)
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+    def test_no_heavy_import_for_l_and_r(self):
+        result = run_import_script()
+        self.assertEqual(result['loaded'], [],
+                         f"chronix2grid.main imported in {result['duration']:.2f}s with {result['loaded']}")
+
+    def test_dispatcher_is_imported_when_used(self):
+        result = run_import_script(extra="loaded.append(generator.dispatcher_class.__name__)\n"
+                                         "loaded.append('pypsa' in sys.modules)")
+        self.assertEqual(result['loaded'], ['PypsaDispatcher', True])
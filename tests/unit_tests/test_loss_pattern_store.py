@@ -0,0 +1,98 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import glob
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from chronix2grid.generation import pattern_cache
+from chronix2grid.generation.loss import generate_loss
+from chronix2grid.generation.loss.loss_pattern_store import LossPatternStore
+
+
+def load_first_value(path):
+    return LossPatternStore.load(path).values['value'][0, 0, 0]
+
+
+class TestLossPatternStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'loss_pattern.csv')
+        self.dates = pd.date_range('2012-01-01', '2012-12-31 23:55', freq='5min')
+        self.loss = np.arange(len(self.dates)) % 1000
+        self._write(self.loss)
+        pattern_cache.clear()
+
+    def tearDown(self):
+        pattern_cache.clear()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write(self, loss):
+        pd.DataFrame(dict(date=self.dates.strftime('%d/%m/%Y %H:%M'), loss_p=loss)).to_csv(self.path, sep=';',
+                                                                                           index=False)
+
+    def test_same_year(self):
+        params = dict(start_date=pd.Timestamp('2012-02-27'), end_date=pd.Timestamp('2012-03-05'), dt=5)
+        loss = generate_loss.generate_valid_loss(self.path, params)
+        expected_index = pd.date_range(params['start_date'], params['end_date'], freq='5min')[:-1]
+        pd.testing.assert_index_equal(loss.index, pd.DatetimeIndex(expected_index, freq=None))
+        self.assertEqual(loss.name, 'loss_p')
+        self.assertEqual(loss.dtype, self.loss.dtype)
+        np.testing.assert_array_equal(loss.values, self.loss[self.dates.get_indexer(expected_index)])
+
+    def test_other_years(self):
+        # Non leap year, and a period over two years
+        for start_date in ['2013-02-25', '2018-12-28']:
+            params = dict(start_date=pd.Timestamp(start_date), end_date=pd.Timestamp(start_date) + pd.Timedelta(days=7),
+                          dt=60)
+            loss = generate_loss.generate_valid_loss(self.path, params)
+            self.assertEqual(len(loss), 7 * 24)
+            same_day = loss.index.map(lambda t: pd.Timestamp(2012, t.month, t.day, t.hour, t.minute))
+            np.testing.assert_array_equal(loss.values, self.loss[self.dates.get_indexer(same_day)])
+
+    def test_missing_dates(self):
+        store = LossPatternStore.load(self.path)
+        with self.assertRaises(KeyError):
+            store.select(pd.date_range('2012-01-01', periods=10, freq='1min'))
+
+    def test_sidecar(self):
+        LossPatternStore.load(self.path)
+        sidecars = glob.glob(self.path + '.*.npy')
+        self.assertEqual(len(sidecars), 1)
+        store = LossPatternStore.load(self.path)
+        self.assertFalse(store.values.flags.writeable)
+        self.assertEqual(store.values['value'].dtype, self.loss.dtype)
+
+        # A modified pattern is parsed again and replaces the sidecar
+        self._write(self.loss + 0.5)
+        store = LossPatternStore.load(self.path)
+        self.assertEqual(store.values['value'][0, 0, 0], 0.5)
+        self.assertEqual(len(glob.glob(self.path + '.*.npy')), 1)
+        self.assertNotEqual(glob.glob(self.path + '.*.npy'), sidecars)
+
+    def test_corrupt_sidecar(self):
+        LossPatternStore.load(self.path)
+        sidecar, = glob.glob(self.path + '.*.npy')
+        with open(sidecar, 'wb') as f:
+            f.write(b'\x93NUMPY')
+        store = LossPatternStore.load(self.path)
+        np.testing.assert_array_equal(store.values, LossPatternStore.from_csv(self.path).values)
+        self.assertEqual(LossPatternStore.load(self.path).values.shape, store.values.shape)
+
+    def test_concurrent_loads(self):
+        with multiprocessing.Pool(8) as pool:
+            values = pool.map(load_first_value, [self.path] * 32)
+        self.assertEqual(values, [0] * 32)
+        self.assertEqual(len(glob.glob(self.path + '.*.npy')), 1)
+        self.assertEqual(glob.glob(os.path.join(self.folder, '*.tmp')), [])
@@ -122,6 +122,25 @@ class TestMain(unittest.TestCase):
             ignore_warnings=self.ignore_warnings,
             scenario_id=0)
 
+    def test_lr_ensemble(self):
+        main.generate_ensemble(
+            self.case, self.start_date, 1, 4, 'LR', self.input_folder, self.generation_output_folder,
+            self.scenario_names, self.seeds_for_loads, self.seeds_for_res, self.seeds_for_disp, [0, 1])
+        ensemble = pd.read_csv(os.path.join(self.generation_output_folder, 'Scenario_1', 'load_p.csv.bz2'), sep=';')
+        main.generate_per_scenario(
+            case=self.case, start_date=self.start_date, weeks=1, by_n_weeks=4,
+            mode='LR', input_folder=self.input_folder,
+            kpi_output_folder=self.kpi_output_folder,
+            generation_output_folder=self.generation_output_folder,
+            scen_names=self.scenario_names,
+            seeds_for_loads=self.seeds_for_loads,
+            seeds_for_res=self.seeds_for_res,
+            seeds_for_dispatch=self.seeds_for_disp,
+            ignore_warnings=self.ignore_warnings,
+            scenario_id=1)
+        pd.testing.assert_frame_equal(
+            ensemble, pd.read_csv(os.path.join(self.generation_output_folder, 'Scenario_1', 'load_p.csv.bz2'), sep=';'))
+
     def test_lrk(self):
         main.generate_per_scenario(
             case=self.case, start_date=self.start_date, weeks=1, by_n_weeks=4,
@@ -0,0 +1,125 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import chronix2grid.constants as cst
+from chronix2grid import manifest as mf
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.scenario_path = tempfile.mkdtemp()
+        self.seeds = dict(loads=1, renewables=2, dispatch=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.scenario_path, ignore_errors=True)
+
+    def new_manifest(self, seeds=None, config_hash='hash', mode='LRT'):
+        return mf.ScenarioManifest(self.scenario_path, 'Scenario_0', seeds or self.seeds, config_hash, mode)
+
+    def write_file(self, name, content='1;2;3'):
+        with open(os.path.join(self.scenario_path, name), 'w') as f:
+            f.write(content)
+
+    def test_completed_scenario(self):
+        manifest = self.new_manifest()
+        for stage in 'LRT':
+            manifest.stage_completed(stage)
+        self.write_file('load_p.csv.bz2')
+        manifest.complete()
+
+        previous = mf.read_manifest(self.scenario_path)
+        self.assertEqual(previous['status'], mf.STATUS_COMPLETED)
+        self.assertEqual(previous['files']['load_p.csv.bz2']['size'], 5)
+
+        resumed = self.new_manifest()
+        self.assertEqual(resumed.resume(), {'L', 'R', 'T'})
+        self.assertTrue(resumed.is_completed())
+
+        # A modified file invalidates the whole scenario
+        self.write_file('load_p.csv.bz2', '1;2;4')
+        resumed = self.new_manifest()
+        self.assertEqual(resumed.resume(), set())
+
+    def test_incomplete_scenario(self):
+        manifest = self.new_manifest()
+        manifest.stage_completed('L')
+
+        resumed = self.new_manifest()
+        self.assertEqual(resumed.resume(), {'L'})
+        self.assertFalse(resumed.is_completed())
+
+        # Other seeds or configuration: nothing can be reused
+        self.assertEqual(self.new_manifest(seeds=dict(loads=4, renewables=2, dispatch=3)).resume(), set())
+        self.assertEqual(self.new_manifest(config_hash='other').resume(), set())
+
+    def test_interrupted_before_completion(self):
+        # All the stages are recorded, but the run stopped before the chunks and checksums were written
+        manifest = self.new_manifest()
+        for stage in 'LRT':
+            manifest.stage_completed(stage)
+        self.assertTrue(manifest.stages_completed())
+        self.assertFalse(manifest.is_completed())
+
+        resumed = self.new_manifest()
+        self.assertEqual(resumed.resume(), {'L', 'R', 'T'})
+        self.assertFalse(resumed.is_completed())
+        resumed.complete()
+        self.assertTrue(resumed.is_completed())
+        self.assertEqual(mf.read_manifest(self.scenario_path)['status'], mf.STATUS_COMPLETED)
+
+    def test_dispatch_failed(self):
+        self.write_file(cst.DISPATCH_FAILED_FILE_NAME)
+        manifest = self.new_manifest(mode='LRTK')
+        for stage in 'LRTK':
+            manifest.stage_completed(stage)
+        self.assertEqual(manifest.completed_stages, {'L', 'R', 'K'})
+
+        manifest.data['stages']['T'] = {}
+        manifest.save()
+        resumed = self.new_manifest(mode='LRTK')
+        self.assertEqual(resumed.resume(), {'L', 'R'})
+
+    def test_peak_memory(self):
+        manifest = self.new_manifest()
+        manifest.stage_completed('L')
+        manifest.record_peak_memory({'L': 1024., 'R': 2048})
+        previous = mf.read_manifest(self.scenario_path)
+        self.assertEqual(previous['peak_memory'], {'L': 1024, 'R': 2048})
+        self.assertEqual(self.new_manifest().resume(), {'L'})
+
+    def test_config_hash(self):
+        os.makedirs(os.path.join(self.scenario_path, 'case'))
+        with open(os.path.join(self.scenario_path, 'case', 'params.json'), 'w') as f:
+            f.write('{"dt": 5}')
+        reference = mf.config_hash(self.scenario_path, 'case', weeks=4)
+        self.assertEqual(reference, mf.config_hash(self.scenario_path, 'case', weeks=4))
+        self.assertNotEqual(reference, mf.config_hash(self.scenario_path, 'case', weeks=5))
+        with open(os.path.join(self.scenario_path, 'case', 'params.json'), 'w') as f:
+            f.write('{"dt": 60}')
+        self.assertNotEqual(reference, mf.config_hash(self.scenario_path, 'case', weeks=4))
+
+    def test_config_hash_of_sub_folders(self):
+        model_folder = os.path.join(self.scenario_path, 'case', 'neural_network', 'solar')
+        os.makedirs(model_folder)
+        self.write_file(os.path.join('case', 'neural_network', 'solar', 'model.ckpt'), 'weights')
+        reference = mf.config_hash(self.scenario_path, 'case')
+
+        # Temporary folders and loss pattern sidecars are not inputs
+        os.makedirs(os.path.join(self.scenario_path, 'case', 'chronics', 'Scenario_0'))
+        self.write_file(os.path.join('case', 'chronics', 'Scenario_0', 'load_p.csv.bz2'))
+        os.makedirs(os.path.join(self.scenario_path, 'patterns'))
+        self.write_file(os.path.join('patterns', 'loss_pattern.csv.0123456789abcdef.npy'))
+        self.assertEqual(reference, mf.config_hash(self.scenario_path, 'case'))
+
+        self.write_file(os.path.join('case', 'neural_network', 'solar', 'model.ckpt'), 'other weights')
+        self.assertNotEqual(reference, mf.config_hash(self.scenario_path, 'case'))
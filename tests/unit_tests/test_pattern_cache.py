@@ -0,0 +1,101 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.random import default_rng
+
+from chronix2grid import main
+from chronix2grid.generation import pattern_cache
+
+
+class TestPatternCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'solar_pattern.npy')
+        np.save(self.path, np.arange(10.))
+        pattern_cache.clear()
+
+    def tearDown(self):
+        pattern_cache.clear()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_read_once(self):
+        pattern_cache.read_solar_pattern(self.path)
+        pattern_cache.read_solar_pattern(self.path)
+        self.assertEqual(pattern_cache._cache.misses, 1)
+        self.assertEqual(pattern_cache._cache.hits, 1)
+
+    def test_returns_copies(self):
+        pattern = pattern_cache.read_solar_pattern(self.path)
+        pattern[:] = 0.
+        np.testing.assert_array_equal(pattern_cache.read_solar_pattern(self.path), np.arange(10.))
+
+    def test_modified_file_is_read_again(self):
+        pattern_cache.read_solar_pattern(self.path)
+        np.save(self.path, np.arange(20.))
+        self.assertEqual(len(pattern_cache.read_solar_pattern(self.path)), 20)
+
+    def test_bounded(self):
+        cache = pattern_cache.BoundedCache(2)
+        for key in ['a', 'b', 'a', 'c']:
+            cache.get_or_compute(key, lambda: key)
+        self.assertEqual(len(cache), 2)
+        cache.get_or_compute('a', lambda: 'a')
+        self.assertEqual(cache.hits, 2)
+        cache.get_or_compute('b', lambda: 'b')
+        self.assertEqual(cache.misses, 4)
+
+    def test_warm(self):
+        pattern_cache.warm(self.folder)
+        pattern_cache.read_solar_pattern(self.path)
+        self.assertEqual(pattern_cache._cache.hits, 1)
+
+
+class TestBatch(unittest.TestCase):
+    def test_run_batch_task(self):
+        funcs = [lambda scenario_id: ('a', scenario_id), lambda scenario_id: ('b', scenario_id)]
+        tasks = [(0, 0), (1, 0), (1, 1)]
+        self.assertEqual(main.run_batch_task(funcs, tasks, 2), ('b', 1))
+
+        funcs = [lambda scenario_id, time_window=None: (scenario_id, time_window)]
+        self.assertEqual(main.run_batch_task(funcs, [(0, 3)], 0, time_window='week'), (3, 'week'))
+
+    def test_same_output_folder(self):
+        job = dict(case='case118_l2rpn_neurips_1x', start_date='2012-01-01', weeks=1, n_scenarios=1)
+        with self.assertRaises(ValueError):
+            main.generate_batch_core(default_rng(), [job, dict(job)], 'input', 'output', 1)
+
+    def test_stream_needs_loads_and_renewables_only(self):
+        job = dict(case='case118_l2rpn_neurips_1x', start_date='2012-01-01', weeks=1, n_scenarios=1)
+        with self.assertRaises(ValueError):
+            main.generate_batch_core(default_rng(), [job, dict(job, start_date='2012-02-01', mode='LR')],
+                                     'input', 'output', 1, stream=True)
+
+    def test_ensemble_needs_loads_and_renewables_only(self):
+        with self.assertRaises(ValueError):
+            main.generate_mp_core(default_rng(), 'case118_l2rpn_neurips_1x', '2012-01-01', 1, 1, 2, 'LRT', 'input',
+                                  'output', '', None, None, None, 1, True, ensemble_batch_size=2)
+        with self.assertRaises(ValueError):
+            main.check_ensemble('LR', 'week')
+        main.check_ensemble('LR', None)
+
+    def test_ensemble_scenario_result(self):
+        names = lambda scenario_id: f'Scenario_{scenario_id}'
+        self.assertEqual(main.ensemble_name(names, [0, 1, 2]), 'Scenario_0-Scenario_2')
+        self.assertEqual(main.run_ensemble_task(lambda ids: ids, [[0, 1], [2]], 1), [2])
+        result = dict(duration=4., stages=dict(L=2.), scenarios=['Scenario_0', 'Scenario_1'])
+        self.assertEqual(main.ensemble_scenario_result(result, 'Scenario_1'),
+                         dict(duration=2., stages=dict(L=1.), opf_solve_times=[]))
+        # skipped in a resumed run
+        self.assertIsNone(main.ensemble_scenario_result(result, 'Scenario_2'))
+        self.assertIsNone(main.ensemble_scenario_result(None, 'Scenario_0'))
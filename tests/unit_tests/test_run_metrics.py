@@ -0,0 +1,83 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import chronix2grid.constants as cst
+from chronix2grid import run_metrics
+
+
+class TestRunMetrics(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_recorded_durations(self):
+        run_metrics.pop_durations()
+        run_metrics.record_duration('opf', 1.)
+        run_metrics.record_duration('opf', 2.)
+        self.assertEqual(run_metrics.pop_durations(), {'opf': [1., 2.]})
+        self.assertEqual(run_metrics.pop_durations(), {})
+
+    def test_summary(self):
+        metrics = run_metrics.RunMetrics(4, self.folder, prometheus=True)
+        metrics.write()
+        with open(os.path.join(self.folder, cst.METRICS_FILE_NAME)) as f:
+            summary = json.load(f)
+        self.assertEqual(summary['scenarios']['remaining'], 4)
+        self.assertIsNone(summary['eta_seconds'])
+
+        metrics.update('Scenario_0', scenario_metrics=dict(
+            duration=10., stages={'L': 1., 'R': 3.}, opf_solve_times=list(range(1, 101))))
+        metrics.update('Scenario_1', error=dict(type='ValueError'))
+        summary = metrics.summary()
+        self.assertEqual(summary['scenarios'], dict(total=4, done=1, failed=1, skipped=0, remaining=2))
+        self.assertAlmostEqual(summary['eta_seconds'], 20.)
+        self.assertEqual(summary['stages']['R']['mean'], 3.)
+        self.assertEqual(summary['opf_solve_time']['count'], 100)
+        self.assertAlmostEqual(summary['opf_solve_time']['p95'], 95.05)
+
+        # Scenario tried again successfully
+        metrics.update('Scenario_1', scenario_metrics=dict(duration=12., stages={}, opf_solve_times=[]))
+        self.assertEqual(metrics.summary()['scenarios']['failed'], 0)
+
+        with open(os.path.join(self.folder, cst.METRICS_FILE_NAME)) as f:
+            self.assertEqual(json.load(f)['scenarios']['done'], 2)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, cst.METRICS_FILE_NAME + '.tmp')))
+
+        with open(os.path.join(self.folder, cst.PROMETHEUS_METRICS_FILE_NAME)) as f:
+            prometheus = f.read().splitlines()
+        self.assertIn('chronix2grid_scenarios{state="done"} 2', prometheus)
+        self.assertIn('chronix2grid_stage_duration_seconds_count{stage="L"} 1', prometheus)
+        self.assertIn('chronix2grid_opf_solve_seconds{quantile="0.95"} 95.05', prometheus)
+        self.assertIn('# TYPE chronix2grid_opf_solve_seconds summary', prometheus)
+
+    def test_skipped_scenarios(self):
+        metrics = run_metrics.RunMetrics(6, workers=2)
+        # Already generated in a previous run
+        metrics.update('Scenario_0')
+        metrics.update('Scenario_1')
+        summary = metrics.summary()
+        self.assertEqual(summary['scenarios'], dict(total=6, done=0, failed=0, skipped=2, remaining=4))
+        self.assertIsNone(summary['eta_seconds'])
+        self.assertEqual(summary['scenario_duration']['count'], 0)
+
+        metrics.update('Scenario_2', scenario_metrics=dict(duration=10., stages={}, opf_solve_times=[]))
+        metrics.update('Scenario_3', scenario_metrics=dict(duration=30., stages={}, opf_solve_times=[]))
+        summary = metrics.summary()
+        self.assertEqual(summary['scenarios'], dict(total=6, done=2, failed=0, skipped=2, remaining=2))
+        # Two scenarios of 20 seconds on average, two at a time
+        self.assertAlmostEqual(summary['eta_seconds'], 20.)
+        self.assertIn('chronix2grid_scenarios{state="skipped"} 2',
+                      run_metrics.to_prometheus(summary).splitlines())
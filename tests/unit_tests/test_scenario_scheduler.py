@@ -0,0 +1,172 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import json
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+from functools import partial
+
+import chronix2grid.constants as cst
+from chronix2grid.scenario_scheduler import run_scenarios
+
+
+def write_scenario(folder, scenario_id):
+    if scenario_id == 1:
+        raise ValueError('scenario 1 always fails')
+    with open(os.path.join(folder, str(scenario_id)), 'a') as f:
+        f.write('done\n')
+
+
+def fail_once(folder, scenario_id):
+    marker = os.path.join(folder, f'attempt_{scenario_id}')
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        raise RuntimeError('first attempt fails')
+
+
+def sleep_scenario(scenario_id):
+    time.sleep(5)
+
+
+def stuck_scenario(folder, scenario_id):
+    if scenario_id == 0:
+        # Like a C call, the alarm is not handled
+        if hasattr(signal, 'SIGALRM'):
+            signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        time.sleep(30)
+    open(os.path.join(folder, str(scenario_id)), 'w').close()
+
+
+def die_once(folder, scenario_id):
+    marker = os.path.join(folder, f'died_{scenario_id}')
+    if scenario_id == 0 and not os.path.exists(marker):
+        open(marker, 'w').close()
+        # Like a process killed by the system when out of memory
+        os._exit(137)
+    return scenario_id
+
+
+def start_scenario(folder, scenario_id):
+    with open(os.path.join(folder, f'start_{scenario_id}'), 'w') as f:
+        f.write(str(time.time()))
+    return scenario_id * 10
+
+
+def end_scenario(folder, scenario_id, result):
+    time.sleep(0.2)
+    with open(os.path.join(folder, f'end_{scenario_id}'), 'w') as f:
+        f.write(str(time.time()))
+    return result + 1
+
+
+def stuck_post_processing(scenario_id, result):
+    if scenario_id == 0:
+        if hasattr(signal, 'SIGALRM'):
+            signal.signal(signal.SIGALRM, signal.SIG_IGN)
+        time.sleep(30)
+    return result
+
+
+def dying_post_processing(folder, scenario_id, result):
+    return die_once(folder, scenario_id)
+
+
+def read_time(folder, name):
+    with open(os.path.join(folder, name)) as f:
+        return float(f.read())
+
+
+class TestScenarioScheduler(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_failure_does_not_stop_other_scenarios(self):
+        errors = run_scenarios(partial(write_scenario, self.folder), range(4), nb_core=2, retries=1,
+                               max_tasks_per_child=1, errors_folder=self.folder)
+        for scenario_id in [0, 2, 3]:
+            self.assertTrue(os.path.exists(os.path.join(self.folder, str(scenario_id))))
+        self.assertEqual(list(errors), ['1'])
+        self.assertEqual(errors['1']['type'], 'ValueError')
+        self.assertEqual(errors['1']['attempts'], 2)
+        with open(os.path.join(self.folder, cst.ERRORS_FILE_NAME)) as f:
+            self.assertEqual(json.load(f)['1']['message'], 'scenario 1 always fails')
+
+    def test_retry(self):
+        errors = run_scenarios(partial(fail_once, self.folder), range(3), nb_core=2, retries=1,
+                               errors_folder=self.folder)
+        self.assertEqual(errors, {})
+
+        errors = run_scenarios(partial(fail_once, tempfile.mkdtemp(dir=self.folder)), range(3), nb_core=1,
+                               retries=0, sequential=True)
+        self.assertEqual(sorted(errors), ['0', '1', '2'])
+
+    @unittest.skipIf(not hasattr(signal, 'SIGALRM'), 'timeout needs SIGALRM')
+    def test_timeout(self):
+        start = time.perf_counter()
+        errors = run_scenarios(sleep_scenario, [0], nb_core=1, timeout=0.5)
+        self.assertLess(time.perf_counter() - start, 4)
+        self.assertEqual(errors['0']['type'], 'ScenarioTimeoutError')
+
+    def test_stuck_scenario_is_terminated(self):
+        start = time.perf_counter()
+        errors = run_scenarios(partial(stuck_scenario, self.folder), range(3), nb_core=2, timeout=0.5)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual(list(errors), ['0'])
+        self.assertEqual(errors['0']['type'], 'ScenarioTimeoutError')
+        for scenario_id in [1, 2]:
+            self.assertTrue(os.path.exists(os.path.join(self.folder, str(scenario_id))))
+
+    def test_post_processing_with_backpressure(self):
+        results = {}
+        errors = run_scenarios(partial(start_scenario, self.folder), range(6), nb_core=2,
+                               on_result=lambda name, error, result: results.update({name: result}),
+                               post_func=partial(end_scenario, self.folder), post_workers=1, max_in_flight=2)
+        self.assertEqual(errors, {})
+        self.assertEqual(results, {str(i): i * 10 + 1 for i in range(6)})
+        starts = {i: read_time(self.folder, f'start_{i}') for i in range(6)}
+        ends = {i: read_time(self.folder, f'end_{i}') for i in range(6)}
+        for start in starts.values():
+            in_flight = [i for i in range(6) if starts[i] <= start < ends[i]]
+            self.assertLessEqual(len(in_flight), 2)
+
+    def test_dead_process(self):
+        results = {}
+        errors = run_scenarios(partial(die_once, self.folder), range(3), nb_core=2, retries=1,
+                               on_result=lambda name, error, result: results.setdefault(name, []).append(error))
+        self.assertEqual(errors, {})
+        self.assertEqual(results['0'][0]['type'], 'WorkerLostError')
+        self.assertIsNone(results['0'][1])
+
+        errors = run_scenarios(partial(die_once, tempfile.mkdtemp(dir=self.folder)), range(3), nb_core=2,
+                               errors_folder=self.folder)
+        self.assertEqual(list(errors), ['0'])
+        self.assertEqual(errors['0']['type'], 'WorkerLostError')
+        with open(os.path.join(self.folder, cst.ERRORS_FILE_NAME)) as f:
+            self.assertEqual(json.load(f)['0']['attempts'], 1)
+
+    def test_post_processing_is_watched(self):
+        start = time.perf_counter()
+        results = {}
+        errors = run_scenarios(partial(start_scenario, self.folder), range(3), nb_core=2, timeout=0.5,
+                               on_result=lambda name, error, result: results.update({name: result}),
+                               post_func=stuck_post_processing, post_workers=2)
+        self.assertLess(time.perf_counter() - start, 10)
+        self.assertEqual(list(errors), ['0'])
+        self.assertEqual(errors['0']['type'], 'ScenarioTimeoutError')
+        self.assertEqual(results, {'0': None, '1': 10, '2': 20})
+
+        errors = run_scenarios(partial(start_scenario, self.folder), range(3), nb_core=2, retries=1,
+                               post_func=partial(dying_post_processing, tempfile.mkdtemp(dir=self.folder)))
+        self.assertEqual(errors, {})
@@ -0,0 +1,141 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import bz2
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.random import default_rng
+
+from chronix2grid.generation.renewable import generate_solar_wind as gsw
+from chronix2grid.generation.renewable import solar_wind_utils as swutils
+
+
+class TestSolarWindUtils(unittest.TestCase):
+    def setUp(self):
+        prng = default_rng(0)
+        start_date = pd.Timestamp('2012-01-01')
+        end_date = start_date + pd.Timedelta(weeks=2)
+        self.params = dict(Lx=1000, Ly=1000, dx_corr=250, dy_corr=250, long_wind_corr=20160,
+                           medium_wind_corr=1440, short_wind_corr=300, solar_corr=100, smoothdist=0.001,
+                           std_solar_noise=0.1, std_short_wind_noise=0.04, std_medium_wind_noise=0.3,
+                           std_long_wind_noise=0.3, scale_solar_coord_for_correlation=0.5, dt=5,
+                           start_date=start_date, end_date=end_date,
+                           T=int((end_date - start_date).total_seconds() // 60))
+        n_gens = 10
+        self.prods_charac = pd.DataFrame(dict(name=[f'gen_{i}' for i in range(n_gens)],
+                                              type=['solar', 'wind', 'wind', 'thermal', 'solar'] * 2,
+                                              x=prng.uniform(0, 1000, n_gens),
+                                              y=prng.uniform(0, 1000, n_gens),
+                                              Pmax=prng.uniform(10, 100, n_gens)))
+        self.solar_pattern = prng.uniform(0, 1, 8760)
+        self.noises, self.add_dim = gsw.compute_coarse_noises(prng, self.params, self.prods_charac)
+
+    def test_same_as_one_generator_after_the_other(self):
+        for time_slice in [None, slice(100, 2000)]:
+            vectorized = gsw.compute_prods_series(default_rng(1), self.params, self.prods_charac, self.solar_pattern,
+                                                  self.noises, self.add_dim, time_slice=time_slice)
+            by_generator = gsw.compute_prods_series(default_rng(1), self.params, self.prods_charac,
+                                                    self.solar_pattern, self.noises, self.add_dim,
+                                                    time_slice=time_slice, by_generator=True)
+            for series, expected in zip(vectorized, by_generator):
+                self.assertEqual(list(series), list(expected))
+                for name in series:
+                    np.testing.assert_array_equal(series[name], expected[name])
+
+    def test_solar_pattern_is_interpolated_once(self):
+        swutils._solar_pattern_cache.clear()
+        for scenario in range(2):
+            gsw.compute_prods_series(default_rng(scenario), self.params, self.prods_charac, self.solar_pattern,
+                                     self.noises, self.add_dim, by_generator=True)
+        self.assertEqual(swutils._solar_pattern_cache.misses, 1)
+        pattern = swutils.compute_solar_pattern(self.params, self.solar_pattern)
+        self.assertFalse(pattern.flags.writeable)
+        # another pattern is interpolated again
+        swutils.compute_solar_pattern(self.params, 2 * self.solar_pattern)
+        self.assertEqual(swutils._solar_pattern_cache.misses, 2)
+
+    def test_ensemble(self):
+        params = dict(self.params, planned_std=0.01)
+        self.prods_charac['V'] = 100.
+        solar_pattern = np.append(self.solar_pattern, 0.)
+        seeds = [1, 2, 3]
+        for sparse_noise in [0, 1]:
+            params['sparse_noise'] = sparse_noise
+            ensemble = gsw.main_ensemble([None] * 3, seeds, params, self.prods_charac, solar_pattern,
+                                         write_results=False, max_batch_bytes=2 * 4 * 8 * len(self.prods_charac) * 4100)
+            for seed, results in zip(seeds, ensemble):
+                expected = gsw.main(None, seed, params, self.prods_charac, solar_pattern, write_results=False)
+                for df, expected_df in zip(results, expected):
+                    pd.testing.assert_frame_equal(df, expected_df)
+
+    def test_by_generator(self):
+        params = dict(self.params, planned_std=0.01)
+        self.prods_charac['V'] = 100.
+        solar_pattern = np.append(self.solar_pattern, 0.)
+        expected = gsw.main(None, 1, params, self.prods_charac, solar_pattern, write_results=False)
+        params['by_generator'] = 1
+        results = gsw.main(None, 1, params, self.prods_charac, solar_pattern, write_results=False)
+        for df, expected_df in zip(results, expected):
+            pd.testing.assert_frame_equal(df, expected_df)
+        ensemble = gsw.main_ensemble([None], [1], params, self.prods_charac, solar_pattern, write_results=False)
+        for df, expected_df in zip(ensemble[0], expected):
+            pd.testing.assert_frame_equal(df, expected_df)
+
+    def test_float32(self):
+        params = dict(self.params, dtype='float32')
+        noises = {data_type: noise.astype(np.float32) for data_type, noise in self.noises.items()}
+        expected = gsw.compute_prods_matrices(default_rng(1), self.params, self.prods_charac, self.solar_pattern,
+                                              self.noises, self.add_dim)
+        results = gsw.compute_prods_matrices(default_rng(1), params, self.prods_charac, self.solar_pattern,
+                                             noises, self.add_dim)
+        for matrix, expected_matrix in zip(results[1::2], expected[1::2]):
+            self.assertEqual(matrix.dtype, np.float32)
+            # Far below the precision of the written chronics (0.1 MW)
+            np.testing.assert_allclose(matrix, expected_matrix, rtol=1e-5, atol=1e-4)
+
+    def test_stream(self):
+        params = dict(self.params, planned_std=0.01)
+        self.prods_charac['V'] = 100.
+        solar_pattern = np.append(self.solar_pattern, 0.)
+        folder = tempfile.mkdtemp()
+        try:
+            gsw.main_by_windows(os.path.join(folder, 'windows'), 1, params, self.prods_charac, solar_pattern, 'week')
+            gsw.main_by_windows(os.path.join(folder, 'stream'), 1, params, self.prods_charac, solar_pattern, 'week',
+                                stream=True)
+            for file_name in ['solar_p', 'solar_p_forecasted', 'wind_p', 'wind_p_forecasted', 'prod_p', 'prod_v']:
+                with bz2.open(os.path.join(folder, 'windows', f'{file_name}.csv.bz2'), 'rt') as f:
+                    expected = f.read()
+                with bz2.open(os.path.join(folder, 'stream', f'{file_name}.csv.bz2'), 'rt') as f:
+                    self.assertEqual(f.read(), expected)
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def test_assemble_prods(self):
+        solar_names, solar_matrix, wind_names, wind_matrix = gsw.compute_prods_matrices(
+            default_rng(1), self.params, self.prods_charac, self.solar_pattern, self.noises, self.add_dim)
+        datetime_index = pd.date_range(self.params['start_date'], self.params['end_date'], freq='5min')
+        chronics = swutils.assemble_prods(default_rng(2), solar_names, solar_matrix, wind_names, wind_matrix,
+                                          datetime_index, noise=0.01)
+
+        prng = default_rng(2)
+        for carrier, names, matrix in [('solar', solar_names, solar_matrix), ('wind', wind_names, wind_matrix)]:
+            series = dict(zip(names, matrix))
+            series['datetime'] = datetime_index
+            pd.testing.assert_frame_equal(chronics[f'{carrier}_p_forecasted'],
+                                          swutils.create_csv(prng, series, None, shift=True, write_results=False))
+            pd.testing.assert_frame_equal(chronics[f'{carrier}_p'],
+                                          swutils.create_csv(prng, series, None, noise=0.01, write_results=False))
+        # prod_p has the noise of solar_p and wind_p, with all the columns in natural order
+        prod_p = chronics['prod_p']
+        self.assertEqual(list(prod_p.columns), sorted(solar_names + wind_names, key=lambda name: int(name[4:])))
+        pd.testing.assert_frame_equal(prod_p, pd.concat([chronics['solar_p'], chronics['wind_p']], axis=1)[prod_p.columns])
@@ -0,0 +1,92 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import threading
+import time
+import tracemalloc
+import unittest
+
+from chronix2grid.stage_scheduler import StageScheduler
+
+
+class TestStageScheduler(unittest.TestCase):
+    def test_independent_stages_run_concurrently(self):
+        # L and R can only both pass the barrier if they are running at the same time
+        barrier = threading.Barrier(2, timeout=10)
+
+        def wait_other_stage(value):
+            barrier.wait()
+            return value
+
+        scheduler = StageScheduler(max_workers=2)
+        scheduler.add_stage('L', lambda results: wait_other_stage('load'))
+        scheduler.add_stage('R', lambda results: wait_other_stage('res'))
+        scheduler.add_stage('D', lambda results: (results['L'], results['R']))
+        results = scheduler.run()
+        self.assertEqual(results['D'], ('load', 'res'))
+        self.assertEqual(set(scheduler.durations), {'L', 'R', 'D'})
+
+    def test_sequential_order(self):
+        order = []
+        scheduler = StageScheduler(max_workers=1)
+        for name in ['L', 'R', 'D', 'T']:
+            scheduler.add_stage(name, lambda results, name=name: order.append(name))
+        scheduler.run()
+        self.assertEqual(order, ['L', 'R', 'D', 'T'])
+
+    def test_missing_dependencies_are_ignored(self):
+        scheduler = StageScheduler()
+        scheduler.add_stage('R', lambda results: 1)
+        scheduler.add_stage('T', lambda results: results['R'] + 1)
+        self.assertEqual(scheduler.run(), {'R': 1, 'T': 2})
+
+    def test_error_is_raised(self):
+        def failing(results):
+            raise ValueError('stage failed')
+        scheduler = StageScheduler()
+        scheduler.add_stage('L', failing)
+        scheduler.add_stage('D', lambda results: 1)
+        with self.assertRaises(ValueError):
+            scheduler.run()
+
+    def test_running_stages_are_waited_for_on_error(self):
+        finished = threading.Event()
+
+        def failing(results):
+            time.sleep(0.1)
+            raise ValueError('stage failed')
+
+        def slow(results):
+            time.sleep(0.5)
+            finished.set()
+
+        scheduler = StageScheduler(max_workers=2)
+        scheduler.add_stage('L', failing)
+        scheduler.add_stage('R', slow)
+        with self.assertRaises(ValueError):
+            scheduler.run()
+        self.assertTrue(finished.is_set())
+
+    def test_circular_dependency(self):
+        scheduler = StageScheduler()
+        scheduler.add_stage('A', lambda results: 1, depends_on=('B',))
+        scheduler.add_stage('B', lambda results: 1, depends_on=('A',))
+        with self.assertRaises(RuntimeError):
+            scheduler.run()
+
+    def test_peak_memory(self):
+        scheduler = StageScheduler(max_workers=1)
+        scheduler.add_stage('L', lambda results: len(bytearray(20 * 2 ** 20)))
+        scheduler.add_stage('R', lambda results: len(bytearray(2 ** 10)))
+        tracemalloc.start()
+        try:
+            scheduler.run()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(scheduler.peak_memory['L'], 20 * 2 ** 20)
+        self.assertLess(scheduler.peak_memory['R'], 2 ** 20)
@@ -0,0 +1,99 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.random import default_rng
+
+from chronix2grid import main
+from chronix2grid.config import SurrogateLossConfigManager
+from chronix2grid.generation.loss.SurrogateLossBackend import SurrogateLossBackend
+from chronix2grid.generation.loss.surrogate_loss_model import SurrogateLossModel
+
+
+class TestSurrogateLoss(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.case_folder = os.path.join(self.folder, 'generation', 'case')
+        os.makedirs(self.case_folder)
+        self.prods_charac = pd.DataFrame(dict(name=['gen_0', 'gen_1', 'gen_2', 'gen_3'],
+                                              type=['solar', 'wind', 'thermal', 'wind']))
+        self.prods_charac.to_csv(os.path.join(self.case_folder, 'prods_charac.csv'), index=False)
+        with open(os.path.join(self.case_folder, 'params_loss.json'), 'w') as f:
+            json.dump(dict(loss_model='loss_model.json'), f)
+        self.slack_region = ['load_0', 'gen_1']
+        prng = default_rng(0)
+        self.corpus = [self._write_simulation(prng, i) for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _loss(self, load, solar, wind, region):
+        return 1e-4 * load ** 2 + 2e-4 * (wind - 0.5 * region) ** 2 + 0.01 * solar + 5
+
+    def _chronics(self, prng, datetime_index):
+        n = len(datetime_index)
+        hour = 2 * np.pi * datetime_index.hour.to_numpy() / 24
+        load = pd.DataFrame(dict(load_0=300 + 50 * np.sin(hour) + prng.normal(0, 10, n),
+                                 load_1=500 + 80 * np.cos(hour) + prng.normal(0, 10, n)), index=datetime_index)
+        solar = pd.DataFrame(dict(gen_0=np.maximum(0, 100 * np.sin(hour)) + prng.uniform(0, 5, n)),
+                             index=datetime_index)
+        wind = pd.DataFrame(dict(gen_1=prng.uniform(0, 150, n), gen_3=prng.uniform(0, 100, n)), index=datetime_index)
+        region = wind['gen_1'] - load['load_0']
+        loss = self._loss(load.sum(axis=1), solar.sum(axis=1), wind.sum(axis=1), region)
+        return load, solar, wind, loss
+
+    def _write_simulation(self, prng, i):
+        folder = os.path.join(self.folder, f'Scenario_{i}')
+        os.makedirs(folder)
+        datetime_index = pd.date_range(f'2012-0{i + 1}-01', periods=500, freq='60min')
+        load, solar, wind, loss = self._chronics(prng, datetime_index)
+        # The thermal generator balances the load and the losses, as the slack after an AC power flow
+        thermal = load.sum(axis=1) + loss - solar.sum(axis=1) - wind.sum(axis=1)
+        prod = pd.DataFrame(dict(gen_0=solar['gen_0'], gen_1=wind['gen_1'], gen_2=thermal, gen_3=wind['gen_3']))
+        load.to_csv(os.path.join(folder, 'load_p.csv.bz2'), sep=';', index=False)
+        prod.to_csv(os.path.join(folder, 'prod_p.csv.bz2'), sep=';', index=False)
+        with open(os.path.join(folder, 'start_datetime.info'), 'w') as f:
+            f.write(datetime_index[0].strftime('%Y-%m-%d %H:%M'))
+        with open(os.path.join(folder, 'time_interval.info'), 'w') as f:
+            f.write('01:00')
+        return folder
+
+    def test_fit(self):
+        model = main.fit_loss_model_core(self.folder, 'case', self.corpus, self.slack_region, seed=1)
+        self.assertEqual(len(model.validation['scenarios']), 1)
+        # The losses are a quadratic function of the injections
+        self.assertLess(model.validation['max_error'], 1e-6)
+
+        saved = SurrogateLossModel.from_json(os.path.join(self.case_folder, 'loss_model.json'))
+        np.testing.assert_array_equal(saved.coefficients, model.coefficients)
+        self.assertEqual(saved.validation, model.validation)
+
+        with self.assertRaises(ValueError):
+            SurrogateLossModel.fit(self.corpus[:1], self.prods_charac)
+
+    def test_backend(self):
+        main.fit_loss_model_core(self.folder, 'case', self.corpus, self.slack_region, seed=1)
+        datetime_index = pd.date_range('2013-06-01', periods=100, freq='5min', name='datetime')
+        load, solar, wind, expected = self._chronics(default_rng(1), datetime_index)
+        config_manager = SurrogateLossConfigManager(name='Loss', root_directory=os.path.join(self.folder, 'generation'),
+                                                    input_directories=dict(params='case'),
+                                                    output_directory=self.folder,
+                                                    required_input_files=dict(params=['params_loss.json']))
+        scenario_folder = os.path.join(self.folder, 'output')
+        os.makedirs(scenario_folder)
+        loss = SurrogateLossBackend(self.folder, scenario_folder, load, solar, wind, dict(dt=5), config_manager).run()
+        pd.testing.assert_index_equal(loss.index, datetime_index)
+        np.testing.assert_allclose(loss.values, expected.values, atol=1e-6)
+        self.assertTrue(os.path.isfile(os.path.join(scenario_folder, 'loss.csv.bz2')))
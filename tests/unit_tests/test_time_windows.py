@@ -0,0 +1,82 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import multiprocessing
+import os
+import pathlib
+import unittest
+
+import pandas as pd
+
+import chronix2grid.generation.generation_utils as gu
+from chronix2grid.config import GeneralConfigManager, ResConfigManager
+from chronix2grid.generation.renewable import generate_solar_wind
+
+
+class TestTimeWindows(unittest.TestCase):
+    def setUp(self):
+        self.input_folder = os.path.join(
+            pathlib.Path(__file__).parent.parent.absolute(),
+            'data', 'input', 'generation')
+        self.case = 'case118_l2rpn_wcci'
+        self.seed = 12
+
+    def read_res_configuration(self, weeks):
+        general_config_manager = GeneralConfigManager(
+            name="Global Generation",
+            root_directory=self.input_folder,
+            input_directories=dict(case=self.case),
+            required_input_files=dict(case=['params.json']),
+            output_directory=self.input_folder
+        )
+        params = general_config_manager.read_configuration()
+        params.update(gu.time_parameters(weeks, '2012-01-01'))
+        params = gu.updated_time_parameters_with_timestep(params, params['dt'])
+        res_config_manager = ResConfigManager(
+            name="Renewables Generation",
+            root_directory=self.input_folder,
+            input_directories=dict(case=self.case, patterns='patterns'),
+            required_input_files=dict(case=['prods_charac.csv', 'params_res.json'],
+                                      patterns=['solar_pattern.npy']),
+            output_directory=self.input_folder
+        )
+        params_res, prods_charac = res_config_manager.read_configuration()
+        params_res.update(params)
+        return params_res, prods_charac, res_config_manager.read_specific()
+
+    def test_split_time_windows(self):
+        params = gu.updated_time_parameters_with_timestep(gu.time_parameters(6, '2012-01-01'), 5)
+        params['dt'] = 5
+        n_steps = 6 * 7 * 24 * 12 - 1
+
+        windows = gu.split_time_windows(params, 'week')
+        self.assertEqual(len(windows), 6)
+        self.assertEqual(windows[0], (0, 0, 7 * 24 * 12))
+        self.assertEqual(windows[-1][2], n_steps)
+
+        windows = gu.split_time_windows(params, 'month')
+        self.assertEqual(windows, [(0, 0, 31 * 24 * 12), (1, 31 * 24 * 12, n_steps)])
+
+        with self.assertRaises(ValueError):
+            gu.split_time_windows(params, 'day')
+
+    def test_windows_do_not_depend_on_pool(self):
+        params, prods_charac, solar_pattern = self.read_res_configuration(weeks=2)
+        sequential = generate_solar_wind.main_by_windows(None, self.seed, params, prods_charac, solar_pattern,
+                                                         'week', pool=None, write_results=False)
+        with multiprocessing.Pool(2) as pool:
+            parallel = generate_solar_wind.main_by_windows(None, self.seed, params, prods_charac, solar_pattern,
+                                                           'week', pool=pool, write_results=False)
+        for df_sequential, df_parallel in zip(sequential, parallel):
+            pd.testing.assert_frame_equal(df_sequential, df_parallel)
+
+        # Forecasted solar chronics have no random part apart from the global noise: windows must be continuous
+        _, prod_solar_forecasted, _, _ = generate_solar_wind.main(None, self.seed, params, prods_charac,
+                                                                  solar_pattern, write_results=False)
+        self.assertEqual(len(sequential[0]), len(prod_solar_forecasted))
+        pd.testing.assert_frame_equal(sequential[1], prod_solar_forecasted, check_freq=False)
@@ -0,0 +1,64 @@
+# Copyright (c) 2019-2022, RTE (https://www.rte-france.com)
+# See AUTHORS.txt
+# This Source Code Form is subject to the terms of the Mozilla Public License, version 2.0.
+# If a copy of the Mozilla Public License, version 2.0 was not distributed with this file,
+# you can obtain one at http://mozilla.org/MPL/2.0/.
+# SPDX-License-Identifier: MPL-2.0
+# This file is part of Chronix2Grid, A python package to generate "en-masse" chronics for loads and productions (thermal, renewable)
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from chronix2grid import tracing
+
+
+@tracing.traced('square')
+def square(x):
+    return x * x
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        tracing.pop_spans()
+
+    def tearDown(self):
+        tracing.enable(False)
+        tracing.set_context()
+        tracing.pop_spans()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_disabled(self):
+        tracing.enable(False)
+        with tracing.span('nothing'):
+            pass
+        self.assertEqual(square(3), 9)
+        self.assertEqual(tracing.pop_spans(), [])
+
+    def test_spans(self):
+        tracing.enable()
+        tracing.set_context(scenario_id=2)
+        with tracing.span('outer', window=1):
+            self.assertEqual(square(3), 9)
+        spans = tracing.pop_spans()
+        self.assertEqual([record['name'] for record in spans], ['square', 'outer'])
+        self.assertEqual(spans[1]['args'], dict(scenario_id=2, window=1))
+        self.assertEqual(spans[0]['pid'], os.getpid())
+        self.assertGreaterEqual(spans[1]['duration'], spans[0]['duration'])
+        self.assertEqual(tracing.pop_spans(), [])
+
+    def test_chrome_trace(self):
+        tracing.enable()
+        with tracing.span('outer'):
+            square(2)
+        path = os.path.join(self.folder, 'trace.json')
+        tracing.write_chrome_trace(path, tracing.pop_spans())
+        with open(path) as f:
+            events = json.load(f)['traceEvents']
+        self.assertEqual([event['name'] for event in events], ['outer', 'square'])
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
+        self.assertLessEqual(events[0]['ts'], events[1]['ts'])
+        self.assertLessEqual(events[1]['ts'] + events[1]['dur'], events[0]['ts'] + events[0]['dur'] + 1)
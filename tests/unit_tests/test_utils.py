@@ -9,6 +9,7 @@ import pathlib
 from chronix2grid.main import create_directory_tree
 import chronix2grid.constants as cst
 import chronix2grid.generation.generation_utils as gu
+from chronix2grid.utils import accepts_keyword
 
 
 class TestUtils(unittest.TestCase):
@@ -39,3 +40,70 @@ class TestUtils(unittest.TestCase):
                 'start_date2', scenario_name
             )
             self.assertTrue(os.path.isdir(path_to_check))
+
+    def test_interpolate_noise_batch(self):
+        prng = np.random.default_rng(0)
+        params = dict(Lx=1000, Ly=1000, T=60 * 24 * 28, dx_corr=250, dy_corr=250, dt=5)
+        x = prng.uniform(0, 1000, 20)
+        y = prng.uniform(0, 1000, 20)
+        # cubic, quadratic and linear temporal interpolations
+        for time_scale, add_dim in [(60 * 24, 2), (60 * 24 * 14, 0), (60 * 24 * 28, 0)]:
+            n_comp = int(params['T'] // time_scale + 1) + add_dim
+            noise = prng.normal(size=(5 + add_dim, 5 + add_dim, n_comp))
+            batch = gu.interpolate_noise_batch(noise, params, (x, y), time_scale, add_dim,
+                                               time_slice=slice(10, 500))
+            for i in range(len(x)):
+                np.testing.assert_array_equal(
+                    batch[i], gu.interpolate_noise(noise, params, [x[i], y[i]], time_scale, add_dim,
+                                                   time_slice=slice(10, 500)))
+
+    def test_sparse_coarse_noise(self):
+        params = dict(Lx=1000, Ly=1000, T=60 * 24 * 7, dx_corr=250, dy_corr=250, dt=5, solar_corr=60)
+        x = np.array([10., 600., 980.])
+        y = np.array([300., 20., 990.])
+        noise = gu.generate_sparse_coarse_noise(1, params, 'solar', (x, y))
+        self.assertEqual(len(noise.cells), 12)
+        self.assertEqual(noise.shape[-1], 60 * 24 * 7 // 60 + 1)
+
+        # The noise of a cell does not depend on the other locations
+        other = gu.generate_sparse_coarse_noise(1, params, 'solar', (x[:1], y[:1]))
+        np.testing.assert_array_equal(other[0, 1, :], noise[0, 1, :])
+
+        # Interpolation gives the same as with a dense noise holding the same cells
+        dense = np.zeros(noise.shape)
+        for x_cell, y_cell in noise.cells:
+            dense[x_cell, y_cell, :] = noise[x_cell, y_cell, :]
+        np.testing.assert_array_equal(gu.interpolate_noise_batch(noise, params, (x, y), 60, add_dim=0),
+                                      gu.interpolate_noise_batch(dense, params, (x, y), 60, add_dim=0))
+        np.testing.assert_array_equal(gu.interpolate_noise(noise, params, [x[1], y[1]], 60, add_dim=0),
+                                      gu.interpolate_noise(dense, params, [x[1], y[1]], 60, add_dim=0))
+
+    def test_stacked_noises(self):
+        params = dict(Lx=1000, Ly=1000, T=60 * 24 * 7, dx_corr=250, dy_corr=250, dt=5)
+        prng = np.random.default_rng(0)
+        x, y = prng.uniform(0, 1000, 5), prng.uniform(0, 1000, 5)
+        # cubic and linear temporal interpolations of the noises of 3 scenarios
+        for time_scale, add_dim in [(60, 1), (60 * 24 * 7, 0)]:
+            n_comp = int(params['T'] // time_scale + 1) + add_dim
+            noises = [prng.normal(size=(5 + add_dim, 5 + add_dim, n_comp)) for _ in range(3)]
+            stacked = gu.interpolate_noise_batch(gu.stack_noises(noises), params, (x, y), time_scale, add_dim)
+            self.assertEqual(stacked.shape[0], 3)
+            for noise, expected in zip(noises, stacked):
+                np.testing.assert_array_equal(gu.interpolate_noise_batch(noise, params, (x, y), time_scale, add_dim),
+                                              expected)
+
+        self.assertEqual(gu.ensemble_batch_size(100, 10, 4 * 100 * 10 * 8 * 2.5), 2)
+        self.assertEqual(gu.ensemble_batch_size(100, 10, 1), 1)
+
+    def test_accepts_keyword(self):
+        class LegacyBackend:
+            def __init__(self, dispatcher, params):
+                pass
+
+        class Backend(LegacyBackend):
+            def __init__(self, dispatcher, params, pool=None):
+                pass
+
+        self.assertFalse(accepts_keyword(LegacyBackend, 'pool'))
+        self.assertTrue(accepts_keyword(Backend, 'pool'))
+        self.assertTrue(accepts_keyword(lambda load, **kwargs: None, 'pool'))